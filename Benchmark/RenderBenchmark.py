@@ -0,0 +1,173 @@
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import contextlib
+import multiprocessing
+import numpy as np
+from Models.Vector3D import Vector3D
+from Models.Camera import Camera
+from Models.Screen import Screen
+from Models.Scene import Scene
+from Service.Parser import parse_file
+from Service.RayCaster import RayCaster
+from Handler.ScreenHandler import ScreenHandler
+from Service.SceneBuilder import add_lights, add_objects
+from main import render_batch, render_pixels
+
+# Render benchmark over the bundled scenes.
+# run from the repository root:
+#     python -m Benchmark.RenderBenchmark [--sizes 100 200 400] [--mode batch] [--output results.json]
+#     python -m Benchmark.RenderBenchmark --baseline baseline.json --max-regression 10
+# every scene is rendered at every size through the same steps as main.py
+# (parse_file, add_lights / add_objects, render_batch or render_pixels, save_image),
+# each case in a fresh process so the peak RSS belongs to that case only
+# the results go to a JSON file, and with --baseline the render times are compared
+# with an older run: the exit code is 1 when a case got slower than --max-regression percent
+
+SCENES = [f"scene{k}.txt" for k in range(1, 9)]
+DEFAULT_SIZES = [100, 200, 400]
+DEFAULT_REPEAT = 3
+DEFAULT_MAX_REGRESSION = 10.0   # percent
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def run_case(fn, size, mode, repeat):
+    # render one scene at one size, returns the measurements as a dict
+    # size is the width, the height keeps the proportions of the scene's own resolution
+    # the renderer prints progress, it is swallowed here to keep the table readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        data = parse_file(fn)
+        parse_time = time.perf_counter() - start
+        scene_width, scene_height = data['resolution']
+        width, height = size, max(1, round(size * scene_height / scene_width))
+        start = time.perf_counter()
+        screen = Screen(data['camera_pos'], data['view_dir'], data['up_vec'], data['fov'], data['aspect'], width, height)
+        camera = Camera(data['camera_pos'], data['view_dir'], data['up_vec'], data['fov'], data['aspect'])
+        handler = ScreenHandler(screen, width, height)
+        scene = Scene()
+        # the same default background as main.py
+        scene.background_color = data.get('background') or Vector3D(0.1, 0.1, 0.2)
+        add_lights(scene, data)
+        add_objects(scene, data)
+        scene.prepare()
+        caster = RayCaster(camera, screen, scene)
+        setup_time = time.perf_counter() - start
+        # the fastest of `repeat` renders, the ray counts are the same every time
+        render_time = float('inf')
+        for _ in range(repeat):
+            caster.reset_ray_counts()
+            start = time.perf_counter()
+            if mode == 'batch':
+                render_batch(caster, screen, width, height)
+            else:
+                render_pixels(caster, screen, width, height)
+            render_time = min(render_time, time.perf_counter() - start)
+        with tempfile.TemporaryDirectory() as folder:
+            start = time.perf_counter()
+            handler.save_image(os.path.join(folder, 'render.png'))
+            save_time = time.perf_counter() - start
+    rays = caster.primary_rays + caster.shadow_rays + caster.secondary_rays
+    return {
+        'scene': os.path.basename(fn),
+        'width': width,
+        'height': height,
+        'mode': mode,
+        'primary_rays': caster.primary_rays,
+        'shadow_rays': caster.shadow_rays,
+        'secondary_rays': caster.secondary_rays,
+        'rays_per_sec': rays / render_time,
+        'parse_time': parse_time,
+        'setup_time': setup_time,
+        'render_time': render_time,
+        'save_time': save_time,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+def case_key(result):
+    return f"{result['scene']}@{result['width']}x{result['height']}/{result['mode']}"
+
+def run_benchmark(scenes, sizes, mode, repeat):
+    # every case in its own fresh process (spawn, not fork), so that the peak RSS
+    # and the caches do not carry over from one case to the next
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    print(f"{'case':<30} {'primary':>9} {'shadow':>9} {'rays/s':>11} {'parse':>8} {'render':>9} {'save':>8} {'RSS MB':>8}")
+    for fn in scenes:
+        for size in sizes:
+            with context.Pool(1) as pool:
+                result = pool.apply(run_case, (fn, size, mode, repeat))
+            key = case_key(result)
+            results[key] = result
+            print(f"{key:<30} {result['primary_rays']:>9} {result['shadow_rays']:>9} {result['rays_per_sec']:>11.0f} "
+                  f"{result['parse_time'] * 1e3:>6.1f}ms {result['render_time'] * 1e3:>7.1f}ms "
+                  f"{result['save_time'] * 1e3:>6.1f}ms {result['peak_rss_mb']:>8.1f}")
+    return results
+
+def compare(results, baseline, max_regression):
+    # compare the render times with the baseline run, returns the keys of the
+    # cases that got slower by more than max_regression percent
+    regressions = []
+    print(f"\n{'case':<30} {'baseline':>10} {'now':>10} {'change':>8}")
+    for key, result in results.items():
+        if key not in baseline:
+            print(f"{key:<30} {'-':>10} {result['render_time'] * 1e3:>8.1f}ms {'new':>8}")
+            continue
+        before = baseline[key]['render_time']
+        change = (result['render_time'] - before) / before * 100
+        flag = ''
+        if change > max_regression:
+            regressions.append(key)
+            flag = '  REGRESSION'
+        print(f"{key:<30} {before * 1e3:>8.1f}ms {result['render_time'] * 1e3:>8.1f}ms {change:>+7.1f}%{flag}")
+    return regressions
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Render benchmark over the bundled scenes")
+    parser.add_argument('--scenes', nargs='+', default=SCENES, help="scene files (default: scene1.txt ... scene8.txt)")
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES,
+                        help=f"image widths to render at (default: {' '.join(map(str, DEFAULT_SIZES))})")
+    parser.add_argument('--mode', choices=['batch', 'pixels'], default='batch',
+                        help="render path, the same as main.py with or without --batch (default: batch)")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help=f"renders per case, the fastest one counts (default: {DEFAULT_REPEAT})")
+    parser.add_argument('--output', default='benchmark_results.json', help="where to write the results")
+    parser.add_argument('--baseline', help="results of an older run to compare with")
+    parser.add_argument('--max-regression', type=float, default=DEFAULT_MAX_REGRESSION,
+                        help=f"fail when a render is slower than the baseline by more than this percentage "
+                             f"(default: {DEFAULT_MAX_REGRESSION})")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args(sys.argv[1:])
+    results = run_benchmark(args.scenes, args.sizes, args.mode, args.repeat)
+    report = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved as: {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) slower than the baseline by more than {args.max_regression}%")
+            sys.exit(1)
+        print(f"\nNo render is slower than the baseline by more than {args.max_regression}%")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import sys
+import time
+import timeit
+import Models.Vector3D as vector_module
+from Models.Vector3D import Vector3D
+from Models.Camera import Camera
+from Models.Screen import Screen
+from Models.Scene import Scene
+from Service.Parser import parse_file
+from Service.RayCaster import RayCaster
+from Service.SceneBuilder import add_lights, add_objects
+
+# Microbenchmark for the Vector3D hot path.
+# run from the repository root:
+#     python -m Benchmark.VectorBenchmark [scene.txt] [pixels]
+# it prints the cost of the allocating and the fused / in-place forms of the
+# common operations, and how many Vector3D objects one shaded pixel creates
+
+OPERATIONS = [
+    # (name, allocating form, fused or in-place form)
+    ("point on ray",    "o.add(d.scalar_multiply(t))",              "o.add_scaled(d, t)"),
+    ("light * color",   "i.hadamard(c).scalar_multiply(t)",         "i.hadamard_scaled(c, t)"),
+    ("accumulate",      "acc = acc.add(c)",                         "acc.iadd(c)"),
+    ("scale",           "acc = acc.scalar_multiply(1.0)",           "acc.imul_scalar(1.0)"),
+    ("unit direction",  "c.subtract(o).normalize()",                "o.direction_to(c)"),
+]
+
+SETUP = """
+from Models.Vector3D import Vector3D
+o = Vector3D(0.1, 0.2, 0.3)
+d = Vector3D(0.0, 0.6, 0.8)
+i = Vector3D(0.9, 0.8, 0.7)
+c = Vector3D(0.2, 0.4, 0.6)
+acc = Vector3D(0.0, 0.0, 0.0)
+t = 1.5
+"""
+
+def time_operations(number=200000):
+    # nanoseconds per call of each form
+    print(f"{'operation':<16} {'allocating':>12} {'fused':>12}")
+    for name, slow, fast in OPERATIONS:
+        slow_ns = min(timeit.repeat(slow, SETUP, number=number, repeat=3)) / number * 1e9
+        fast_ns = min(timeit.repeat(fast, SETUP, number=number, repeat=3)) / number * 1e9
+        print(f"{name:<16} {slow_ns:>10.0f}ns {fast_ns:>10.0f}ns")
+
+def count_allocations(caster, pixels):
+    # count the Vector3D objects created while shading `pixels` pixels,
+    # both through the public constructor and through the fast constructor
+    counter = [0]
+    original_init = Vector3D.__init__
+    original_new = vector_module._new
+
+    def counting_init(self, x, y, z):
+        counter[0] += 1
+        original_init(self, x, y, z)
+
+    def counting_new(cls):
+        counter[0] += 1
+        return original_new(cls)
+
+    Vector3D.__init__ = counting_init
+    vector_module._new = counting_new
+    try:
+        width = caster.screen.width
+        bins = caster.get_bins()
+        for k in range(pixels):
+            i, j = k % width, k // width
+            caster.shade(caster.generate_ray(i, j), depth=0, objects=bins.objects(i, j))
+    finally:
+        Vector3D.__init__ = original_init
+        vector_module._new = original_new
+    return counter[0] / pixels
+
+def build_caster(fn, width, height):
+    data = parse_file(fn)
+    screen = Screen(data['camera_pos'], data['view_dir'], data['up_vec'], data['fov'], data['aspect'], width, height)
+    camera = Camera(data['camera_pos'], data['view_dir'], data['up_vec'], data['fov'], data['aspect'])
+    scene = Scene()
+    scene.background_color = data.get('background') or Vector3D(0.1, 0.1, 0.2)
+    # the same scene setup as main.py
+    add_lights(scene, data)
+    add_objects(scene, data)
+    return RayCaster(camera, screen, scene)
+
+def main():
+    fn = sys.argv[1] if len(sys.argv) > 1 else 'scene1.txt'
+    pixels = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    time_operations()
+    caster = build_caster(fn, 100, 100)
+    print(f"\n{fn}: {count_allocations(caster, pixels):.1f} Vector3D objects per shaded pixel")
+    start = time.perf_counter()
+    width = caster.screen.width
+    bins = caster.get_bins()
+    for k in range(pixels):
+        i, j = k % width, k // width
+        caster.shade(caster.generate_ray(i, j), depth=0, objects=bins.objects(i, j))
+    print(f"{fn}: {(time.perf_counter() - start) / pixels * 1e6:.1f}us per shaded pixel")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import json
+import logging
+from urllib.parse import urlparse, parse_qsl
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from Service.Parser import SceneError
+from Service.RenderService import job_settings
+
+logger = logging.getLogger(__name__)
+
+MAX_SCENE_BYTES = 16 << 20  # largest scene text a job can send
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    # RenderRequestHandler is the HTTP side of the render server
+    # so what can be asked ?
+    #   POST /render?width=160&samples=4   the body is the scene text (the same as a scene file),
+    #                                      specular=1 adds the highlights
+    #                                      the answer is the PNG, with the job timings in X- headers
+    #   GET  /status                       the queue depth, the job counts and the recent timings as JSON
+    # every request runs on its own thread (ThreadingHTTPServer), a render request waits
+    # there while its job is in the service's queue or on a worker
+    # the service is the RenderService of the server, set by serve()
+    service = None
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/status':
+            self.send_json(200, self.service.status())
+        else:
+            self.send_json(404, {'error': f"unknown path {self.path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/render':
+            self.send_json(404, {'error': f"unknown path {self.path}"})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if not 0 < length <= MAX_SCENE_BYTES:
+            self.send_json(400, {'error': f"the body must be a scene text of at most {MAX_SCENE_BYTES} bytes"})
+            return
+        try:
+            text = self.rfile.read(length).decode('utf-8')
+            settings = job_settings(dict(parse_qsl(url.query)))
+        except (UnicodeDecodeError, ValueError) as error:
+            self.send_json(400, {'error': str(error)})
+            return
+        try:
+            job = self.service.render(text, settings)
+        except SceneError as error:
+            # a broken scene text (with the line number) or values the scene cannot be built from,
+            # any other error is a bug of the renderer and goes to the 500 below with its traceback
+            self.send_json(400, {'error': f"bad scene: {error}"})
+            return
+        except Exception as error:
+            logger.exception("Render job failed")
+            self.send_json(500, {'error': str(error)})
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(job['png'])))
+        self.send_header('X-Job-Id', str(job['id']))
+        self.send_header('X-Image-Size', f"{job['width']}x{job['height']}")
+        self.send_header('X-Scene-Cached', 'yes' if job['scene_cached'] else 'no')
+        for name in ('queue_time', 'setup_time', 'render_time', 'encode_time', 'total_time'):
+            self.send_header('X-' + name.replace('_', '-').title(), f"{job[name] * 1e3:.1f}ms")
+        self.end_headers()
+        self.wfile.write(job['png'])
+
+    def send_json(self, code, data):
+        body = json.dumps(data, indent=2).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # the request log goes through logging like the rest of the program, not to stderr
+        logger.info("%s %s", self.address_string(), format % args)
+
+def serve(service, host, port):
+    # answer requests on (host, port) until Ctrl-C
+    RenderRequestHandler.service = service
+    server = ThreadingHTTPServer((host, port), RenderRequestHandler)
+    print(f"Render server on http://{host}:{server.server_port} with {service.workers} workers "
+          f"(POST /render, GET /status)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
@@ -1,4 +1,7 @@
+import io
+import os
 import math 
+import time
 import numpy as np
 import Models.Screen as Screen
 import Models.Pixel as Pixel
@@ -14,6 +17,8 @@ class ScreenHandler:
         self.screen = screen
         self.width = width
         self.height = height
+        # the Profiler of main.py --profile, save_image adds its time to the 'save' phase
+        self.profiler = None
 
     def print_Screen(self):
         # Print information about each pixel in the screen
@@ -82,18 +87,78 @@ class ScreenHandler:
         
     def save_image(self, filename="output.png"):
         # in use for saving the screen as an image file
-        img = Image.new('RGB', (self.width, self.height))
-        pixels = []
-        
-        for y in range(self.height):
-            for x in range(self.width):
-                color = self.screen.get_pixel(x, y).get_color()
-                r = int(max(0, min(255, color.x * 255)))
-                g = int(max(0, min(255, color.y * 255)))
-                b = int(max(0, min(255, color.z * 255)))
-                pixels.append((r, g, b))
-        
-        img.putdata(pixels)
-        img.save(filename)
+        start = time.perf_counter()
+        save_colors(self.screen.buffer, filename)
+        if self.profiler is not None:
+            self.profiler.add_time('save', time.perf_counter() - start)
+
+    def save_float(self, filename):
+        # save the screen as a float image (.pfm or .npy), without the 8-bit clamp
+        # when the screen already renders into a memory map of filename, the pixels
+        # are in the file and only have to be flushed to disk
+        start = time.perf_counter()
+        buffer = self.screen.buffer
+        if is_float_buffer_of(buffer, filename):
+            float_buffer_base(buffer).flush()
+        else:
+            save_float_colors(buffer, filename)
+        if self.profiler is not None:
+            self.profiler.add_time('save', time.perf_counter() - start)
+
+def save_colors(colors, filename):
+    # save an (height, width, 3) array of colors in [0, 1] as an image file
+    # the colors are converted to 8-bit in one numpy operation and
+    # handed to Pillow directly, the values are clamped to [0, 255] and
+    # truncated like int(max(0, min(255, c * 255))) for every component
+    data = np.clip(colors * 255, 0, 255).astype(np.uint8)
+    img = Image.fromarray(data)
+    img.save(filename)
+
+def png_bytes(colors):
+    # the same 8-bit image as save_colors, as the bytes of a PNG file instead of a file
+    data = np.clip(colors * 255, 0, 255).astype(np.uint8)
+    with io.BytesIO() as f:
+        Image.fromarray(data).save(f, format='PNG')
+        return f.getvalue()
+
+FLOAT_FORMATS = ('.pfm', '.npy')
+
+def open_float_buffer(filename, width, height):
+    # a (height, width, 3) float32 array that is a memory map of a new .pfm or .npy file
+    # so why a memory map ?
+    # the pixels live in the file (through the page cache), not in a second array in RAM,
+    # and whatever is written to the array is in the file even if the render crashes later,
+    # so the tiles that finished are kept
+    # the array is in image order (row 0 at the top) for both formats:
+    # PFM stores the rows from the bottom up, so its map is returned upside down as a view
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.npy':
+        return np.lib.format.open_memmap(filename, mode='w+', dtype=np.float32, shape=(height, width, 3))
+    if ext == '.pfm':
+        # PF is a color image, the negative scale means little-endian floats
+        header = f"PF\n{width} {height}\n-1.0\n".encode('ascii')
+        with open(filename, 'wb') as f:
+            f.write(header)
+            f.truncate(len(header) + width * height * 3 * 4)
+        data = np.memmap(filename, dtype='<f4', mode='r+', offset=len(header), shape=(height, width, 3))
+        return data[::-1]
+    raise ValueError(f"Float output must be one of {', '.join(FLOAT_FORMATS)}, not {filename}")
+
+def float_buffer_base(buffer):
+    # the np.memmap behind a buffer of open_float_buffer (the PFM one is a view), or None
+    while buffer is not None and not isinstance(buffer, np.memmap):
+        buffer = buffer.base
+    return buffer
+
+def is_float_buffer_of(buffer, filename):
+    base = float_buffer_base(buffer)
+    return (base is not None and base.filename is not None and os.path.exists(filename)
+            and os.path.samefile(base.filename, filename))
 
-    
\ No newline at end of file
+def save_float_colors(colors, filename):
+    # save an (height, width, 3) array of colors as a .pfm or .npy file, the values are
+    # kept as they are (float32, nothing clamped), ready for compositing
+    height, width = colors.shape[:2]
+    data = open_float_buffer(filename, width, height)
+    data[...] = colors
+    float_buffer_base(data).flush()
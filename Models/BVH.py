@@ -0,0 +1,327 @@
+import time
+import numpy as np
+
+LEAF_SIZE =         4       # Maximum number of objects in a leaf
+SAH_BINS =          16      # Number of candidate split planes per axis for the SAH build
+TRAVERSAL_COST =    1.0     # SAH cost of visiting a node, relative to one intersection test
+INTERSECT_COST =    1.0     # SAH cost of one ray-object intersection test
+RAY_EPSILON =       1e-30   # Direction components below this are treated as parallel to a slab
+
+def _surface_area(lo, hi):
+    # surface area of an axis aligned box, the SAH weights children by it
+    e = np.maximum(hi - lo, 0.0)
+    return 2.0 * (e[0] * e[1] + e[1] * e[2] + e[2] * e[0])
+
+def _inverse_direction(direction):
+    # 1 / d per component, with a huge value instead of a division by zero
+    return tuple(1.0 / c if abs(c) > RAY_EPSILON else (1e30 if c >= 0 else -1e30) for c in direction)
+
+class BVH:
+    # a bounding volume hierarchy over the finite objects of the scene (spheres)
+    # the tree is stored flat: node k has a box [lo[k], hi[k]] and is either
+    # an inner node with children left[k], right[k] or a leaf with the objects
+    # prims[start[k]:start[k] + count[k]]
+    # the objects are referred to by their index in scene.objects, so the hit
+    # that wins a tie is the same one the linear loop would pick (the first one)
+    # infinite planes and inverted background spheres have no bounds and
+    # stay outside the tree, the scene tests them linearly
+    def __init__(self, objects, indices, method='sah', leaf_size=LEAF_SIZE):
+        if method not in ('sah', 'median'):
+            raise ValueError(f"Unknown BVH build method: {method}")
+        start_time = time.perf_counter()
+        self.objects = objects
+        self.method = method
+        self.leaf_size = leaf_size
+        indices = np.asarray(indices, dtype=np.int64)
+        centers = np.array([[objects[i].center.x, objects[i].center.y, objects[i].center.z] for i in indices]).reshape(-1, 3)
+        radii = np.array([objects[i].abs_radius for i in indices])
+        self.prim_lo = centers - radii[:, None]
+        self.prim_hi = centers + radii[:, None]
+        self.centroids = centers
+        self.lo, self.hi, self.left, self.right, self.start, self.count, self.axis = [], [], [], [], [], [], []
+        order = []
+        self.depth = self._build(np.arange(len(indices)), order, 1) if len(indices) else 0
+        # prims holds scene.objects indices in leaf order
+        self.prims = indices[np.array(order, dtype=np.int64)] if order else indices
+        self.lo = np.array(self.lo).reshape(-1, 3)
+        self.hi = np.array(self.hi).reshape(-1, 3)
+        self.left = np.array(self.left, dtype=np.int64)
+        self.right = np.array(self.right, dtype=np.int64)
+        self.start = np.array(self.start, dtype=np.int64)
+        self.count = np.array(self.count, dtype=np.int64)
+        self.axis = np.array(self.axis, dtype=np.int64)
+        # plain python copies for the scalar traversal, indexing lists is much
+        # faster than indexing numpy arrays one element at a time
+        self._nodes = [(tuple(self.lo[k]), tuple(self.hi[k]), int(self.left[k]), int(self.right[k]),
+                        int(self.start[k]), int(self.count[k]), int(self.axis[k])) for k in range(len(self.left))]
+        self._prims = [int(i) for i in self.prims]
+        self.build_time = time.perf_counter() - start_time
+        self.reset_stats()
+
+    def _new_node(self, lo, hi):
+        self.lo.append(lo)
+        self.hi.append(hi)
+        self.left.append(-1)
+        self.right.append(-1)
+        self.start.append(0)
+        self.count.append(0)
+        self.axis.append(0)
+        return len(self.left) - 1
+
+    def _build(self, items, order, depth):
+        # build the subtree over items (positions in the primitive arrays)
+        # and return its depth, the node is appended before its children
+        lo = self.prim_lo[items].min(axis=0)
+        hi = self.prim_hi[items].max(axis=0)
+        node = self._new_node(lo, hi)
+        split = None
+        if len(items) > self.leaf_size:
+            split = self._split(items, lo, hi)
+        if split is None:
+            self.start[node] = len(order)
+            self.count[node] = len(items)
+            order.extend(int(i) for i in items)
+            return depth
+        left_items, right_items, self.axis[node] = split
+        self.left[node] = len(self.left)
+        left_depth = self._build(left_items, order, depth + 1)
+        self.right[node] = len(self.left)
+        right_depth = self._build(right_items, order, depth + 1)
+        return max(left_depth, right_depth)
+
+    def _split(self, items, lo, hi):
+        # choose how to split items in two, or None to make a leaf
+        # returns (left_items, right_items, axis)
+        c = self.centroids[items]
+        c_lo, c_hi = c.min(axis=0), c.max(axis=0)
+        axis = int(np.argmax(c_hi - c_lo))
+        extent = c_hi[axis] - c_lo[axis]
+        if extent <= 0:
+            # every centroid in the same place, no split can separate them
+            # split in the middle of the list so the leaves stay small
+            half = len(items) // 2
+            return items[:half], items[half:], axis
+        if self.method == 'median':
+            ordered = items[np.argsort(c[:, axis], kind='stable')]
+            half = len(items) // 2
+            return ordered[:half], ordered[half:], axis
+        # binned surface area heuristic: put the centroids in SAH_BINS buckets
+        # along the axis and try a split between every pair of buckets
+        bins = np.minimum(((c[:, axis] - c_lo[axis]) / extent * SAH_BINS).astype(np.int64), SAH_BINS - 1)
+        # per bin: number of objects and the box around them
+        counts = np.bincount(bins, minlength=SAH_BINS)
+        bin_lo = np.full((SAH_BINS, 3), np.inf)
+        bin_hi = np.full((SAH_BINS, 3), -np.inf)
+        np.minimum.at(bin_lo, bins, self.prim_lo[items])
+        np.maximum.at(bin_hi, bins, self.prim_hi[items])
+        # sweep from both ends to get the area left and right of every split
+        left_lo, left_hi = np.minimum.accumulate(bin_lo), np.maximum.accumulate(bin_hi)
+        right_lo, right_hi = np.minimum.accumulate(bin_lo[::-1])[::-1], np.maximum.accumulate(bin_hi[::-1])[::-1]
+        left_count = np.cumsum(counts)
+        parent_area = max(_surface_area(lo, hi), 1e-300)
+        best_cost, best_bin = float('inf'), None
+        for b in range(1, SAH_BINS):
+            n_left = int(left_count[b - 1])
+            if n_left == 0 or n_left == len(items):
+                continue
+            left_area = _surface_area(left_lo[b - 1], left_hi[b - 1])
+            right_area = _surface_area(right_lo[b], right_hi[b])
+            cost = TRAVERSAL_COST + INTERSECT_COST * (left_area * n_left + right_area * (len(items) - n_left)) / parent_area
+            if cost < best_cost:
+                best_cost, best_bin = cost, b
+        if best_bin is None:
+            ordered = items[np.argsort(c[:, axis], kind='stable')]
+            half = len(items) // 2
+            return ordered[:half], ordered[half:], axis
+        left_mask = bins < best_bin
+        return items[left_mask], items[~left_mask], axis
+
+    def reset_stats(self):
+        # traversal counters, accumulated over every query since the last reset
+        self.rays = 0
+        self.nodes_visited = 0
+        self.primitive_tests = 0
+
+    def stats(self):
+        # build and traversal statistics as a dict
+        leaves = int((self.left < 0).sum())
+        return {
+            'method':           self.method,
+            'primitives':       len(self.prims),
+            'nodes':            len(self.left),
+            'leaves':           leaves,
+            'depth':            self.depth,
+            'max_leaf_size':    int(self.count.max()) if len(self.count) else 0,
+            'build_time':       self.build_time,
+            'rays':             self.rays,
+            'nodes_visited':    self.nodes_visited,
+            'primitive_tests':  self.primitive_tests,
+            'nodes_per_ray':    self.nodes_visited / self.rays if self.rays else 0.0,
+            'tests_per_ray':    self.primitive_tests / self.rays if self.rays else 0.0,
+        }
+
+    def _box_hits(self, box, ox, oy, oz, ix, iy, iz):
+        # slab test of a ray against a node box, returns (tmin, tmax)
+        lo, hi = box[0], box[1]
+        t0, t1 = (lo[0] - ox) * ix, (hi[0] - ox) * ix
+        tmin, tmax = (t0, t1) if t0 < t1 else (t1, t0)
+        t0, t1 = (lo[1] - oy) * iy, (hi[1] - oy) * iy
+        if t0 > t1:
+            t0, t1 = t1, t0
+        tmin, tmax = max(tmin, t0), min(tmax, t1)
+        t0, t1 = (lo[2] - oz) * iz, (hi[2] - oz) * iz
+        if t0 > t1:
+            t0, t1 = t1, t0
+        return max(tmin, t0), min(tmax, t1)
+
+    def intersect(self, ray, t_max=float('inf')):
+        # nearest hit of the ray with the objects in the tree, not farther than t_max
+        # returns (index, t, hit_point, normal), index is -1 when nothing is hit
+        ox, oy, oz = ray.origin.x, ray.origin.y, ray.origin.z
+        d = (ray.direction.x, ray.direction.y, ray.direction.z)
+        ix, iy, iz = _inverse_direction(d)
+        nodes, prims, objects = self._nodes, self._prims, self.objects
+        best_index, best_t, best_point, best_normal = -1, t_max, None, None
+        visited = tests = 0
+        stack = [0] if nodes else []
+        while stack:
+            node = nodes[stack.pop()]
+            visited += 1
+            tmin, tmax = self._box_hits(node, ox, oy, oz, ix, iy, iz)
+            if tmax < tmin or tmax < 0 or tmin > best_t:
+                continue
+            left, right, start, count, axis = node[2:]
+            if left < 0:
+                for k in range(start, start + count):
+                    index = prims[k]
+                    tests += 1
+                    hit, t, point, normal = objects[index].intersect(ray)
+                    # on equal t the lower index wins, like the linear loop
+                    if hit and (t < best_t or (t == best_t and index < best_index)):
+                        best_index, best_t, best_point, best_normal = index, t, point, normal
+            elif d[axis] < 0:
+                # visit the nearer child first so best_t shrinks early,
+                # the left child holds the smaller centroids along the split axis
+                stack.append(left)
+                stack.append(right)
+            else:
+                stack.append(right)
+                stack.append(left)
+        self.rays += 1
+        self.nodes_visited += visited
+        self.primitive_tests += tests
+        if best_index < 0:
+            return -1, float('inf'), None, None
+        return best_index, best_t, best_point, best_normal
+
+    def find_occluder(self, ray, t_min, t_max):
+        # any-hit query: the index of the first object found in the tree that
+        # occludes the ray between t_min and t_max, or -1 if nothing does
+        # the walk stops at the first blocker, no nearest hit is needed for shadows
+        ox, oy, oz = ray.origin.x, ray.origin.y, ray.origin.z
+        ix, iy, iz = _inverse_direction((ray.direction.x, ray.direction.y, ray.direction.z))
+        nodes, prims, objects = self._nodes, self._prims, self.objects
+        visited = tests = 0
+        stack = [0] if nodes else []
+        blocker = -1
+        while stack and blocker < 0:
+            node = nodes[stack.pop()]
+            visited += 1
+            tmin, tmax = self._box_hits(node, ox, oy, oz, ix, iy, iz)
+            if tmax < tmin or tmax < 0 or tmin > t_max:
+                continue
+            left, right, start, count = node[2:6]
+            if left < 0:
+                for k in range(start, start + count):
+                    tests += 1
+                    if objects[prims[k]].occludes(ray, t_min, t_max):
+                        blocker = prims[k]
+                        break
+            else:
+                stack.append(right)
+                stack.append(left)
+        self.rays += 1
+        self.nodes_visited += visited
+        self.primitive_tests += tests
+        return blocker
+
+    def _box_hits_batch(self, node, origins, inv_dirs):
+        # slab test of many rays against one node box, returns (tmin, tmax) arrays
+        t0 = (self.lo[node] - origins) * inv_dirs
+        t1 = (self.hi[node] - origins) * inv_dirs
+        tmin = np.minimum(t0, t1).max(axis=1)
+        tmax = np.maximum(t0, t1).min(axis=1)
+        return tmin, tmax
+
+    def intersect_batch(self, origins, directions, best_id, best_t, intersect):
+        # nearest hit for many rays at once, best_id and best_t are updated in place
+        # the rays go down the tree together: at each node only the rays whose
+        # box test passes (and that can still beat their current best t) continue
+        # intersect(index, origins, directions) -> (hit, t) tests one object
+        inv_dirs = self._inverse_directions(directions)
+        self.rays += len(directions)
+        stack = [(0, np.arange(len(directions)))] if len(self.left) else []
+        while stack:
+            node, rays = stack.pop()
+            self.nodes_visited += len(rays)
+            tmin, tmax = self._box_hits_batch(node, origins[rays], inv_dirs[rays])
+            rays = rays[(tmax >= tmin) & (tmax >= 0) & (tmin <= best_t[rays])]
+            if len(rays) == 0:
+                continue
+            if self.left[node] < 0:
+                start = self.start[node]
+                for index in self.prims[start:start + self.count[node]]:
+                    self.primitive_tests += len(rays)
+                    hit, t = intersect(index, origins[rays], directions[rays])
+                    current_t, current_id = best_t[rays], best_id[rays]
+                    # on equal t the lower index wins, like the linear loop
+                    closer = hit & ((t < current_t) | ((t == current_t) & (index < current_id)))
+                    best_id[rays[closer]] = index
+                    best_t[rays[closer]] = t[closer]
+            else:
+                # the nearer child goes on the stack last so it is visited first
+                # for most rays, decided by the majority direction along the split axis
+                left, right = self.left[node], self.right[node]
+                if np.count_nonzero(directions[rays, self.axis[node]] < 0) * 2 > len(rays):
+                    left, right = right, left
+                stack.append((right, rays))
+                stack.append((left, rays))
+
+    def find_occluders_batch(self, origins, directions, t_min, t_max, intersect):
+        # any-hit query for many rays, returns for every ray the index of an
+        # object that blocks it between t_min and t_max, or -1
+        # a ray leaves the traversal as soon as it is blocked
+        inv_dirs = self._inverse_directions(directions)
+        blocker = np.full(len(directions), -1, dtype=np.int64)
+        self.rays += len(directions)
+        stack = [(0, np.arange(len(directions)))] if len(self.left) else []
+        while stack:
+            node, rays = stack.pop()
+            rays = rays[blocker[rays] < 0]
+            if len(rays) == 0:
+                continue
+            self.nodes_visited += len(rays)
+            tmin, tmax = self._box_hits_batch(node, origins[rays], inv_dirs[rays])
+            rays = rays[(tmax >= tmin) & (tmax >= 0) & (tmin <= t_max[rays])]
+            if len(rays) == 0:
+                continue
+            if self.left[node] < 0:
+                start = self.start[node]
+                for index in self.prims[start:start + self.count[node]]:
+                    self.primitive_tests += len(rays)
+                    hit, t = intersect(index, origins[rays], directions[rays])
+                    blocked = hit & (t_min[rays] < t) & (t < t_max[rays])
+                    blocker[rays[blocked]] = index
+                    rays = rays[~blocked]
+                    if len(rays) == 0:
+                        break
+            else:
+                stack.append((self.right[node], rays))
+                stack.append((self.left[node], rays))
+        return blocker
+
+    @staticmethod
+    def _inverse_directions(directions):
+        # 1 / d per component, with a huge value instead of a division by zero
+        safe = np.where(np.abs(directions) > RAY_EPSILON, directions, np.where(directions >= 0, RAY_EPSILON, -RAY_EPSILON))
+        return 1.0 / safe
@@ -33,5 +33,18 @@ class Camera:
         
         self.fov = fov
 
-    
-        
+    def view_basis(self):
+        # the (3,3) matrix that turns a camera space direction into a world direction,
+        # its rows are the right, up and back axes of the camera
+        # the camera looks along look_at (a direction, like the v line of a scene file)
+        # with the up vector tilted to be perpendicular to it
+        # looking down -z with up +y gives the identity, the fixed view of RayCaster
+        forward = np.array(self.look_at.point(), dtype=np.float64)
+        forward /= np.linalg.norm(forward)
+        right = np.cross(forward, np.array(self.up.point(), dtype=np.float64))
+        length = np.linalg.norm(right)
+        if length == 0:
+            raise ValueError("The view direction is parallel to the up vector.")
+        right /= length
+        up = np.cross(right, forward)
+        return np.array([right, up, -forward])
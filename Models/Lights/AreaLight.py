@@ -0,0 +1,134 @@
+import math
+import numpy as np
+from Models.Vector3D import Vector3D
+from Models.Lights.PointLight import PointLight
+
+AREA_SAMPLES = 16   # shadow rays of a point in the penumbra, a square number (a 4x4 grid)
+JITTER_CELL = 4096  # points closer than 1/JITTER_CELL share the same sample positions
+JITTER_TABLE = 4096 # different offsets the points pick from
+JITTER_OFFSETS = np.random.default_rng(0).random((JITTER_TABLE, 2))
+JITTER_LIST = JITTER_OFFSETS.tolist()   # the same offsets as python floats, for sample_points_scalar
+
+class AreaLight(PointLight):
+    # AreaLight is a PointLight with a size: a sphere (radius) or a quad (two edges u, v
+    # centred on the position), and that size gives soft shadows
+    # so how are the shadows made ?
+    # the emitter is split into an n x n grid of cells (n * n = samples) and a shadow ray goes
+    # to one point in every cell, the fraction of blocked rays is how much of the light is hidden
+    # the first cells (self.probes of them) are the corners of the grid, they are traced for every point,
+    # and only when they disagree (some blocked, some not) the point is in the penumbra and
+    # the rest of the cells are traced, so a fully lit or fully shadowed point costs the probes only
+    # the position inside the cells is jittered per point (jitter), the same for all cells of a point,
+    # which turns the banding of a fixed pattern into fine noise
+    # the intensity, the attenuation and N . L come from the centre, like a PointLight,
+    # so every code that knows point lights (hasattr(light, 'position')) works with it
+    def __init__(self, position, intensity, attenuation=0.01, radius=0.0, edges=None, samples=AREA_SAMPLES):
+        super().__init__(position, intensity, attenuation)
+        self.light_type = "area"
+        self.radius = radius
+        # (u, v) as Vector3D for a quad, None for a sphere
+        self.edges = edges
+        grid = max(1, int(round(math.sqrt(samples))))
+        if grid * grid != samples:
+            raise ValueError(f"Area light samples must be a square number, not {samples}.")
+        self.grid = grid
+        self.samples = samples
+        # the cells as (column, row), the corners first
+        last = grid - 1
+        corners = list(dict.fromkeys([(0, 0), (last, last), (0, last), (last, 0)]))
+        self.cells = np.array(corners + [(i, j) for j in range(grid) for i in range(grid) if (i, j) not in corners],
+                              dtype=np.float64)
+        self.probes = len(corners)
+        # the cells as python floats for the scalar path, see sample_points_scalar
+        self.cell_list = self.cells.tolist()
+
+    @staticmethod
+    def from_point(light, extent, samples=AREA_SAMPLES):
+        # the area version of a parsed PointLight, extent is [radius] or [ux, uy, uz, vx, vy, vz]
+        # with the samples as an optional last value (the x line of the scene file)
+        if len(extent) in (2, 7):
+            samples = int(extent[-1])
+            extent = extent[:-1]
+        if len(extent) == 1:
+            area = AreaLight(light.position, light.intensity, light.attenuation, radius=extent[0], samples=samples)
+        else:
+            u, v = Vector3D(*extent[:3]), Vector3D(*extent[3:6])
+            area = AreaLight(light.position, light.intensity, light.attenuation, edges=(u, v), samples=samples)
+        area.intensity_multiplier = getattr(light, 'intensity_multiplier', 1.0)
+        return area
+
+    def jitter(self, points):
+        # a fixed random (K,2) offset in [0, 1) for the (K,3) points, from their coordinates,
+        # so the scalar and the batch path and every re-render get the same one
+        # the points are rounded to cells of 1/JITTER_CELL and a spatial hash of the cell
+        # (three large primes, xor) picks one of the JITTER_TABLE seeded random offsets
+        cells = np.floor(points * JITTER_CELL).astype(np.int64)
+        index = (cells[:, 0] * 73856093 ^ cells[:, 1] * 19349663 ^ cells[:, 2] * 83492791) % JITTER_TABLE
+        return JITTER_OFFSETS[index]
+
+    def sample_points(self, points, cells):
+        # the (K,C,3) points on the emitter seen from the (K,3) points, for the cells rows of self.cells
+        c = self.cells[cells]
+        jitter = self.jitter(points)
+        u = (c[None, :, 0] + jitter[:, 0, None]) / self.grid
+        v = (c[None, :, 1] + jitter[:, 1, None]) / self.grid
+        center = np.array(self.position.point())
+        if self.edges is not None:
+            eu, ev = (np.array(edge.point()) for edge in self.edges)
+            return center + (u - 0.5)[..., None] * eu + (v - 0.5)[..., None] * ev
+        # a sphere looks like a disk facing the point, the unit square is mapped onto it
+        # with the concentric map (it keeps the cells the same size)
+        a, b = 2.0 * u - 1.0, 2.0 * v - 1.0
+        use_a = np.abs(a) > np.abs(b)
+        safe_a = np.where(a == 0, 1.0, a)
+        safe_b = np.where(b == 0, 1.0, b)
+        r = np.where(use_a, a, b)
+        phi = np.where(use_a, (math.pi / 4) * (b / safe_a), math.pi / 2 - (math.pi / 4) * (a / safe_b))
+        w = points - center
+        w /= np.maximum(np.sqrt(w[:, 0] ** 2 + w[:, 1] ** 2 + w[:, 2] ** 2), 1e-12)[:, None]
+        helper = np.where(np.abs(w[:, 1:2]) < 0.9, np.array([0.0, 1.0, 0.0]), np.array([1.0, 0.0, 0.0]))
+        e1 = np.cross(w, helper)
+        # (a point at the centre has no facing disk, every sample is then the centre)
+        e1 /= np.maximum(np.sqrt(e1[:, 0] ** 2 + e1[:, 1] ** 2 + e1[:, 2] ** 2), 1e-12)[:, None]
+        e2 = np.cross(w, e1)
+        radius = self.radius * r
+        return (center + (radius * np.cos(phi))[..., None] * e1[:, None, :]
+                + (radius * np.sin(phi))[..., None] * e2[:, None, :])
+
+    def sample_points_scalar(self, x, y, z, cells):
+        # sample_points for one point (x, y, z) in plain python floats, the list of the (tx, ty, tz)
+        # targets of the cells (a range of rows of self.cells), for the per-pixel path,
+        # the same formulas in the same order, so both paths aim the shadow rays at the same points
+        cx, cy, cz = int(math.floor(x * JITTER_CELL)), int(math.floor(y * JITTER_CELL)), int(math.floor(z * JITTER_CELL))
+        ju, jv = JITTER_LIST[(cx * 73856093 ^ cy * 19349663 ^ cz * 83492791) % JITTER_TABLE]
+        position, grid, cell_list = self.position, self.grid, self.cell_list
+        ox, oy, oz = position.x, position.y, position.z
+        targets = []
+        if self.edges is not None:
+            eu, ev = self.edges
+            for cell in cells:
+                cu, cv = cell_list[cell]
+                su, sv = (cu + ju) / grid - 0.5, (cv + jv) / grid - 0.5
+                targets.append((ox + su * eu.x + sv * ev.x, oy + su * eu.y + sv * ev.y, oz + su * eu.z + sv * ev.z))
+            return targets
+        # the disk facing the point, see sample_points
+        wx, wy, wz = x - ox, y - oy, z - oz
+        length = max(math.sqrt(wx * wx + wy * wy + wz * wz), 1e-12)
+        wx, wy, wz = wx / length, wy / length, wz / length
+        hx, hy, hz = (0.0, 1.0, 0.0) if abs(wy) < 0.9 else (1.0, 0.0, 0.0)
+        # e1 = w x helper, normalized, and e2 = w x e1
+        ax, ay, az = wy * hz - wz * hy, wz * hx - wx * hz, wx * hy - wy * hx
+        length = max(math.sqrt(ax * ax + ay * ay + az * az), 1e-12)
+        ax, ay, az = ax / length, ay / length, az / length
+        bx, by, bz = wy * az - wz * ay, wz * ax - wx * az, wx * ay - wy * ax
+        for cell in cells:
+            cu, cv = cell_list[cell]
+            a, b = 2.0 * ((cu + ju) / grid) - 1.0, 2.0 * ((cv + jv) / grid) - 1.0
+            if abs(a) > abs(b):
+                r, phi = a, (math.pi / 4) * (b / a)
+            else:
+                r, phi = b, math.pi / 2 - (math.pi / 4) * (a / (b if b != 0 else 1.0))
+            radius = self.radius * r
+            s, c = radius * math.sin(phi), radius * math.cos(phi)
+            targets.append((ox + c * ax + s * bx, oy + c * ay + s * by, oz + c * az + s * bz))
+        return targets
@@ -9,10 +9,10 @@ class PointLight:
         self.light_type = "point" 
 
     def get_direction(self, point):
-        return self.position.subtract(point).normalize()
+        return point.direction_to(self.position)
 
     def get_distance(self, point):
-        return self.position.subtract(point).magnitude()
+        return self.position.distance_to(point)
 
     def get_intensity(self, point):
         distance = self.get_distance(point)
@@ -9,11 +9,19 @@ class Material:
     # the diffuse coefficient is the coefficient of the diffuse light
     # the specular coefficient is the coefficient of the specular light 
     # the shininess is the specular exponent that controls the shininess of the object
+    # the reflectivity and the transparency are the shares of the color that come from the
+    # reflected and the refracted ray, the rest is the object's own shading,
+    # ior is the index of refraction of the inside (1.5 is glass)
+    # both shares are 0 by default, a matte object never traces a secondary ray
     def __init__(self, diffuse_color: Vector3D, ambient_coef: float = 0.4, 
                 diffuse_coef: float = 1.0, specular_coef: float = 0.8, 
-                shininess: float = 30.0):  
+                shininess: float = 30.0, reflectivity: float = 0.0,
+                transparency: float = 0.0, ior: float = 1.5):  
         self.diffuse_color = diffuse_color
         self.ambient_coef = ambient_coef
         self.diffuse_coef = diffuse_coef
         self.specular_coef = specular_coef
-        self.shininess = shininess
\ No newline at end of file
+        self.shininess = shininess
+        self.reflectivity = reflectivity
+        self.transparency = transparency
+        self.ior = ior
\ No newline at end of file
@@ -1,6 +1,44 @@
+import numpy as np
 from abc import ABC, abstractmethod
 from Models.Vector3D import Vector3D
 from Models.Material import Material
+from Models.Objects.Ray import Ray
+
+def columns(vectors):
+    # the x, y and z columns of an (N,3) array as contiguous (N,) arrays,
+    # the (K,N) formulas of the intersect_batch kernels read every column once per object,
+    # and strided columns make each of those reads several times slower
+    # the batch path keeps its rays column-major (order='F', see take_rows), their columns
+    # are contiguous already and need no copy
+    # one row broadcast to all N rays (the camera position of every camera ray) gives
+    # (1,) columns, the kernels then work out everything of the origin once per object
+    if vectors.strides[0] == 0:
+        x, y, z = vectors[:1].T
+        return x, y, z
+    if vectors.strides[0] == vectors.itemsize:
+        return vectors[:, 0], vectors[:, 1], vectors[:, 2]
+    x, y, z = np.ascontiguousarray(vectors.T)
+    return x, y, z
+
+def take_rows(vectors, index):
+    # the rows index (an integer array) of an (N,3) array, as a column-major (K,3) array
+    # so why column-major ?
+    # numpy runs the innermost loop of an operation along the last axis, for a C-ordered
+    # (N,3) array that is a loop of 3 for every row, and (N,3) * (N,1) or (N,3) * (3,)
+    # are several times slower than the same work on whole columns
+    # with the columns contiguous (order='F') the loops go down the columns instead,
+    # and a gather of the columns is also cheaper than a gather of 24 byte rows
+    # a broadcast row stays a broadcast row
+    if vectors.strides[0] == 0:
+        return vectors[:len(index)]
+    return vectors.T.take(index, axis=1).T
+
+def put_rows(target, index, vectors):
+    # target[index] = vectors for an (N,3) column-major target, the other way of take_rows
+    # one store per column, numpy does a 2-d fancy assignment element by element
+    for column in range(target.shape[1]):
+        target[:, column][index] = vectors[:, column]
+
 class Object(ABC):
     # an abstract base class for all objects in the scene
     # it defines the basic properties and methods that all objects should have
@@ -14,4 +52,25 @@ class Object(ABC):
     
     @abstractmethod
     def get_surface_properties(self, point: Vector3D) -> tuple:
-        pass
\ No newline at end of file
+        pass
+
+    def intersect_batch(self, origins, directions) -> tuple:
+        # intersect for (N,3) arrays of ray origins and unit directions,
+        # returns (hit, t, normals) as (N,), (N,) and (N,3) arrays, t is inf and the normal
+        # is zero where a ray misses
+        # this one calls intersect for every ray, Sphere and Plane override it with array math
+        hit = np.zeros(len(origins), dtype=bool)
+        t = np.full(len(origins), np.inf)
+        normals = np.zeros((len(origins), 3))
+        for k, (origin, direction) in enumerate(zip(origins, directions)):
+            found, tk, _, normal = self.intersect(Ray(Vector3D(*origin), Vector3D(*direction)))
+            if found:
+                hit[k], t[k] = True, tk
+                normals[k] = (normal.x, normal.y, normal.z)
+        return hit, t, normals
+
+    def occludes(self, ray, t_min: float, t_max: float) -> bool:
+        # any-hit test for shadow rays: does the ray hit this object with t_min < t < t_max?
+        # subclasses override it with a version that skips the hit point and normal
+        hit, t, _, _ = self.intersect(ray)
+        return hit and t_min < t < t_max
\ No newline at end of file
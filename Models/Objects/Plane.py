@@ -1,9 +1,45 @@
 import numpy as np
 from Models.Vector3D import Vector3D
-from Models.Objects.Object import Object 
+from Models.Objects.Object import Object, columns
 from Models.Objects.Ray import Ray
 
 DENOMINATOR_EPSILON = 1e-6  # Small value to avoid division by zero
+
+def plane_distances(normals, offsets, origins, directions):
+    # (K,N) t values of the N rays against the K planes (normals (K,3), offsets d (K,)),
+    # t = -(n . o + d) / (n . dir) like Plane.intersect, inf where there is no hit
+    # Plane.intersect_batch and PackedScene.intersect_planes both use it
+    # with broadcast origins or directions (see columns) n . o or n . dir is (K,1)
+    nx, ny, nz = normals[:, 0:1], normals[:, 1:2], normals[:, 2:3]
+    ox, oy, oz = columns(origins)
+    dx, dy, dz = columns(directions)
+    denominator = dx * nx
+    denominator += dy * ny
+    denominator += dz * nz
+    # rays parallel to the plane get a denominator of 1 so the division below is safe,
+    # they are not hits anyway
+    hit = np.abs(denominator) >= DENOMINATOR_EPSILON
+    np.copyto(denominator, 1.0, where=~hit)
+    t = ox * nx
+    t += oy * ny
+    t += oz * nz
+    t += offsets[:, None]
+    np.negative(t, out=t)
+    t = np.divide(t, denominator, out=t if t.shape == denominator.shape else None)
+    hit = hit & (t >= 0)
+    np.copyto(t, np.inf, where=~hit)
+    return t
+
+def plane_normals(normals, directions):
+    # the (N,3) normals of the planes hit by the N rays (normals (N,3)),
+    # flipped to face the ray like in Plane.intersect
+    # If the denominator is positive, the normal points away from the ray origin
+    # (d . n summed in the order of the scalar dot product)
+    dx, dy, dz = columns(directions)
+    denominator = dx * normals[:, 0]
+    denominator += dy * normals[:, 1]
+    denominator += dz * normals[:, 2]
+    return normals * np.where(denominator > 0, -1.0, 1.0)[:, None]
 class Plane(Object):   
     # the plane class is used to represent a plane in 3D space
     # it inherits from the Object class and implements the intersect method 
@@ -54,6 +90,29 @@ class Plane(Object):
         # and t is the distance from the ray origin to the intersection point
         return True, t, intersection_point, normal
     
+    def intersect_batch(self, origins, directions) -> tuple:
+        # the batch version of intersect for N rays at once
+        # origins and directions are (N,3) arrays, the directions of unit length like a Ray's
+        # returns (hit, t, normals): the (N,) hit flags, the (N,) distances (inf where the ray
+        # misses) and the (N,3) normals, facing the rays like in intersect (zero where the ray misses)
+        normal = np.array([self.normal.point()])
+        t = plane_distances(normal, np.array([float(self.d)]), origins, directions)[0]
+        hit = t < np.inf
+        normals = np.zeros((len(t), 3))
+        rows = np.flatnonzero(hit)
+        if len(rows):
+            normals[rows] = plane_normals(np.repeat(normal, len(rows), axis=0), directions[rows])
+        return hit, t, normals
+
+    def occludes(self, ray: Ray, t_min: float, t_max: float) -> bool:
+        # the shadow version of intersect: only the t test, no hit point or normal
+        n, d, o = self.normal, ray.direction, ray.origin
+        denominator = d.x * n.x + d.y * n.y + d.z * n.z
+        if abs(denominator) < DENOMINATOR_EPSILON:
+            return False
+        t = -(n.x * o.x + n.y * o.y + n.z * o.z + self.d) / denominator
+        return t >= 0 and t_min < t < t_max
+
     def get_surface_properties(self, point: Vector3D) -> tuple:
         # For a plane, normal is constant regardless of hit point
         return self.normal, self.color
\ No newline at end of file
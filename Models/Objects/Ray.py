@@ -16,4 +16,5 @@ class Ray:
         # so what is self.direction.scalar_multiply(t) ?
         # it is the vector that points in the direction of the ray, scaled by t
         # and what is self.origin.add(...) ?
-        return self.origin.add(self.direction.scalar_multiply(t))
\ No newline at end of file
+        # add_scaled does both steps with a single new vector
+        return self.origin.add_scaled(self.direction, t)
\ No newline at end of file
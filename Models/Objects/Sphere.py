@@ -1,8 +1,62 @@
+import math
 import numpy as np
 from Models.Vector3D import Vector3D
-from Models.Objects.Object import Object
+from Models.Objects.Object import Object, columns
 from Models.Objects.Ray import Ray
 
+def sphere_distances(centers, radii, origins, directions):
+    # (K,N) t values of the N rays against the K spheres (centers (K,3), radii (K,) absolute),
+    # one row per sphere so every row is a contiguous array like in the scalar loop,
+    # inf where there is no hit
+    # it is the half-b form of the quadratic of Sphere.intersect: b' = (o - c) . d,
+    # t = (-b' -+ sqrt(b'^2 - a c)) / a, the sums are done in place and in the same order
+    # as the scalar code, so both paths give the same numbers
+    # Sphere.intersect_batch and PackedScene.intersect_spheres both use it
+    # the origins or the directions can be one broadcast row (see columns), then o - c and
+    # c (or a) are worked out once per sphere, with the same numbers as for every ray
+    ox, oy, oz = columns(origins)
+    dx, dy, dz = columns(directions)
+    ocx = ox - centers[:, 0:1]
+    ocy = oy - centers[:, 1:2]
+    ocz = oz - centers[:, 2:3]
+    a = dx * dx + dy * dy + dz * dz
+    b = ocx * dx
+    b += ocy * dy
+    b += ocz * dz
+    c = ocx * ocx
+    c += ocy * ocy
+    c += ocz * ocz
+    c -= (radii * radii)[:, None]
+    discriminant = b * b
+    discriminant -= a * c
+    hit = discriminant >= 0
+    root = np.sqrt(np.maximum(discriminant, 0.0, out=discriminant), out=discriminant)
+    t = -b
+    t -= root
+    t /= a
+    # If intersection is behind the ray origin, try the other intersection
+    # (the far root of every pair, copied where needed, a shadow ray from a surface is behind
+    # most spheres and a gather and a scatter of that many pairs costs more)
+    far = t < 0
+    if far.any():
+        root -= b
+        root /= a
+        np.copyto(t, root, where=far)
+    hit &= t >= 0
+    np.copyto(t, np.inf, where=~hit)
+    return t
+
+def sphere_normals(centers, inverted, points):
+    # the (N,3) unit normals at the points, one sphere per point (centers (N,3), inverted (N,)),
+    # the hit point minus the center normalized like center.direction_to(hit_point)
+    n = points - centers
+    length = np.sqrt(n[:, 0] ** 2 + n[:, 1] ** 2 + n[:, 2] ** 2)
+    n /= np.where(length == 0, 1.0, length)[:, None]
+    # For inverted spheres (negative radius), invert the normal
+    # (times -1 or 1 on every row, cheaper than a gather and a scatter of the inverted rows)
+    n *= np.where(inverted, -1.0, 1.0)[:, None]
+    return n
+
 class Sphere(Object):    
     # so the spere class is used to represent a sphere in 3D space
     # it inherits from the Object class and implements the intersect method
@@ -46,10 +100,13 @@ class Sphere(Object):
         # because we are solving the quadratic equation for t
         # t = (-b ± sqrt(discriminant)) / (2 * a)
         # Calculate the two possible intersection points
-        t = (-b - np.sqrt(discriminant)) / (2.0 * a)
+        # math.sqrt and not np.sqrt: on a python float it is several times faster,
+        # and the root is taken once for both intersections
+        root = math.sqrt(discriminant)
+        t = (-b - root) / (2.0 * a)
         # If intersection is behind the ray origin, try the other intersection
         if t < 0: 
-            t = (-b + np.sqrt(discriminant)) / (2.0 * a)
+            t = (-b + root) / (2.0 * a)
             if t < 0: 
                 return False, float('inf'), None, None
         # Calculate intersection point and normal
@@ -59,18 +116,56 @@ class Sphere(Object):
         # so what is hit_point.subtract(self.center) ?
         # it is the vector from the sphere center to the hit point
         # and normalize it to get the unit normal vector    
-        normal = hit_point.subtract(self.center).normalize()
+        # direction_to does the subtract and the normalize with a single new vector
+        normal = self.center.direction_to(hit_point)
         # For inverted spheres (negative radius), invert the normal
         if self.is_inverted:
-            # so what is normal.scalar_multiply(-1) ?
-            # it is the normal vector multiplied by -1 to invert it
+            # so what is normal.imul_scalar(-1) ?
+            # it is the normal vector multiplied by -1 to invert it, in place
             # this is done to get the correct normal vector for inverted spheres
-            normal = normal.scalar_multiply(-1)
+            normal.imul_scalar(-1)
         # Return intersection status, distance, hit point, and normal
         # so we return True, t, hit_point, normal
         # True indicates that there is an intersection
         return True, t, hit_point, normal  
     
+    def intersect_batch(self, origins, directions) -> tuple:
+        # the batch version of intersect for N rays at once
+        # origins and directions are (N,3) arrays, the directions of unit length like a Ray's
+        # returns (hit, t, normals): the (N,) hit flags, the (N,) distances (inf where the ray
+        # misses) and the (N,3) unit normals at the hit points (zero where the ray misses)
+        center = np.array([self.center.point()])
+        t = sphere_distances(center, np.array([self.abs_radius]), origins, directions)[0]
+        hit = t < np.inf
+        normals = np.zeros((len(t), 3))
+        rows = np.flatnonzero(hit)
+        if len(rows):
+            points = origins[rows] + directions[rows] * t[rows, None]
+            normals[rows] = sphere_normals(center, np.full(len(rows), self.is_inverted), points)
+        return hit, t, normals
+
+    def occludes(self, ray: Ray, t_min: float, t_max: float) -> bool:
+        # the shadow version of intersect: same quadratic and the same choice of root,
+        # but no hit point, no normal and no Vector3D objects, only the t test
+        d = ray.direction
+        ox = ray.origin.x - self.center.x
+        oy = ray.origin.y - self.center.y
+        oz = ray.origin.z - self.center.z
+        a = d.x * d.x + d.y * d.y + d.z * d.z
+        b = 2.0 * (ox * d.x + oy * d.y + oz * d.z)
+        c = ox * ox + oy * oy + oz * oz - self.abs_radius * self.abs_radius
+        discriminant = b * b - 4 * a * c
+        if discriminant < 0:
+            return False
+        root = math.sqrt(discriminant)
+        t = (-b - root) / (2.0 * a)
+        # If intersection is behind the ray origin, try the other intersection
+        if t < 0:
+            t = (-b + root) / (2.0 * a)
+            if t < 0:
+                return False
+        return t_min < t < t_max
+
     def get_surface_properties(self, point: Vector3D) -> tuple:
         # Calculate the normal at the given point on the sphere
         # The normal is the vector from the sphere center to the point, normalized
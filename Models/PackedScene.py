@@ -0,0 +1,368 @@
+import numpy as np
+from Models.SpecularTable import SpecularTable, specular_cutoffs
+from Models.Objects.Sphere import sphere_distances, sphere_normals
+from Models.Objects.Plane import plane_distances, plane_normals
+from Models.Objects.Object import take_rows, put_rows
+
+BLOCK_ELEMENTS = 32768      # rays x objects per block, small blocks stay in the CPU cache
+OBJECT_GROUP = 16           # objects per pass, so a block row always holds a few thousand rays
+PACKET_SIZE = 64            # consecutive rays culled together, an 8x8 pixel block for camera rays
+PACKET_MIN_SPHERES = 2      # fewer spheres than this are tested densely, the packet bounds would cost more
+PACKET_MIN_CULLED = 0.25    # a sphere is tested per packet only when at least this share of the packets skip it
+CULL_MARGIN = 1e-6          # relative slack of the packet test, a grazing ray is never culled by rounding
+
+# the kind of every object in the packed arrays
+SPHERE = 0
+PLANE = 1
+
+def _packet_lanes(values):
+    # the (N,3) or (N,) values as (3, PACKET_SIZE, packets) or (PACKET_SIZE, packets) arrays,
+    # lane l of packet p is the value p * PACKET_SIZE + l, the last packet is filled up with
+    # copies of the last value
+    # why lanes first ? a min or a sum over the rays of every packet is then an elementwise
+    # min or sum of PACKET_SIZE contiguous rows, numpy reduces a short last axis row by row
+    # and that is several times slower
+    count = len(values)
+    full, rest = divmod(count, PACKET_SIZE)
+    lanes = np.empty(values.shape[1:] + (PACKET_SIZE, full + (rest > 0)))
+    packets = np.swapaxes(lanes, -1, -2)
+    packets[..., :full, :] = values[:full * PACKET_SIZE].T.reshape(values.shape[1:] + (full, PACKET_SIZE))
+    if rest:
+        packets[..., full, :] = values[-1][..., None]
+        packets[..., full, :rest] = values[full * PACKET_SIZE:].T
+    return lanes
+
+def _first_true(mask):
+    # the first row of a (K,N) boolean array that is True in every column, 0 where none is
+    # np.argmax(mask, axis=0) moves the axis last and runs one tiny argmax per column,
+    # a masked store per row is several times faster for the few rows of a group
+    row = np.zeros(mask.shape[1], dtype=np.intp)
+    for k in range(len(mask) - 1, 0, -1):
+        row[mask[k]] = k
+    return row
+
+class PackedScene:
+    # PackedScene is the compiled form of Scene.objects for the batch path
+    # so why do we need it ?
+    # Scene.objects is a python list of Sphere and Plane objects, and the batch code
+    # had to walk it with hasattr(obj, 'radius') and pull the numbers out of every
+    # object again for every batch of rays
+    # here the same numbers sit in contiguous numpy arrays, one row per object:
+    #   spheres: centers (S,3), radii (S,) and inverted flags (S,)
+    #   planes:  normals (P,3) and offsets d (P,)
+    #   materials: diffuse color (M,3) and the coefficients (M,), indexed by object id,
+    #              with the reflectivity, transparency and ior of the secondary rays
+    #              and the specular table rows
+    # so all the spheres (or all the planes) are tested against a batch of rays
+    # with one set of array operations, with no python loop over the objects
+    # it is built from the objects only, so it pickles cheaply to worker processes
+    # and Scene.get_packed rebuilds it only when the scene version changes
+    def __init__(self, objects, version=0):
+        self.version = version
+        count = len(objects)
+        self.count = count
+        self.kind = np.empty(count, dtype=np.int8)
+        # slot is the row of each object inside the arrays of its own kind
+        self.slot = np.empty(count, dtype=np.int64)
+        sphere_ids, plane_ids = [], []
+        for idx, obj in enumerate(objects):
+            if hasattr(obj, 'radius'):
+                self.kind[idx], self.slot[idx] = SPHERE, len(sphere_ids)
+                sphere_ids.append(idx)
+            elif hasattr(obj, 'normal') and hasattr(obj, 'd'):
+                self.kind[idx], self.slot[idx] = PLANE, len(plane_ids)
+                plane_ids.append(idx)
+            else:
+                raise TypeError(f"Cannot pack object of type {type(obj).__name__}.")
+        spheres = [objects[idx] for idx in sphere_ids]
+        planes = [objects[idx] for idx in plane_ids]
+        self.sphere_ids = np.array(sphere_ids, dtype=np.int64)
+        self.sphere_centers = np.array([s.center.point() for s in spheres], dtype=np.float64).reshape(-1, 3)
+        self.sphere_radii = np.array([s.abs_radius for s in spheres], dtype=np.float64)
+        self.sphere_inverted = np.array([s.is_inverted for s in spheres], dtype=bool)
+        self.plane_ids = np.array(plane_ids, dtype=np.int64)
+        self.plane_normals = np.array([p.normal.point() for p in planes], dtype=np.float64).reshape(-1, 3)
+        self.plane_offsets = np.array([p.d for p in planes], dtype=np.float64)
+        # material tables, row idx belongs to objects[idx]
+        materials = [obj.material for obj in objects]
+        self.diffuse_color = np.array([m.diffuse_color.point() for m in materials], dtype=np.float64).reshape(-1, 3)
+        self.ambient_coef = np.array([m.ambient_coef for m in materials], dtype=np.float64)
+        self.diffuse_coef = np.array([m.diffuse_coef for m in materials], dtype=np.float64)
+        self.specular_coef = np.array([m.specular_coef for m in materials], dtype=np.float64)
+        self.shininess = np.array([m.shininess for m in materials], dtype=np.float64)
+        # the x ** shininess table of the specular highlights, see SpecularTable,
+        # with the table row and the V . R cutoff of every object
+        self.specular = SpecularTable(self.shininess[self.specular_coef > 0])
+        tabled = self.specular.shininess
+        rows = np.minimum(np.searchsorted(tabled, self.shininess), max(len(tabled) - 1, 0))
+        found = len(tabled) > 0 and (tabled[rows] == self.shininess)
+        self.specular_row = np.where(found, rows, -1).astype(np.int64)
+        # (infinite for an object without highlights, no V . R is above it)
+        self.specular_cutoff = np.where(self.specular_coef > 0, specular_cutoffs(self.shininess), np.inf)
+        # the secondary rays of the wavefront, see RayCaster.shade_wavefront
+        self.reflectivity = np.array([m.reflectivity for m in materials], dtype=np.float64)
+        self.transparency = np.array([m.transparency for m in materials], dtype=np.float64)
+        self.ior = np.array([m.ior for m in materials], dtype=np.float64)
+        # True when any object reflects or refracts, a scene without one is shaded in one pass
+        self.secondary = bool((self.reflectivity > 0).any() or (self.transparency > 0).any())
+        # the foreground objects (everything but the inverted spheres) and the
+        # background ones, each in index order so that ties go to the lower index
+        background = self.sphere_ids[self.sphere_inverted]
+        self.background_ids = background
+        self.foreground_ids = np.setdiff1d(np.arange(count, dtype=np.int64), background)
+        # the intersection tests done per object by nearest_hit, farthest_hit and first_occluder,
+        # only ever added to (like BVH.primitive_tests), the profiler takes the difference
+        self.tests = np.zeros(count, dtype=np.int64)
+
+    def specular_power(self, ids, x):
+        # x ** shininess for the objects ids and x values above their cutoffs, from the
+        # SpecularTable, the objects without a table row (past MAX_TABLES) use ** directly
+        rows = self.specular_row[ids]
+        direct = np.flatnonzero(rows < 0)
+        if not len(direct):
+            return self.specular.power_batch(rows, x)
+        values = np.empty(len(x))
+        values[direct] = x[direct] ** self.shininess[ids[direct]]
+        looked_up = np.flatnonzero(rows >= 0)
+        values[looked_up] = self.specular.power_batch(rows[looked_up], x[looked_up])
+        return values
+
+    def intersect_spheres(self, slots, origins, directions):
+        # (K,N) t values of the N rays against the K spheres in the given slots,
+        # inf where there is no hit, the same kernel as Sphere.intersect_batch
+        return sphere_distances(self.sphere_centers[slots], self.sphere_radii[slots], origins, directions)
+
+    def intersect_planes(self, slots, origins, directions):
+        # (K,N) t values of the N rays against the K planes in the given slots,
+        # inf where there is no hit, the same kernel as Plane.intersect_batch
+        return plane_distances(self.plane_normals[slots], self.plane_offsets[slots], origins, directions)
+
+    def intersect_ids(self, ids, origins, directions):
+        # (K,N) t values of the N rays against the K objects ids (an index array),
+        # row k belongs to ids[k]
+        kind = self.kind[ids]
+        spheres = kind == SPHERE
+        if spheres.all():
+            return self.intersect_spheres(self.slot[ids], origins, directions)
+        if not spheres.any():
+            return self.intersect_planes(self.slot[ids], origins, directions)
+        t = np.empty((len(ids), len(directions)))
+        t[spheres] = self.intersect_spheres(self.slot[ids[spheres]], origins, directions)
+        t[~spheres] = self.intersect_planes(self.slot[ids[~spheres]], origins, directions)
+        return t
+
+    def intersect_index_batch(self, index, origins, directions):
+        # (hit, t) of one object, the signature the BVH leaves expect
+        t = self.intersect_ids(np.array([index]), origins, directions)[0]
+        return t < np.inf, t
+
+    def _groups(self, ids):
+        # the objects ids in groups of at most OBJECT_GROUP, in order
+        for first in range(0, len(ids), OBJECT_GROUP):
+            yield ids[first:first + OBJECT_GROUP]
+
+    def _blocks(self, count, objects):
+        # slices over the rays so that one (K,n) block of t values stays small,
+        # a block of the whole batch is several MB and every temporary of the
+        # formulas above would go to main memory and back
+        step = max(1, BLOCK_ELEMENTS // max(objects, 1))
+        for start in range(0, count, step):
+            yield slice(start, min(start + step, count))
+
+    def packet_bounds(self, origins, directions, t_max=None):
+        # the bounds of every PACKET_SIZE consecutive rays (a packet), for packet_cull
+        # so what is the bound of a packet ?
+        # the origins fit in a ball (centre, radius) and the directions in a cone around
+        # their mean (axis), spread is how far a unit direction can be from the axis
+        # so a point of a ray at distance t is at most radius + spread * t from centre + t * axis,
+        # the packet is a cone with a rounded tip: a sharp cone for camera rays (one origin),
+        # a cylinder for the shadow rays of a directional light (one direction)
+        # and a bit of both for the shadow rays of a point light
+        # the directions must be unit vectors, a packet that spreads over 60 degrees gets an
+        # infinite spread and is never culled
+        # the ball is the one around the bounding box of the origins, a bit larger than
+        # needed but it takes no second pass over the rays
+        # a broadcast row (the one origin of the camera rays, the one direction of a
+        # directional light) is its own bound, with no pass over the rays at all
+        packets = -(-len(directions) // PACKET_SIZE)
+        if origins.strides[0] == 0:
+            centre = np.repeat(origins[:1], packets, axis=0)
+            radius = np.zeros(packets)
+        else:
+            o = _packet_lanes(origins)
+            low, high = o.min(axis=1), o.max(axis=1)
+            centre = 0.5 * (low + high).T
+            size = high - low
+            radius = 0.5 * np.sqrt(size[0] ** 2 + size[1] ** 2 + size[2] ** 2)
+        if directions.strides[0] == 0:
+            axis = np.repeat(directions[:1], packets, axis=0)
+            spread = np.zeros(packets)
+        else:
+            d = _packet_lanes(directions)
+            axis = d.sum(axis=1).T
+            length = np.sqrt(axis[:, 0] ** 2 + axis[:, 1] ** 2 + axis[:, 2] ** 2)
+            axis /= np.where(length == 0, 1.0, length)[:, None]
+            cosine = d[0] * axis[:, 0]
+            cosine += d[1] * axis[:, 1]
+            cosine += d[2] * axis[:, 2]
+            cosine = cosine.min(axis=0)
+            # the chord between two unit vectors at that angle
+            spread = np.sqrt(np.maximum(2.0 - 2.0 * cosine, 0.0))
+            spread[(spread >= 1.0) | (length == 0)] = np.inf
+        # no light distance to take the maximum of for the shadow rays of a directional light
+        if t_max is None or np.isposinf(t_max).all():
+            reach = np.full(packets, np.inf)
+        else:
+            reach = _packet_lanes(t_max).max(axis=0)
+        return centre, radius, axis, spread, reach
+
+    def packet_cull(self, ids, origins, directions, t_max=None):
+        # the packet (frustum) culling of the spheres among ids
+        # returns (dense, culled): dense are the ids tested against every ray as before,
+        # culled a list of (index, rays), a sphere and the rays of the packets that can hit it
+        # a sphere is skipped by a packet when it is farther than its radius from the packet
+        # bound (see packet_bounds) for every t, the closest t is found in closed form:
+        #   the distance to the axis point at t minus spread * t is smallest at
+        #   t = along + perp * spread / sqrt(1 - spread ** 2), clamped to [0, reach]
+        # along and perp are the coordinates of the sphere centre on and off the axis
+        # only the spheres skipped by at least PACKET_MIN_CULLED of the packets are culled,
+        # the others are cheaper as one dense test
+        sphere_rows = np.flatnonzero(self.kind[ids] == SPHERE)
+        spheres = ids[sphere_rows]
+        if len(spheres) < PACKET_MIN_SPHERES or len(directions) < 4 * PACKET_SIZE:
+            return ids, []
+        centre, radius, axis, spread, reach = self.packet_bounds(origins, directions, t_max)
+        slots = self.slot[spheres]
+        w = self.sphere_centers[slots][None, :, :] - centre[:, None, :]
+        along = w[..., 0] * axis[:, None, 0] + w[..., 1] * axis[:, None, 1] + w[..., 2] * axis[:, None, 2]
+        distance2 = w[..., 0] ** 2 + w[..., 1] ** 2 + w[..., 2] ** 2
+        perp = np.sqrt(np.maximum(distance2 - along * along, 0.0))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slope = spread / np.sqrt(1.0 - spread * spread)
+            t = np.clip(along + perp * slope[:, None], 0.0, reach[:, None])
+            gap = np.sqrt((along - t) ** 2 + perp * perp) - spread[:, None] * t - radius[:, None]
+        radii = self.sphere_radii[slots]
+        # NaN (an infinite spread) compares False, the packet keeps the sphere
+        skipped = gap > radii + CULL_MARGIN * (1.0 + np.sqrt(distance2) + radii)
+        culled_share = skipped.mean(axis=0)
+        chosen = culled_share >= PACKET_MIN_CULLED
+        if not chosen.any():
+            return ids, []
+        # the ids without the chosen spheres, in their order (setdiff1d sorts and costs more
+        # than the whole test for a few ids)
+        kept = np.ones(len(ids), dtype=bool)
+        kept[sphere_rows[chosen]] = False
+        dense = ids[kept]
+        count = len(directions)
+        lanes = np.arange(PACKET_SIZE)
+        culled = []
+        for k in np.flatnonzero(chosen):
+            packets = np.flatnonzero(~skipped[:, k])
+            rays = (packets[:, None] * PACKET_SIZE + lanes).ravel()
+            culled.append((spheres[k], rays[rays < count]))
+        return dense, culled
+
+    def nearest_hit(self, ids, origins, directions):
+        # the nearest of the objects ids for every ray, returns (nearest_id, nearest_t),
+        # nearest_id is -1 where the ray misses all of them
+        # ids must be sorted: _first_true keeps the first row on a tie and a later group
+        # must be strictly closer, so the lower index wins like in the scalar loop
+        # the spheres picked by packet_cull come last, only for the rays of their packets,
+        # and they win a tie by the lower index like in the BVH
+        count = len(directions)
+        nearest_id = np.full(count, -1, dtype=np.int64)
+        nearest_t = np.full(count, np.inf)
+        ids, culled = self.packet_cull(ids, origins, directions)
+        self.tests[ids] += count
+        for group in self._groups(ids):
+            for block in self._blocks(count, len(group)):
+                t = self.intersect_ids(group, origins[block], directions[block])
+                block_t = t.min(axis=0)
+                row = _first_true(t == block_t)
+                closer = block_t < nearest_t[block]
+                nearest_t[block] = np.where(closer, block_t, nearest_t[block])
+                nearest_id[block] = np.where(closer, group.take(row), nearest_id[block])
+        for index, rays in culled:
+            self.tests[index] += len(rays)
+            t = self.intersect_spheres(self.slot[index:index + 1], take_rows(origins, rays), take_rows(directions, rays))[0]
+            current_t, current_id = nearest_t[rays], nearest_id[rays]
+            closer = (t < current_t) | ((t == current_t) & (t < np.inf) & (index < current_id))
+            nearest_id[rays[closer]] = index
+            nearest_t[rays[closer]] = t[closer]
+        return nearest_id, nearest_t
+
+    def farthest_hit(self, ids, origins, directions):
+        # the farthest of the objects ids for every ray, used for the background spheres
+        count = len(directions)
+        farthest_id = np.full(count, -1, dtype=np.int64)
+        farthest_t = np.full(count, -np.inf)
+        self.tests[ids] += count
+        for group in self._groups(ids):
+            for block in self._blocks(count, len(group)):
+                t = self.intersect_ids(group, origins[block], directions[block])
+                t[t == np.inf] = -np.inf
+                block_t = t.max(axis=0)
+                row = _first_true(t == block_t)
+                farther = block_t > farthest_t[block]
+                farthest_t[block] = np.where(farther, block_t, farthest_t[block])
+                farthest_id[block] = np.where(farther, group.take(row), farthest_id[block])
+        farthest_t[farthest_id < 0] = np.inf
+        return farthest_id, farthest_t
+
+    def first_occluder(self, ids, origins, directions, t_min, t_max):
+        # any-hit query for shadow rays against the objects ids,
+        # for every ray the first of ids (in the given order, the spheres culled per packet
+        # after the others) with t_min < t < t_max, or -1
+        # t_min and t_max are scalars or (N,) arrays
+        # the objects are tested in groups and a ray that is blocked by one group
+        # is not tested against the next ones, which matters for long object lists
+        # the spheres picked by packet_cull come after the groups, for the rays of their packets
+        count = len(directions)
+        blocker = np.full(count, -1, dtype=np.int64)
+        t_min = np.broadcast_to(t_min, count)
+        t_max = np.broadcast_to(t_max, count)
+        ids, culled = self.packet_cull(ids, origins, directions, t_max)
+        todo = None     # None while every ray is still unblocked, to skip the fancy indexing
+        for group in self._groups(ids):
+            rays = np.arange(count) if todo is None else todo
+            self.tests[group] += len(rays)
+            for block in self._blocks(len(rays), len(group)):
+                if todo is None:
+                    block_rays = block
+                    t = self.intersect_ids(group, origins[block], directions[block])
+                else:
+                    block_rays = rays[block]
+                    t = self.intersect_ids(group, take_rows(origins, block_rays), take_rows(directions, block_rays))
+                blocked = t > t_min[block_rays]
+                blocked &= t < t_max[block_rays]
+                blocker[block_rays] = np.where(blocked.any(axis=0), group.take(_first_true(blocked)), -1)
+            todo = rays[blocker[rays] < 0]
+            if len(todo) == 0:
+                return blocker
+        for index, rays in culled:
+            rays = rays[blocker[rays] < 0]
+            if len(rays) == 0:
+                continue
+            self.tests[index] += len(rays)
+            t = self.intersect_spheres(self.slot[index:index + 1], take_rows(origins, rays), take_rows(directions, rays))[0]
+            blocked = (t > t_min[rays]) & (t < t_max[rays])
+            blocker[rays[blocked]] = index
+        return blocker
+
+    def normals(self, ids, points, directions):
+        # the normals at the hit points of the objects ids (one id per ray, -1 for no hit),
+        # with the same rules as Sphere.intersect and Plane.intersect
+        # column-major like the points, the rows of each kind are gathered and put back
+        # column by column (see take_rows and put_rows)
+        normals = np.zeros((len(points), 3), order='F')
+        kind = np.where(ids >= 0, self.kind[np.maximum(ids, 0)], -1)
+        rows = np.flatnonzero(kind == SPHERE)
+        if len(rows):
+            slots = self.slot[ids[rows]]
+            put_rows(normals, rows, sphere_normals(take_rows(self.sphere_centers, slots), self.sphere_inverted[slots],
+                                                   take_rows(points, rows)))
+        rows = np.flatnonzero(kind == PLANE)
+        if len(rows):
+            put_rows(normals, rows, plane_normals(take_rows(self.plane_normals, self.slot[ids[rows]]),
+                                                  take_rows(directions, rows)))
+        return normals
@@ -4,18 +4,27 @@ from Models.Vector3D import Vector3D
 class Pixel:
     # Pixel for 3D scene ray tracing.
     # Represents a pixel on the screen, including its position, color, and other attributes.
-    def __init__(self, x: int, y: int, color: Vector3D):
+    # a pixel returned by Screen.get_pixel is bound to the screen, so its color
+    # is read from and written to the screen's framebuffer
+    def __init__(self, x: int, y: int, color: Vector3D, screen=None):
         # Initialize pixel with position and color.
         self.x = x
         self.y = y
-        self.color = color
+        self.screen = screen
+        if screen is None:
+            self.color = color
         width = 1
         height = 1
 
     def set_color(self, color: Vector3D):
         # Set the pixel's color.
-        self.color = color
+        if self.screen is not None:
+            self.screen.set_pixel_color(self.x, self.y, color)
+        else:
+            self.color = color
 
     def get_color(self) -> Vector3D:
         # Get the pixel's color.
-        return self.color
\ No newline at end of file
+        if self.screen is not None:
+            return self.screen.get_pixel_color(self.x, self.y)
+        return self.color
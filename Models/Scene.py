@@ -1,6 +1,12 @@
+import numpy as np
 from Models.Vector3D import Vector3D
 from Models.Objects.Ray import Ray
+from Models.BVH import BVH
+from Models.PackedScene import PackedScene
+from Models.Objects.Object import take_rows
 BIAS = 1e-4  
+BVH_MIN_OBJECTS = 16        # below this many spheres the linear loop is faster than the tree
+
 class Scene:
     # the Phong midel is used for shading/lighting
     # is basded on some calculations
@@ -24,22 +30,87 @@ class Scene:
         self.point_lights = []
         self.ambient_light = None
         self.background_color = Vector3D(0, 0, 0)  
+        # the BVH over the finite objects, see get_bvh
+        # bvh_method is 'sah', 'median' or None to always use the linear loop
+        self.bvh_method = 'sah'
+        self.bvh = None
+        self.bvh_outside = []       # indices of the objects that are not in the tree
+        # version goes up on every change of the objects, the BVH and the packed
+        # arrays remember the version they were built for and are rebuilt lazily
+        self.version = 0
+        # light_version goes up on every added light, the RayCaster's ShadingTable is
+        # rebuilt when either version changed
+        self.light_version = 0
+        self._bvh_version = -1
+        self._packed = None
+        # the Profiler of main.py --profile, it counts the intersection tests when set
+        self.profiler = None
     
     def add_object(self, obj):
         self.objects.append(obj)
+        self.version += 1
+
+    def invalidate(self):
+        # call this after changing an object, its material or a light in place,
+        # so the BVH, the packed arrays and the shading table are rebuilt before the next render
+        self.version += 1
+
+    def build_bvh(self, method=None):
+        # build the BVH over the finite objects (spheres with a positive radius)
+        # planes are infinite and inverted spheres are the background,
+        # so they stay outside the tree in bvh_outside and are tested linearly
+        # small scenes get no tree, the linear loop is faster for them
+        if method is not None:
+            self.bvh_method = method
+        finite = [i for i, obj in enumerate(self.objects) if hasattr(obj, 'radius') and obj.radius >= 0]
+        if self.bvh_method is None or len(finite) < BVH_MIN_OBJECTS:
+            self.bvh = None
+            self.bvh_outside = list(range(len(self.objects)))
+        else:
+            self.bvh = BVH(self.objects, finite, self.bvh_method)
+            in_tree = set(finite)
+            self.bvh_outside = [i for i in range(len(self.objects)) if i not in in_tree]
+        self._bvh_version = self.version
+        return self.bvh
+
+    def get_bvh(self):
+        # the BVH for the current objects, rebuilt after objects were added
+        # returns None when the scene is traced without a tree
+        if self._bvh_version != self.version:
+            self.build_bvh()
+        return self.bvh
+
+    def get_packed(self):
+        # the PackedScene of the current objects, rebuilt only when the version changed
+        if self._packed is None or self._packed.version != self.version:
+            self._packed = PackedScene(self.objects, self.version)
+        return self._packed
+
+    def prepare(self):
+        # build everything the renderer needs up front, so the build time is not
+        # counted in the first tile and the worker processes get it with the scene
+        self.get_bvh()
+        self.get_packed()
     
     def add_light(self, light):
         self.lights.append(light)
+        self.light_version += 1
         
     def add_point_light(self, point_light):
         # the ponint of light-point formula is different from the light formula
         # so we need to add a new list for point lights
         self.point_lights.append(point_light)
+        self.light_version += 1
     
     def set_ambient_light(self, ambient):
         self.ambient_light = ambient
+        self.light_version += 1
         
-    def find_nearest_intersection(self, ray):
+    def find_nearest_intersection(self, ray, objects=None):
+        bvh = self.get_bvh()
+        if bvh is not None:
+            return self._find_nearest_intersection_bvh(ray, bvh)
+        profiler = self.profiler
         # it may be better if no skip it and rander recognize it as plane
         # For regular objects (positive radius)
         nearest_object = None
@@ -49,7 +120,11 @@ class Scene:
         # Process foreground objects first (positive radius)
         # so if the redius is negative, we skip it
         # this is to avoid the background objects being hit firstq
-        for obj in self.objects:
+        # a camera ray only tests the objects of its screen bin (see ScreenBins),
+        # objects is None for every object
+        if objects is None:
+            objects = self.objects
+        for obj in objects:
             if hasattr(obj, 'radius') and obj.radius < 0:
                 # it may be as a plane, in the firsr scene its good for now 
                 continue
@@ -59,6 +134,8 @@ class Scene:
             # it returns a tuple of (hit, t, hit_point, normal)
             # where hit is a boolean indicating if the ray intersects with the object
             # t is the distance from the ray origin to the intersection point
+            if profiler is not None:
+                profiler.count_tests(obj)
             hit, t, hit_point, normal = obj.intersect(ray)
             # If there is an intersection and it's closer than the current nearest
             # intersection, update the nearest object and its properties
@@ -88,6 +165,8 @@ class Scene:
                 # # so we need to check if the ray intersects with the object
                 # # # if it does, we need to update the farthest_object and farthest_t
                 # # # if it does not, we need to skip it    
+                if profiler is not None:
+                    profiler.count_tests(obj)
                 hit, t, hit_point, normal = obj.intersect(ray)
                 if hit and t > farthest_t:  
                     farthest_object = obj
@@ -101,7 +180,101 @@ class Scene:
         # return the nearest object, its intersection distance, hit point, and normal
         # so we return nearest_object, nearest_t, nearest_point, nearest_normal
         return nearest_object, nearest_t, nearest_point, nearest_normal
+
+    def _find_nearest_intersection_bvh(self, ray, bvh):
+        # the same rules as find_nearest_intersection, but the spheres come from the tree
+        # and only the objects outside it (planes, background spheres) are looped over
+        profiler = self.profiler
+        if profiler is not None:
+            tests = bvh.primitive_tests
+        index, nearest_t, nearest_point, nearest_normal = bvh.intersect(ray)
+        if profiler is not None:
+            # the tree only holds spheres
+            profiler.count('Sphere tests', bvh.primitive_tests - tests)
+        background = []
+        for idx in self.bvh_outside:
+            obj = self.objects[idx]
+            if hasattr(obj, 'radius') and obj.radius < 0:
+                background.append(obj)
+                continue
+            if profiler is not None:
+                profiler.count_tests(obj)
+            hit, t, hit_point, normal = obj.intersect(ray)
+            # on equal t the lower index wins, like the linear loop
+            if hit and (t < nearest_t or (t == nearest_t and idx < index)):
+                index, nearest_t, nearest_point, nearest_normal = idx, t, hit_point, normal
+        if index >= 0:
+            return self.objects[index], nearest_t, nearest_point, nearest_normal
+        # If no foreground hit, use the farthest background object
+        farthest_object, farthest_t = None, -float('inf')
+        for obj in background:
+            if profiler is not None:
+                profiler.count_tests(obj)
+            hit, t, hit_point, normal = obj.intersect(ray)
+            if hit and t > farthest_t:
+                farthest_object, farthest_t = obj, t
+                nearest_point, nearest_normal = hit_point, normal
+        return farthest_object, farthest_t if farthest_object else float('inf'), nearest_point, nearest_normal
+
+    def find_nearest_intersection_batch(self, origins, directions):
+        # the batch version of find_nearest_intersection
+        # origins and directions are (N,3) arrays, one row per ray
+        # it returns (ids, t, P, N) where ids is the index into self.objects
+        # of the object hit by each ray, or -1 when the ray hits nothing
+        # the same rules apply: nearest foreground object first, and only
+        # rays that miss everything fall back to the farthest background object
+        # all the objects of one kind are tested at once through the packed arrays
+        packed = self.get_packed()
+        bvh = self.get_bvh()
+        foreground = packed.foreground_ids
+        if bvh is not None:
+            foreground = np.intersect1d(foreground, self.bvh_outside)
+        profiler = self.profiler
+        if profiler is not None:
+            # the packed arrays count their tests per object, a sphere culled by a ray packet
+            # is not tested against the rays of that packet
+            packed_tests = packed.tests.copy()
+            if bvh is not None:
+                tests = bvh.primitive_tests
+        nearest_id, nearest_t = packed.nearest_hit(foreground, origins, directions)
+        if bvh is not None:
+            # the tree breaks ties by index, so the result does not depend on the visiting order
+            bvh.intersect_batch(origins, directions, nearest_id, nearest_t, packed.intersect_index_batch)
+            if profiler is not None:
+                # the tree only holds spheres
+                profiler.count('Sphere tests', bvh.primitive_tests - tests)
+        miss = np.flatnonzero(nearest_id < 0)
+        if len(packed.background_ids) and len(miss):
+            nearest_id[miss], nearest_t[miss] = packed.farthest_hit(packed.background_ids, take_rows(origins, miss),
+                                                                    take_rows(directions, miss))
+        if profiler is not None:
+            for idx in np.flatnonzero(packed.tests != packed_tests):
+                profiler.count_tests(self.objects[idx], int(packed.tests[idx] - packed_tests[idx]))
+        # hit points and normals only for the winning object of each ray
+        points = origins + directions * np.where(nearest_id >= 0, nearest_t, 0.0)[:, None]
+        normals = packed.normals(nearest_id, points, directions)
+        return nearest_id, nearest_t, points, normals
         
+    def find_occluder(self, ray, t_min, t_max, hint=-1):
+        # any-hit query for shadow rays: the index of an object that blocks the ray
+        # between t_min and t_max, or -1 if the ray reaches t_max unblocked
+        # hint is the index of a likely blocker (the last one found for the same light),
+        # it is tested first because neighbouring shadow rays tend to hit the same object
+        objects = self.objects
+        if hint >= 0 and objects[hint].occludes(ray, t_min, t_max):
+            return hint
+        bvh = self.get_bvh()
+        for idx in (self.bvh_outside if bvh is not None else range(len(objects))):
+            if idx != hint and objects[idx].occludes(ray, t_min, t_max):
+                return idx
+        if bvh is not None:
+            return bvh.find_occluder(ray, t_min, t_max)
+        return -1
+
+    def intersect_index_batch(self, index, origins, directions):
+        # (hit, t) of the object at index for (N,3) arrays of rays, used by the BVH leaves
+        return self.get_packed().intersect_index_batch(index, origins, directions)
+
     def is_in_shadow(self, P, L, max_dist):
         # so what is the perpose of this method ?
         # it is to check if the point P is in shadow of any object
@@ -16,12 +16,21 @@ class Screen:
         self.width = width
         self.height = height
         # Initialize pixels with black color
-        self.pixels = [[Pixel(i, j, Vector3D(0, 0, 0)) for j in range(height)] for i in range(width)]
+        # the pixels are one contiguous float32 (height, width, 3) framebuffer,
+        # row-major like the image, instead of a Pixel object per pixel
+        self.buffer = np.zeros((height, width, 3), dtype=np.float32)
         # Default pixel size (in world units)
         # 2.0 because screen goes from -1 to 1 (width of 2)
         self.pixel_width = 2.0 / width
         self.pixel_height = 2.0 / height
 
+    def use_buffer(self, buffer):
+        # Render into an existing (height, width, 3) float32 array instead of the own framebuffer,
+        # for example a memory map of the output file, so every finished tile is written in place.
+        if buffer.shape != (self.height, self.width, 3):
+            raise ValueError(f"Framebuffer of shape {buffer.shape} does not fit a {self.width}x{self.height} screen")
+        self.buffer = buffer
+
     def set_position(self, position_vector):
         # Set the screen's position in 3D space.
         self.position = position_vector
@@ -44,14 +53,39 @@ class Screen:
 
     def get_pixel(self, x, y):
         # Get the pixel at the specified coordinates.
+        # the returned Pixel is a view on the framebuffer
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return Pixel(x, y, None, screen=self)
+        else:
+            raise IndexError(f"Pixel coordinates ({x}, {y}) out of bounds")
+
+    def get_pixel_color(self, x, y):
+        # Get the color of the pixel at the specified coordinates.
         if 0 <= x < self.width and 0 <= y < self.height:
-            return self.pixels[x][y]
+            r, g, b = self.buffer[y, x]
+            return Vector3D(r, g, b)
         else:
             raise IndexError(f"Pixel coordinates ({x}, {y}) out of bounds")
 
     def set_pixel_color(self, x, y, color):
         # Set the color of the pixel at the specified coordinates.
         if 0 <= x < self.width and 0 <= y < self.height:
-            self.pixels[x][y].set_color(color)
+            self.buffer[y, x] = (color.x, color.y, color.z)
         else:
             raise IndexError(f"Pixel coordinates ({x}, {y}) out of bounds")
+
+    def set_row(self, y, colors):
+        # Set the colors of a whole row from a (width, 3) array.
+        if 0 <= y < self.height:
+            self.buffer[y] = colors
+        else:
+            raise IndexError(f"Row {y} out of bounds")
+
+    def set_tile(self, x0, y0, colors):
+        # Set the colors of a rectangle of pixels from an (h, w, 3) array,
+        # (x0, y0) is the top-left pixel of the rectangle.
+        h, w = colors.shape[:2]
+        if 0 <= x0 and 0 <= y0 and x0 + w <= self.width and y0 + h <= self.height:
+            self.buffer[y0:y0 + h, x0:x0 + w] = colors
+        else:
+            raise IndexError(f"Tile ({x0}, {y0}) of {w}x{h} pixels out of bounds")
@@ -0,0 +1,98 @@
+import math
+
+BIN_SIZE = 16       # pixels per side of a bin
+BIN_MARGIN = 1.0    # pixels added around the outline of every sphere, far more than any rounding
+
+class ScreenBins:
+    # ScreenBins splits the screen into BIN_SIZE x BIN_SIZE pixel bins and keeps for every bin
+    # the list of the foreground objects that a camera ray of the bin can hit
+    # so why do we need it ?
+    # Scene.find_nearest_intersection tests every object for every pixel, but a sphere
+    # is seen only inside its outline on the screen, a small sphere covers a few bins and
+    # the pixels of all the other bins do not have to test it at all
+    # so how is the outline of a sphere found ?
+    # in camera space (the right, up and back axes of RayCaster.basis) the ray of a pixel goes
+    # through (px, py, -1), see RayCaster.generate_ray
+    # the rays with one px value make a plane through the camera, and that plane touches the
+    # sphere for exactly two values of px (a quadratic), between them the rays can hit it,
+    # the same for py, and that gives the rectangle of pixels around the outline
+    # a sphere that reaches behind the camera could be seen in any direction and goes in
+    # every bin, a sphere completely behind the camera goes in none
+    # planes are infinite and go in every bin, the background (inverted) spheres are in no
+    # bin, find_nearest_intersection only tests them when no foreground object was hit
+    # the lists keep the order of scene.objects, so a tie goes to the same object as without bins
+    # it is made for one camera, one screen and one version of the objects, key is what
+    # RayCaster.get_bins made it for (see RayCaster.bins_key), a different key rebuilds it
+    def __init__(self, objects, position, basis, width, height, aspect, scale, key=None, enabled=True):
+        self.key = key
+        self.columns = -(-width // BIN_SIZE)
+        self.rows = -(-height // BIN_SIZE)
+        # enabled is False for a scene traced through a BVH, then every pixel tests all the objects
+        if not enabled:
+            self.bins = None
+            return
+        self.bins = [[[] for _ in range(self.columns)] for _ in range(self.rows)]
+        if basis is None:
+            axes = ((1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0))
+        else:
+            axes = tuple(tuple(float(v) for v in row) for row in basis)
+        everywhere = (0, self.rows - 1, 0, self.columns - 1)
+        for obj in objects:
+            if not hasattr(obj, 'radius'):
+                area = everywhere
+            elif obj.radius < 0:
+                continue
+            else:
+                area = self.sphere_bins(obj, position, axes, width, height, aspect, scale)
+                if area is None:
+                    continue
+            row0, row1, column0, column1 = area
+            for row in self.bins[row0:row1 + 1]:
+                for column in row[column0:column1 + 1]:
+                    column.append(obj)
+
+    def sphere_bins(self, sphere, position, axes, width, height, aspect, scale):
+        # the (first row, last row, first column, last column) of the bins a sphere can be seen in,
+        # None when it can not be seen at all
+        cx = sphere.center.x - position.x
+        cy = sphere.center.y - position.y
+        cz = sphere.center.z - position.z
+        right, up, back = ((a[0] * cx + a[1] * cy + a[2] * cz) for a in axes)
+        # depth is the distance of the centre in front of the camera
+        depth = -back
+        r = sphere.abs_radius
+        slack = 1e-9 * (abs(depth) + r)
+        if depth + r < -slack:
+            return None
+        if depth - r <= slack:
+            return (0, self.rows - 1, 0, self.columns - 1)
+        px_low, px_high = self.tangents(right, depth, r)
+        py_low, py_high = self.tangents(up, depth, r)
+        # from px and py back to pixel coordinates, the inverse of generate_ray
+        i_low = (px_low / (aspect * scale) + 1.0) * width / 2.0 - 0.5 - BIN_MARGIN
+        i_high = (px_high / (aspect * scale) + 1.0) * width / 2.0 - 0.5 + BIN_MARGIN
+        j_low = (1.0 - py_high / scale) * height / 2.0 - 0.5 - BIN_MARGIN
+        j_high = (1.0 - py_low / scale) * height / 2.0 - 0.5 + BIN_MARGIN
+        if i_high < 0 or j_high < 0 or i_low > width - 1 or j_low > height - 1:
+            return None
+        column0 = max(0, math.floor(i_low)) // BIN_SIZE
+        column1 = min(width - 1, math.ceil(i_high)) // BIN_SIZE
+        row0 = max(0, math.floor(j_low)) // BIN_SIZE
+        row1 = min(height - 1, math.ceil(j_high)) // BIN_SIZE
+        return (row0, row1, column0, column1)
+
+    @staticmethod
+    def tangents(offset, depth, r):
+        # the two slopes p of the planes through the camera that touch a sphere at
+        # (offset, depth) along one screen axis, the roots of
+        # (depth ** 2 - r ** 2) p ** 2 - 2 offset depth p + offset ** 2 - r ** 2 = 0
+        # (depth > r, so the sphere is in front of the camera and there are two)
+        root = r * math.sqrt(offset * offset + depth * depth - r * r)
+        denominator = depth * depth - r * r
+        return (offset * depth - root) / denominator, (offset * depth + root) / denominator
+
+    def objects(self, i, j):
+        # the objects a camera ray through pixel (i, j) can hit, None for all of them
+        if self.bins is None:
+            return None
+        return self.bins[j // BIN_SIZE][i // BIN_SIZE]
@@ -0,0 +1,71 @@
+
+class ShadingTable:
+    # ShadingTable holds the shading constants of a scene as plain floats
+    # so why do we need it ?
+    # RayCaster.shade used to work them out again for every pixel: the ambient term
+    # (ambient intensity * multiplier * diffuse color * ambient coef), the list of all the
+    # lights (scene.lights + scene.point_lights), hasattr(light, 'get_distance') per light
+    # and the negated direction of every directional light
+    # none of these depend on the hit point, so they are baked here once and
+    # shade only does the work that does depend on it
+    # the lights are a flat table, one tuple per light in the order of the shadow cache:
+    #   (index, is_point, x, y, z, L, red, green, blue, linear, quadratic, area)
+    #   for a point light x, y, z is its position and L is None,
+    #   for a directional light x, y, z is the unit direction towards the light and L is
+    #   the same as a Vector3D (for the shadow ray), linear and quadratic are 0
+    #   area is the light itself for an AreaLight (a point light with soft shadows), else None
+    # the material constants are (ambient red, green, blue, color red, green, blue, diffuse coef,
+    # specular, table row, shininess, cutoff), made the first time a material is shaded,
+    # so a scene with millions of objects does not pay for the materials that are never hit
+    # specular is specular coef * specular_scale, 0 when there is no SpecularTable (highlights off),
+    # the row and the cutoff are the ones of the material's shininess in that table
+    # the products are the same as the ones shade used to do, in the same order,
+    # so the colors do not change by a single bit
+    def __init__(self, scene, ambient_multiplier, version=None, specular=None, specular_scale=0.0):
+        self.version = version
+        self.specular = specular
+        self.specular_scale = specular_scale
+        ambient = scene.ambient_light
+        if ambient:
+            intensity = ambient.intensity
+            self.ambient = (intensity.x * ambient_multiplier, intensity.y * ambient_multiplier,
+                            intensity.z * ambient_multiplier)
+        else:
+            self.ambient = None
+        self.lights = []
+        for index, light in enumerate(scene.lights + scene.point_lights):
+            intensity = light.intensity
+            if hasattr(light, 'position'):
+                # Quadratic attenuation: I = I0 / (1 + a*d + b*d²), same as PointLight.get_intensity
+                p = light.position
+                area = light if hasattr(light, 'sample_points') else None
+                self.lights.append((index, True, p.x, p.y, p.z, None, intensity.x, intensity.y, intensity.z,
+                                    light.attenuation, light.attenuation * 0.1, area))
+            else:
+                L = light.get_direction(None)
+                self.lights.append((index, False, L.x, L.y, L.z, L, intensity.x, intensity.y, intensity.z,
+                                    0.0, 0.0, None))
+        self.materials = {}
+
+    def material(self, material):
+        # the constants of a material, see above
+        constants = self.materials.get(material)
+        if constants is None:
+            color = material.diffuse_color
+            if self.ambient is None:
+                ambient = (0.0, 0.0, 0.0)
+            else:
+                ar, ag, ab = self.ambient
+                ka = material.ambient_coef
+                ambient = (ar * color.x * ka, ag * color.y * ka, ab * color.z * ka)
+            if self.specular is None or material.specular_coef <= 0:
+                highlight = (0.0, -1, 0.0, 1.0)
+            else:
+                shininess = material.shininess
+                row = self.specular.row(shininess)
+                highlight = (material.specular_coef * self.specular_scale, row,
+                             shininess, self.specular.row_cutoff(row, shininess))
+            constants = (*ambient, color.x, color.y, color.z, material.diffuse_coef, *highlight)
+            self.materials[material] = constants
+        return constants
+
@@ -0,0 +1,82 @@
+import numpy as np
+
+SPECULAR_CUTOFF = 1.0 / 512     # highlights weaker than this (before ks and the light) are skipped
+TABLE_SIZE = 2048               # samples of x ** shininess between the cutoff and 1
+MAX_TABLES = 256                # distinct shininess values with a table, any others use ** directly
+
+def specular_cutoffs(shininess):
+    # the V . R below which x ** shininess < SPECULAR_CUTOFF, per shininess value
+    # (0 for a shininess <= 0, the highlight is then 1 for every x >= 0)
+    shininess = np.asarray(shininess, dtype=np.float64)
+    cutoff = np.zeros(shininess.shape)
+    positive = shininess > 0
+    cutoff[positive] = SPECULAR_CUTOFF ** (1.0 / shininess[positive])
+    return cutoff
+
+class SpecularTable:
+    # SpecularTable replaces max(0, V . R) ** shininess of the Phong specular term by a lookup
+    # so how is it built ?
+    # every distinct shininess gets one row of TABLE_SIZE samples of x ** shininess, for x
+    # evenly from its cutoff to 1, and a value x is read by linear interpolation between
+    # the two samples around it, that is within 2e-6 of ** (far below one 8-bit step)
+    # the error of the linear interpolation grows with the curvature of x ** shininess,
+    # between the cutoff and 1 that is about the same for every shininess >= 1, but below 1
+    # the curve is steep near 0, so a shininess under 1 has no row and uses **
+    # below the cutoff the highlight is less than SPECULAR_CUTOFF and it is not computed
+    # at all, which is most of the points for a shiny material
+    # the rows are found with row(), PackedScene keeps the row of every object
+    # there are at most MAX_TABLES rows, a scene with more distinct shininess values
+    # gets row -1 for the rest and those use ** (a scene with a million random values
+    # would otherwise need a million rows)
+    def __init__(self, shininess_values):
+        values = np.unique(np.asarray(shininess_values, dtype=np.float64))
+        values = values[values >= 1.0][:MAX_TABLES]
+        self.shininess = values
+        self.rows = {float(n): k for k, n in enumerate(values)}
+        self.cutoff = specular_cutoffs(values)
+        # samples per unit of x, to turn x - cutoff into a sample position
+        self.scale = (TABLE_SIZE - 1) / (1.0 - self.cutoff)
+        xs = self.cutoff[:, None] + (1.0 - self.cutoff)[:, None] * np.linspace(0.0, 1.0, TABLE_SIZE)[None, :]
+        self.table = xs ** values[:, None]
+        self.flat = self.table.ravel()
+        # the same numbers as python lists and floats for the scalar path,
+        # arithmetic on numpy scalars is several times slower
+        self.lists = self.table.tolist()
+        self.cutoff_list = self.cutoff.tolist()
+        self.scale_list = self.scale.tolist()
+
+    def row(self, shininess):
+        # the table row of a shininess, -1 when it has none
+        return self.rows.get(float(shininess), -1)
+
+    def row_cutoff(self, row, shininess):
+        # the cutoff of a row, worked out for a shininess that has no row
+        if row < 0:
+            return float(specular_cutoffs(shininess))
+        return self.cutoff_list[row]
+
+    def power(self, row, shininess, x):
+        # x ** shininess for one x above the cutoff of the row
+        if row < 0:
+            return x ** shininess
+        f = (x - self.cutoff_list[row]) * self.scale_list[row]
+        i = int(f)
+        samples = self.lists[row]
+        if i >= TABLE_SIZE - 1:
+            return samples[-1]
+        return samples[i] + (samples[i + 1] - samples[i]) * (f - i)
+
+    def power_batch(self, rows, x):
+        # power for arrays of rows and x values (above their cutoffs), every row must be >= 0,
+        # PackedScene.specular_power does the objects without a row
+        if len(self.cutoff_list) == 1:
+            # one shininess in the scene, every row is 0 and nothing has to be gathered per row
+            f = np.minimum((x - self.cutoff_list[0]) * self.scale_list[0], TABLE_SIZE - 1.0)
+            flat = i = np.minimum(f.astype(np.int64), TABLE_SIZE - 2)
+        else:
+            f = np.minimum((x - self.cutoff[rows]) * self.scale[rows], TABLE_SIZE - 1.0)
+            i = np.minimum(f.astype(np.int64), TABLE_SIZE - 2)
+            # one gather from the flat table is cheaper than table[rows, i]
+            flat = rows * TABLE_SIZE + i
+        low = self.flat.take(flat)
+        return low + (self.flat.take(flat + 1) - low) * (f - i)
@@ -1,24 +1,83 @@
 import math
 
+_new = object.__new__
+
+def _make(x, y, z):
+    # the fast constructor used inside this module and the hot paths
+    # it skips __init__ and the float() coercion, so the caller must pass floats
+    # (the result of arithmetic on the components of other vectors always is one)
+    v = _new(Vector3D)
+    v.x = x
+    v.y = y
+    v.z = z
+    return v
+
 class Vector3D:
     # This class represents a 3D vector using x, y, and z components.
+    # __slots__ keeps the object small (no __dict__) and makes attribute access faster,
+    # the ray tracer creates millions of these per frame
+    __slots__ = ('x', 'y', 'z')
+
     def __init__(self, x, y, z):
         # Initialize a vector with x, y, z components.
+        # the public constructor converts to float, so ints and numpy scalars are accepted
         self.x = float(x)
         self.y = float(y)
         self.z = float(z)
 
+    @staticmethod
+    def fast(x, y, z):
+        # Create a vector without the float() coercion of the constructor.
+        # Only for floats, e.g. values computed from other vectors' components.
+        return _make(x, y, z)
+
+    def copy(self):
+        # A new vector with the same components, useful before the in-place methods.
+        return _make(self.x, self.y, self.z)
+
     def add(self, other):
         # Add two vectors component-wise.
-        return Vector3D(self.x + other.x, self.y + other.y, self.z + other.z)
+        return _make(self.x + other.x, self.y + other.y, self.z + other.z)
 
     def subtract(self, other):
         # Subtract another vector from this one, component-wise.
-        return Vector3D(self.x - other.x, self.y - other.y, self.z - other.z)
+        return _make(self.x - other.x, self.y - other.y, self.z - other.z)
 
     def scalar_multiply(self, scalar):
         # Multiply this vector by a scalar (single number).
-        return Vector3D(self.x * scalar, self.y * scalar, self.z * scalar)
+        return _make(self.x * scalar, self.y * scalar, self.z * scalar)
+
+    def add_scaled(self, other, scalar):
+        # self + other * scalar in one step, with one new vector instead of two.
+        # e.g. the point along a ray: origin.add_scaled(direction, t)
+        return _make(self.x + other.x * scalar, self.y + other.y * scalar, self.z + other.z * scalar)
+
+    def hadamard_scaled(self, other, scalar):
+        # self.hadamard(other).scalar_multiply(scalar) with one new vector instead of two.
+        # e.g. light intensity * surface color * coefficient in the shading code
+        return _make(self.x * other.x * scalar, self.y * other.y * scalar, self.z * other.z * scalar)
+
+    def iadd(self, other):
+        # In-place addition: adds other to this vector and returns it.
+        # Only use it on vectors you own (not on a light's intensity or a shared constant).
+        self.x += other.x
+        self.y += other.y
+        self.z += other.z
+        return self
+
+    def iadd_scaled(self, other, scalar):
+        # In-place self += other * scalar, returns this vector.
+        self.x += other.x * scalar
+        self.y += other.y * scalar
+        self.z += other.z * scalar
+        return self
+
+    def imul_scalar(self, scalar):
+        # In-place multiplication by a scalar, returns this vector.
+        self.x *= scalar
+        self.y *= scalar
+        self.z *= scalar
+        return self
 
     def scalar_projection(self, other):
         # The scalar projection (also called the component) of this vector onto another vector (other)
@@ -44,9 +103,9 @@ class Vector3D:
     def cross_product(self, other):
         # The cross product of two vectors results in a new vector that is
         # perpendicular to both original vectors.
-        return Vector3D(self.y * other.z - self.z * other.y,
-                      self.z * other.x - self.x * other.z,
-                      self.x * other.y - self.y * other.x)
+        return _make(self.y * other.z - self.z * other.y,
+                     self.z * other.x - self.x * other.z,
+                     self.x * other.y - self.y * other.x)
 
     def dot_product(self, other):
         # The dot product (scalar product) returns a number (scalar) based on the angle between two vectors.
@@ -67,15 +126,15 @@ class Vector3D:
         # so what is the purpose of magnitude?
         # The magnitude is used to understand the size of the vector,
         # which is important in many applications like physics simulations, graphics, and more.
-        return math.sqrt(self.x ** 2 + self.y ** 2 + self.z ** 2)
+        return math.sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
 
     def normalize(self):
         # Normalize the vector (make it length 1) by dividing by its magnitude.
         # Useful for direction-only purposes.
-        mag = self.magnitude()
+        mag = math.sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
         if mag == 0:
-            return Vector3D(0, 0, 0)
-        return Vector3D(self.x / mag, self.y / mag, self.z / mag)
+            return _make(0.0, 0.0, 0.0)
+        return _make(self.x / mag, self.y / mag, self.z / mag)
 
     def cosine(self, other):
         # Computes the cosine of the angle between two vectors.
@@ -141,7 +200,7 @@ class Vector3D:
         eta_ratio = etai / etat
         k = 1 - eta_ratio**2 * (1 - cosi**2)
         if k < 0:
-            return Vector3D(0, 0, 0) 
+            return _make(0.0, 0.0, 0.0)
         return self.scalar_multiply(eta_ratio).add(n.scalar_multiply(eta_ratio * cosi - math.sqrt(k)))
 
     def hadamard(self, other):
@@ -153,7 +212,7 @@ class Vector3D:
         # For example, if you have two RGB colors represented as vectors,
         # i can use this method to compute the resulting color by multiplying each component.
         # It returns a new vector where each component is the product of the corresponding components of the two vectors.
-        return Vector3D(self.x * other.x, self.y * other.y, self.z * other.z)
+        return _make(self.x * other.x, self.y * other.y, self.z * other.z)
 
     def clamp(self, min_val=0.0, max_val=1.0):
         # Clamp each component of the vector within [min_val, max_val].
@@ -175,7 +234,17 @@ class Vector3D:
         # Computes the distance between this vector and another vector.
         # It uses the Euclidean distance formula:
         # distance = √((x2 - x1)² + (y2 - y1)² + (z2 - z1)²)
-        return (self - other).magnitude()
+        dx, dy, dz = self.x - other.x, self.y - other.y, self.z - other.z
+        return math.sqrt(dx * dx + dy * dy + dz * dz)
+
+    def direction_to(self, other):
+        # The unit vector pointing from this point to other,
+        # the same as other.subtract(self).normalize() with one new vector instead of two.
+        dx, dy, dz = other.x - self.x, other.y - self.y, other.z - self.z
+        mag = math.sqrt(dx * dx + dy * dy + dz * dz)
+        if mag == 0:
+            return _make(0.0, 0.0, 0.0)
+        return _make(dx / mag, dy / mag, dz / mag)
 
     def angle_with(self, other):
         # the angel with another vector in radians.
@@ -205,7 +274,7 @@ class Vector3D:
 
     def negate(self):
         # Negates the vector (flips its direction).
-        return Vector3D(-self.x, -self.y, -self.z)
+        return _make(-self.x, -self.y, -self.z)
     
     # Operator Overloads
 
@@ -227,7 +296,7 @@ class Vector3D:
 
     def __truediv__(self, scalar):
         # Allows vector / scalar
-        return Vector3D(self.x / scalar, self.y / scalar, self.z / scalar)
+        return _make(self.x / scalar, self.y / scalar, self.z / scalar)
 
     def __repr__(self):
         # Nicely formats the vector when printed
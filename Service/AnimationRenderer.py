@@ -0,0 +1,167 @@
+import os
+import math
+import time
+import pickle
+import multiprocessing
+from Models.Vector3D import Vector3D
+from Models.Camera import Camera
+from Models.Screen import Screen
+from Service.RayCaster import RayCaster, MAX_DEPTH
+from Service.TileRenderer import trace_tile_pixels
+from Handler.ScreenHandler import save_colors
+
+# the animation state of a worker process, set once by _init_worker
+_worker_animation = None
+
+class Keyframe:
+    # one camera keyframe: at time t the camera is at position, looks along direction
+    # (a direction, like the v line of a scene file) with the vertical field of view fov
+    def __init__(self, t, position, direction, fov):
+        self.t = t
+        self.position = position
+        self.direction = direction.normalize()
+        self.fov = fov
+
+def parse_keyframes(path, default_fov):
+    # the keyframes of a camera path file, sorted by time
+    # every keyframe is a line in the same style as the scene files:
+    #k 0.0   0.0 0.0 4.0   0.0 0.0 -1.0   60     # k time, position, view direction, fov
+    #k 2.0   1.5 0.5 3.0  -0.4 -0.1 -1.0         # the fov can be left out, the scene's fov is used
+    keyframes = []
+    with open(path, 'r') as f:
+        for number, line in enumerate(f, 1):
+            L = line.split('#')[0].strip()
+            if not L:
+                continue
+            parts = L.split()
+            if parts[0] != 'k' or len(parts) not in (8, 9):
+                raise ValueError(f"{path}:{number}: expected 'k t px py pz vx vy vz [fov]'")
+            vals = [float(x) for x in parts[1:]]
+            fov = vals[7] if len(vals) > 7 else default_fov
+            keyframes.append(Keyframe(vals[0], Vector3D(*vals[1:4]), Vector3D(*vals[4:7]), fov))
+    if not keyframes:
+        raise ValueError(f"{path}: no keyframes")
+    keyframes.sort(key=lambda key: key.t)
+    return keyframes
+
+def slerp(a, b, s):
+    # the unit direction a fraction s of the way from a to b along the great circle,
+    # so the camera turns at an even speed
+    cosine = max(-1.0, min(1.0, a.dot_product(b)))
+    angle = math.acos(cosine)
+    if angle < 1e-9:
+        return a
+    sine = math.sin(angle)
+    return a.scalar_multiply(math.sin((1 - s) * angle) / sine).add(b.scalar_multiply(math.sin(s * angle) / sine)).normalize()
+
+def interpolate(keyframes, t):
+    # the (position, direction, fov) of the camera at time t
+    # the position and the fov are linear between the two keyframes around t,
+    # the direction turns between them with slerp
+    # before the first keyframe and after the last one the camera stands still
+    if t <= keyframes[0].t:
+        key = keyframes[0]
+        return key.position, key.direction, key.fov
+    for a, b in zip(keyframes, keyframes[1:]):
+        if t == b.t:
+            # a frame at a keyframe is that keyframe, the lerp and slerp at s = 1
+            # can be off from it in the last bit
+            return b.position, b.direction, b.fov
+        if t < b.t:
+            s = (t - a.t) / (b.t - a.t)
+            position = a.position.add(b.position.subtract(a.position).scalar_multiply(s))
+            return position, slerp(a.direction, b.direction, s), a.fov + (b.fov - a.fov) * s
+    key = keyframes[-1]
+    return key.position, key.direction, key.fov
+
+def frame_times(keyframes, frames):
+    # the times of the frames, evenly from the first keyframe to the last one
+    first, last = keyframes[0].t, keyframes[-1].t
+    if frames == 1:
+        return [first]
+    return [first + (last - first) * k / (frames - 1) for k in range(frames)]
+
+def _init_worker(payload):
+    # runs once in every worker process, the scene with its BVH and packed arrays
+    # is unpickled here once and then shared by all the frames of the worker
+    global _worker_animation
+    _worker_animation = pickle.loads(payload)
+
+def _render_worker_frame(index):
+    return _worker_animation.render_frame(index)
+
+class AnimationRenderer:
+    # AnimationRenderer renders a camera fly-through of one scene as a numbered PNG sequence
+    # so what is shared between the frames ?
+    # only the camera moves, so the Scene (objects, lights), its BVH and its packed arrays
+    # (geometry and material tables) are built once and used by every frame,
+    # a frame only makes a new Camera, Screen and RayCaster, which is cheap
+    # the frames are independent, so with workers > 1 they are farmed out to a process pool:
+    # every worker gets the pickled renderer once and then only frame numbers,
+    # and it writes its frames to disk itself, so no image goes back to the parent
+    # the camera of a frame comes from interpolate(), and the rays follow its view direction
+    # through RayCaster.basis
+    def __init__(self, scene, keyframes, frames, width, height, aspect, up, batch=True, sampler=None,
+                 folder='frames', prefix='frame', max_depth=MAX_DEPTH, specular=False):
+        if frames < 1:
+            raise ValueError("Number of frames must be at least 1.")
+        self.scene = scene
+        self.keyframes = keyframes
+        self.frames = frames
+        self.times = frame_times(keyframes, frames)
+        self.width = width
+        self.height = height
+        self.aspect = aspect
+        self.up = up
+        self.batch = batch
+        self.sampler = sampler
+        self.folder = folder
+        self.prefix = prefix
+        self.max_depth = max_depth
+        self.specular = specular
+        # enough digits for the last frame number, at least 4
+        self.digits = max(4, len(str(frames - 1)))
+
+    def filename(self, index):
+        return os.path.join(self.folder, f"{self.prefix}_{index:0{self.digits}d}.png")
+
+    def caster(self, index):
+        # the RayCaster of frame index, on the shared scene
+        position, direction, fov = interpolate(self.keyframes, self.times[index])
+        camera = Camera(position, direction, self.up, fov, self.aspect)
+        screen = Screen(position, direction, self.up, fov, self.aspect, self.width, self.height)
+        caster = RayCaster(camera, screen, self.scene)
+        caster.basis = camera.view_basis()
+        caster.sampler = self.sampler
+        caster.max_depth = self.max_depth
+        caster.specular = self.specular
+        return caster
+
+    def render_frame(self, index):
+        # render and save one frame, returns (index, filename, seconds)
+        start = time.perf_counter()
+        caster = self.caster(index)
+        if self.batch:
+            colors = caster.render_batch()
+        else:
+            colors = trace_tile_pixels(caster, 0, 0, self.width, self.height)
+        filename = self.filename(index)
+        save_colors(colors, filename)
+        return index, filename, time.perf_counter() - start
+
+    def render(self, workers=1):
+        # render all the frames, yield (index, filename, seconds) as the frames finish
+        if workers < 1:
+            raise ValueError("Number of workers must be at least 1.")
+        os.makedirs(self.folder, exist_ok=True)
+        # build the shared structures once, before the scene is pickled for the workers
+        self.scene.prepare()
+        if workers == 1:
+            for index in range(self.frames):
+                yield self.render_frame(index)
+            return
+        payload = pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(payload,)) as pool:
+            # chunksize 1 so a worker that finishes early picks up the next frame
+            for result in pool.imap_unordered(_render_worker_frame, range(self.frames), chunksize=1):
+                yield result
@@ -0,0 +1,92 @@
+import os
+import time
+import hashlib
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FORMAT = 2   # bump when the sidecar layout or the render settings in the key change
+DEFAULT_CHECKPOINT_INTERVAL = 30.0  # seconds between two saves of the finished tiles
+
+def checkpoint_key(scene_key, settings):
+    # the name of the sidecar: the hash of the scene (the scene cache key of the file)
+    # and of every render setting that changes a pixel or the tile split
+    digest = hashlib.sha256()
+    digest.update(repr((CHECKPOINT_FORMAT, scene_key, sorted(settings.items()))).encode())
+    return digest.hexdigest()
+
+class Checkpoint:
+    # Checkpoint keeps a long tiled render on disk so a killed render can be resumed
+    # so what is in the sidecar ?
+    # two .npy files next to each other:
+    #   <key>.checkpoint.npy       - the (height, width, 3) float32 framebuffer, memory mapped,
+    #                                the screen renders straight into it
+    #   <key>.checkpoint-tiles.npy - one flag per tile, True once the tile is safely on disk
+    # the flags are written only in save(), after the framebuffer was flushed, so a flag
+    # never points at pixels that are still only in memory. a tile that finished after
+    # the last save is simply rendered again on resume
+    # the key comes from the scene file and the render settings, so a resume with another
+    # scene, resolution, tile size or sampling never mixes tiles of two different renders
+    def __init__(self, folder, key, width, height, tiles, interval=DEFAULT_CHECKPOINT_INTERVAL):
+        self.pixels_path = os.path.join(folder, f"{key}.checkpoint.npy")
+        self.done_path = os.path.join(folder, f"{key}.checkpoint-tiles.npy")
+        self.width = width
+        self.height = height
+        self.tiles = tiles
+        self.index = {tile: i for i, tile in enumerate(tiles)}
+        self.interval = interval
+        self.pixels = None
+        self.done = None
+        self.pending = []
+        self.last_save = time.perf_counter()
+
+    def open(self, resume=False):
+        # open the sidecar and return the framebuffer to render into
+        # with resume an existing sidecar of the same key is used as it is,
+        # otherwise (or when it does not fit) a new empty one is made
+        os.makedirs(os.path.dirname(self.pixels_path) or '.', exist_ok=True)
+        if resume and os.path.exists(self.pixels_path) and os.path.exists(self.done_path):
+            try:
+                pixels = np.load(self.pixels_path, mmap_mode='r+')
+                done = np.load(self.done_path, mmap_mode='r+')
+                if pixels.shape == (self.height, self.width, 3) and done.shape == (len(self.tiles),):
+                    self.pixels, self.done = pixels, done
+                    return self.pixels
+                logger.warning("Checkpoint %s does not fit this render, starting over", self.pixels_path)
+            except (OSError, ValueError) as error:
+                logger.warning("Ignoring unreadable checkpoint %s: %s", self.pixels_path, error)
+        self.pixels = np.lib.format.open_memmap(self.pixels_path, mode='w+', dtype=np.float32,
+                                                shape=(self.height, self.width, 3))
+        self.done = np.lib.format.open_memmap(self.done_path, mode='w+', dtype=bool, shape=(len(self.tiles),))
+        return self.pixels
+
+    def remaining(self):
+        # the tiles that still have to be rendered
+        return [tile for tile, done in zip(self.tiles, self.done) if not done]
+
+    def finished(self):
+        return int(np.count_nonzero(self.done))
+
+    def finish_tile(self, tile):
+        # the pixels of tile are in the framebuffer, they count as done at the next save
+        self.pending.append(self.index[tile])
+        if time.perf_counter() - self.last_save >= self.interval:
+            self.save()
+
+    def save(self):
+        # pixels first, then the flags of the tiles that are now on disk
+        if self.pending:
+            self.pixels.flush()
+            self.done[self.pending] = True
+            self.done.flush()
+            self.pending = []
+        self.last_save = time.perf_counter()
+
+    def remove(self):
+        # the render finished and was saved, the sidecar is not needed any more
+        for path in (self.pixels_path, self.done_path):
+            try:
+                os.remove(path)
+            except OSError as error:
+                logger.warning("Could not remove the checkpoint %s: %s", path, error)
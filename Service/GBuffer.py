@@ -0,0 +1,141 @@
+import os
+import hashlib
+import numpy as np
+from Service.RayCaster import BATCH_SIZE
+
+GBUFFER_FORMAT = 2  # bump when the arrays or the shading formula change
+SHADE_BLOCK = 8192  # pixels re-shaded together, small enough to stay in the CPU cache
+
+class GBuffer:
+    # GBuffer keeps the geometry half of a batch render so the frame can be re-shaded
+    # so what is in it ?
+    # for every pixel: the id of the object it hits (-1 for the background), t, the hit
+    # point P and the normal N, and for every light over the pixels that hit something:
+    # max(0, N . L), the point light attenuation, whether the shadow ray was blocked
+    # (the blocked fraction for an area light)
+    # and V . R when the caster renders specular highlights
+    # that is everything RayCaster.shade_gbuffer needs, so after a change of the object
+    # colors or coefficients (c lines), the light intensities (i lines), the ambient light
+    # or the background, shade() gives the new frame with array math only, no ray is traced
+    # anything that moves a ray (objects, camera, resolution, light positions and directions)
+    # changes geometry_key, and a G-buffer with another key must not be used
+    # anti-aliasing is not covered: one ray per pixel, through its centre
+    # and neither are reflective or transparent materials, only the primary hits are kept
+    def __init__(self, width, height, ids, t, points, normals, lights, key=None):
+        self.width = width
+        self.height = height
+        self.ids = ids
+        self.t = t
+        self.points = points
+        self.normals = normals
+        # per light (lambert, factor or None, shadowed, highlight or None), over the pixels with ids >= 0
+        self.lights = lights
+        self.key = key
+
+    @staticmethod
+    def capture(caster):
+        # trace the whole screen of the caster and keep the geometry half of the render
+        width, height = caster.screen.width, caster.screen.height
+        origins, directions = caster.generate_rays(0, 0, width, height)
+        chunks = []
+        caster.reset_shadow_cache()
+        for start in range(0, len(directions), BATCH_SIZE):
+            chunks.append(caster.gbuffer_batch(origins[start:start + BATCH_SIZE], directions[start:start + BATCH_SIZE]))
+        ids = np.concatenate([chunk[0] for chunk in chunks])
+        t = np.concatenate([chunk[1] for chunk in chunks])
+        points = np.concatenate([chunk[2] for chunk in chunks])
+        normals = np.concatenate([chunk[3] for chunk in chunks])
+        lights = []
+        for i in range(len(caster.scene.lights) + len(caster.scene.point_lights)):
+            # a chunk without any hit has no light data
+            parts = [chunk[4][i] for chunk in chunks if chunk[4]]
+            lambert = np.concatenate([part[0] for part in parts]) if parts else np.empty(0)
+            factor = None if not parts or parts[0][1] is None else np.concatenate([part[1] for part in parts])
+            shadowed = np.concatenate([part[2] for part in parts]) if parts else np.empty(0, dtype=bool)
+            highlight = None
+            if caster.specular:
+                highlight = np.concatenate([part[3] for part in parts]) if parts else np.empty(0)
+            lights.append((lambert, factor, shadowed, highlight))
+        return GBuffer(width, height, ids, t, points, normals, lights, geometry_key(caster))
+
+    def shade(self, caster):
+        # the (height, width, 3) frame with the current materials and light intensities
+        # of the caster's scene
+        if len(self.lights) != len(caster.scene.lights) + len(caster.scene.point_lights):
+            raise ValueError("The G-buffer was captured with a different number of lights.")
+        if caster.scene.get_packed().secondary:
+            raise ValueError("The G-buffer has no reflected or refracted rays to re-shade.")
+        # in blocks of pixels, the (N,3) temporaries of a whole frame do not fit in the CPU cache
+        # the light arrays only cover the pixels that hit something, offsets maps a pixel
+        # to its row in them
+        offsets = np.concatenate(([0], np.cumsum(self.ids >= 0)))
+        colors = np.empty((len(self.ids), 3))
+        for start in range(0, len(self.ids), SHADE_BLOCK):
+            end = min(start + SHADE_BLOCK, len(self.ids))
+            rows = slice(offsets[start], offsets[end])
+            lights = [(lambert[rows], None if factor is None else factor[rows], shadowed[rows],
+                       None if highlight is None else highlight[rows])
+                      for lambert, factor, shadowed, highlight in self.lights]
+            colors[start:end] = caster.shade_gbuffer(self.ids[start:end], self.t[start:end], self.points[start:end],
+                                                     self.normals[start:end], lights)
+        return colors.reshape(self.height, self.width, 3)
+
+    def save(self, path):
+        # all the arrays in one uncompressed .npz file, the factor of a directional light
+        # and the highlights of a capture without specular are left out
+        arrays = {'size': np.array([self.width, self.height]), 'ids': self.ids, 't': self.t,
+                  'points': self.points, 'normals': self.normals, 'key': np.array(self.key or '')}
+        for i, (lambert, factor, shadowed, highlight) in enumerate(self.lights):
+            arrays[f'lambert_{i}'] = lambert
+            arrays[f'shadowed_{i}'] = shadowed
+            if factor is not None:
+                arrays[f'factor_{i}'] = factor
+            if highlight is not None:
+                arrays[f'highlight_{i}'] = highlight
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        # np.savez adds .npz to a name without it, so write to an open file
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @staticmethod
+    def load(path):
+        with np.load(path) as data:
+            width, height = (int(v) for v in data['size'])
+            count = sum(1 for name in data.files if name.startswith('lambert_'))
+            lights = [(data[f'lambert_{i}'], data[f'factor_{i}'] if f'factor_{i}' in data.files else None,
+                       data[f'shadowed_{i}'], data[f'highlight_{i}'] if f'highlight_{i}' in data.files else None)
+                      for i in range(count)]
+            return GBuffer(width, height, data['ids'], data['t'], data['points'], data['normals'],
+                           lights, str(data['key']) or None)
+
+def geometry_key(caster):
+    # a hash of everything that decides where the rays go and which ones are blocked:
+    # the screen and the camera, the object geometry, the light positions, directions
+    # and attenuations, whether the highlights were captured, and the format number
+    # the materials, the light intensities, the ambient light and the background are left out,
+    # those are exactly what GBuffer.shade can change
+    scene = caster.scene
+    packed = scene.get_packed()
+    digest = hashlib.sha256()
+    camera = caster.camera.position
+    basis = caster.basis
+    digest.update(repr((GBUFFER_FORMAT, caster.screen.width, caster.screen.height, caster.aspect, caster.scale,
+                        camera.x, camera.y, camera.z, None if basis is None else basis.tolist(),
+                        caster.specular)).encode())
+    for array in (packed.kind, packed.sphere_centers, packed.sphere_radii, packed.sphere_inverted,
+                  packed.plane_normals, packed.plane_offsets):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    for light in scene.lights + scene.point_lights:
+        if hasattr(light, 'position'):
+            p = light.position
+            digest.update(repr(('point', p.x, p.y, p.z, light.attenuation)).encode())
+            if hasattr(light, 'sample_points'):
+                # the size and the samples of an area light move its shadow rays
+                edges = None if light.edges is None else [edge.point() for edge in light.edges]
+                digest.update(repr(('area', light.radius, edges, light.samples)).encode())
+        else:
+            d = light.direction
+            digest.update(repr(('directional', d.x, d.y, d.z)).encode())
+    return digest.hexdigest()
@@ -1,10 +1,65 @@
+import io
+import re
+import math
+import logging
+import numpy as np
 from Models.Vector3D                import Vector3D
 from Models.Lights.AmbientLight     import AmbientLight
 from Models.Lights.DirectionalLight import DirectionalLight
 from Models.Lights.PointLight       import PointLight
 from Service.ParserServices         import analyze_scene_and_set_camera, assign_intensities_properly
 
-def parse_file(path):
+logger = logging.getLogger(__name__)
+
+class SceneError(ValueError):
+    # a scene text that cannot be rendered: a bad line (with its number), a missing value,
+    # or values the scene cannot be built from (see SceneBuilder)
+    # it is a ValueError, so the callers that catch ValueError still catch it, and the server
+    # answers it with 400 while any other error is a bug of the renderer (500)
+    pass
+
+# the streaming parser, see parse_stream
+CHUNK_BYTES = 1 << 22           # 4 MB of scene text per chunk
+BULK_CODES = {'o': 'objects', 'c': 'colors'}
+BULK_PREFIXES = ('o ', 'o\t', 'c ', 'c\t')
+BULK_VALUES = 4                 # [x,y,z,radius] and [r,g,b,shininess]
+LEADING_SPACE = re.compile(rb'^[ \t]+', re.MULTILINE)
+NEWLINE, SPACE, TAB = ord('\n'), ord(' '), ord('\t')
+# the fewest numbers a line of every code needs, a shorter line is an error and not a crash later
+MIN_VALUES = {'e': 3, 'v': 3, 'u': 3, 'f': 1, 't': 1, 'r': 2, 'b': 3, 'a': 3,
+              'o': BULK_VALUES, 'c': BULK_VALUES, 'd': 3, 'p': 3, 'i': 3}
+
+def parse_file(path, cache=None, stream=False):
+    # read a scene file and return the resolved scene data
+    # with a SceneCache the result is looked up by the hash of the file content first,
+    # and a miss is parsed and stored, so an unchanged file is parsed only once
+    # stream=True uses parse_stream, the objects and colors come back as numpy arrays
+    # the parser is quiet, the details go to the logging module at DEBUG level
+    if cache is None:
+        return read_scene(path, stream)
+    # the two parsers give different layouts, so they have their own cache entries
+    key = cache.file_key(path, 'stream' if stream else 'lists')
+    scene_data = cache.load(key)
+    if scene_data is not None:
+        logger.info("Scene %s loaded from the cache (%s)", path, key[:12])
+        return scene_data
+    scene_data = read_scene(path, stream)
+    cache.store(key, scene_data)
+    logger.info("Scene %s parsed and cached (%s)", path, key[:12])
+    return scene_data
+
+def read_scene(path, stream=False):
+    # parse a scene file without the cache
+    if stream:
+        return parse_stream(path)
+    with open(path, 'r') as f:
+        text = f.read()
+    try:
+        return parse_text(text)
+    except ValueError as error:
+        raise SceneError(f"{path}: {error}") from error
+
+def parse_text(text):
     # a struct to hold the scene data
     # its read the text file line by line 
     #e 0.0 0.0 4.0 0.0      # the e is the camera position
@@ -20,7 +75,119 @@ def parse_file(path):
     #p 2.0 1.0 3.0 0.6      # the p is a point light 
     #i 0.2 0.5 0.7 1.0      # the i is the intensity of the light
     #i 0.7 0.5 0.0 1.0      # the i is the intensity of the light
-    scene_data = {
+    scene_data = new_scene_data()
+    # reading the text line by line, the same way the file used to be read
+    with io.StringIO(text) as f:
+        # parsing each lline, a bad line is reported with its number
+        for number, line in enumerate(f, 1):
+            try:
+                parse_line(scene_data, line)
+            except ValueError as error:
+                raise SceneError(f"line {number}: {error}") from error
+    return resolve_scene(scene_data)
+
+def parse_stream(path, chunk_bytes=CHUNK_BYTES):
+    # the streaming parser for very large scene files
+    # so why not parse_text ?
+    # parse_text keeps a python list of floats for every o and c line, and add_objects
+    # walks them again, with millions of objects those lists take far more memory than the numbers
+    # here the file is read in chunks of chunk_bytes and every chunk is split by numpy:
+    # the o lines and the c lines are converted to floats with one call each,
+    # only the (K,4) arrays of the chunks are kept, and the few other lines
+    # (camera, lights, ...) go through parse_line like in parse_text
+    # scene_data['objects'] and scene_data['colors'] are (N,4) arrays at the end,
+    # everything else is the same as parse_text gives
+    # only the order of the lines with the same code matters (the i-th color belongs to
+    # the i-th object, the lights are counted by kind), so the o and c lines can be
+    # taken out of a chunk before the rest of its lines
+    scene_data = new_scene_data()
+    bulk = {code: [] for code in BULK_CODES}
+    with open(path, 'rb') as f:
+        rest = b''
+        # the number of lines before the chunk, for the line numbers of the errors
+        lines = 0
+        while True:
+            block = f.read(chunk_bytes)
+            if not block:
+                # the last line of the file may have no newline
+                text = rest + b'\n' if rest else rest
+            else:
+                # the chunk ends at its last newline, the partial line goes to the next one
+                block = rest + block
+                end = block.rfind(b'\n') + 1
+                text, rest = block[:end], block[end:]
+            if text:
+                try:
+                    parse_chunk(scene_data, bulk, text, lines)
+                except ValueError as error:
+                    raise SceneError(f"{path}: {error}") from error
+                lines += text.count(b'\n')
+            if not block:
+                break
+    if scene_data['objects'] or scene_data['colors']:
+        # parse_line only sees an o or c line when it has no values at all
+        raise SceneError(f"{path}: every o and c line needs {BULK_VALUES} numbers")
+    for code, key in BULK_CODES.items():
+        chunks = bulk[code]
+        scene_data[key] = np.concatenate(chunks).reshape(-1, BULK_VALUES) if chunks else np.empty((0, BULK_VALUES))
+    return resolve_scene(scene_data)
+
+def parse_chunk(scene_data, bulk, text, lines=0):
+    # one chunk of parse_stream, text is bytes that end with a newline and lines is
+    # the number of lines of the file before it
+    # every line gets a kind from its first two bytes (0 for the other lines,
+    # 1 + the position of its code in BULK_CODES for an o or c line followed by a space),
+    # and the bytes of each kind are pulled out of the chunk with one mask
+    buf = np.frombuffer(text, dtype=np.uint8)
+    starts = line_starts(buf)
+    if np.isin(buf[starts], (SPACE, TAB)).any():
+        # indented lines are rare, strip them once so the first byte is the code
+        buf = np.frombuffer(LEADING_SPACE.sub(b'', text), dtype=np.uint8)
+        starts = line_starts(buf)
+    buf = buf.copy()
+    ends = np.flatnonzero(buf == NEWLINE)
+    first = buf[starts]
+    second = buf[np.minimum(starts + 1, len(buf) - 1)]
+    separated = (second == SPACE) | (second == TAB)
+    kind = np.zeros(len(starts), dtype=np.uint8)
+    for k, code in enumerate(BULK_CODES, 1):
+        kind[(first == ord(code)) & separated] = k
+    # the code letters of the o and c lines become spaces, so only the numbers are left
+    buf[starts[kind > 0]] = SPACE
+    byte_kind = np.repeat(kind, ends - starts + 1)
+    for k, code in enumerate(BULK_CODES, 1):
+        count = np.count_nonzero(kind == k)
+        if count:
+            values = parse_values(buf[byte_kind == k].tobytes())
+            # the lines are checked all at once, a line with a missing value
+            # (or with a word instead of a number) shows up in the total count
+            if values.size != BULK_VALUES * count:
+                raise SceneError(f"every {code} line needs {BULK_VALUES} numbers")
+            bulk[code].append(values)
+    if (kind == 0).any():
+        other = buf[byte_kind == 0].tobytes().decode().split('\n')
+        for number, line in zip(np.flatnonzero(kind == 0) + lines + 1, other):
+            try:
+                parse_line(scene_data, line)
+            except ValueError as error:
+                raise SceneError(f"line {number}: {error}") from error
+
+def line_starts(buf):
+    # the index of the first byte of every line of a chunk that ends with a newline
+    return np.concatenate(([0], np.flatnonzero(buf[:-1] == NEWLINE) + 1))
+
+def parse_values(text):
+    # the numbers of whitespace separated text (bytes) as a flat array,
+    # a word that is not a number gives an empty array, the caller sees it in the number of values
+    try:
+        return np.array(text.split(), dtype=np.float64)
+    except ValueError:
+        return np.empty(0)
+
+def new_scene_data():
+    # a struct to hold the scene data
+    # the parsers fill it line by line and resolve_scene finishes it
+    return {
         'camera_pos':    None,
         'view_dir':      None,  # the view dict object is used to set the camera view direction
         'up_vec':        None,
@@ -32,181 +199,210 @@ def parse_file(path):
         'camera_params': None,
         'objects':       [],   # [x,y,z,radius] or [nx,ny,nz,distance] for planes
         'colors':        [],   # [r,g,b,shininess]
+        'materials':     [],   # [reflectivity, transparency, ior], the i-th belongs to the i-th object
         'lights':        [],   # directional lights
         'point_lights':  [],   # point lights
+        'areas':         [],   # [radius] or [ux,uy,uz,vx,vy,vz] (+ samples), the i-th belongs to the i-th point light
         'intensities':   [],   # [r,g,b,multiplier]
         'directional_params': [], # directional light parameters
         'type_of_lights':[],   # light type indicators
         'other':         []    # unrecognized commands
     }    
-    # opening the file and rerading it line by line
-    with open(path, 'r') as f:
-        # parsing each lline 
-        for line in f:
-            # strip whitespace and ignore empty lines or comments
-            L = line.strip()
-            # if there is a comment or empty line, skip it
-            if not L or L.startswith('#') or L.startswith('//'):
-                continue
-            # split the line into parts
-            # the first part is the code, the rest are values
-            parts = L.split()
-            if len(parts) == 0:
-                continue
-            # the first part is the code what type of data it is
-            # and the rest are the values
-            # if the first part is not a recognized code, it will be added to the other list
-            code = parts[0]
-            # the calue part is the rest of the line
-            vals = [float(x) for x in parts[1:]]
-            if code == 'e':   # camera position
-                scene_data['camera_pos'] = Vector3D(*vals[:3])
-                scene_data['camera_params'] = vals
-            elif code == 'v': # view direction
-                # the point of normalizing is to ensure the view direction is a unit vector
-                # the direction is driven by the first 3 values
-                scene_data['view_dir'] = Vector3D(*vals[:3]).normalize()
-            elif code == 'u':
-                # u is not recognized in the txt file, but it is used to set the up vector
-                # and it is normalized to ensure it is a unit vector
-                # the up vector is used to define the camera orientation
-                scene_data['up_vec'] = Vector3D(*vals[:3]).normalize()
-
-            elif code == 'f': 
-                # the filed view is use to set the field of view
-                # it is the first value in the list
-                scene_data['fov'] = vals[0]
-            elif code == 't': # aspect ratio
-                # the aspect ratio is the first value in the list
-                # it is used to define the aspect ratio of the scene
-                # i think my ratio of the filed is not best 
-                scene_data['aspect'] = vals[0]
-
-            elif code == 'r': # resolution
-                # resulution is not the recognized in the txt file, but it is used to set the resolution
-                # but is used to define the resolution of the scene
-                scene_data['resolution'] = (int(vals[0]), int(vals[1]))
-
-            elif code == 'b': # background color also not recognized in the txt file
-                # the background color is the first 3 values in the list
-                # for now the background color is not used in the scene
-                # but it is used to define the background color of the scene
-                scene_data['background'] = Vector3D(*vals[:3])
-            elif code == 'a': # ambient light 
-                # the ambient light is the first 3 values in the list
-                # and the 4th value is the ambient coefficient (ka)
-                # the ambient light is used to define the ambient light of the scene
-                # i desdecided to use a scalar multiplication of the ambient light color
-                # with the ambient coefficient to get the final ambient light color
-                r, g, b = vals[:3]
-                ka = vals[3] if len(vals) > 3 else 1.0
-                scene_data['ambient_light'] = AmbientLight(
-                    Vector3D(r, g, b).scalar_multiply(ka)
-                )
-            elif code == 'o':
-                # object definition
-                # as we can understand from the code, it can be a sphere or a plane
-                # if the radius is negative, it is a plane
-                # if the radius is positive, it is a sphere
-                scene_data['objects'].append(vals)
-                obj_type = "plane" if len(vals) > 3 and vals[3] < 0 else "sphere"
-
-            elif code == 'c': # color + shininess
-                # the color is the first 3 values in the list
-                # and the 4th value is the shininess coefficient
-                # the color is used to define the color of the object
-                scene_data['colors'].append(vals)
-                print(f"DEBUG: Added color: {vals}")
-
-            elif code == 'd': # directional light
-                dx, dy, dz = vals[:3]
-                # Create light with placeholder intensity (will be set later)
-                light = DirectionalLight(Vector3D(dx, dy, dz), Vector3D(1, 1, 1))
-                # Use 4th value as intensity multiplier if available
-                scene_data['lights'].append(light)
-                # Store directional parameters for later use
-                scene_data['directional_params'].append(vals)
-
-            elif code == 'p': # point light - CONSERVATIVE PARSING
-                # Point light parameters: position (px, py, pz) and optional attenuation/intensity multiplier
-                # Ensure we have at least 3 values for position
-                px, py, pz = vals[:3]
-                # Conservative interpretation of 4th parameter
-                if len(vals) > 3:
-                    fourth_param = vals[3]
-                    # if the fourth parameter is less than 0.1, it is treated as attenuation
-                    if fourth_param < 0.1:
-                        att = fourth_param
-                        intensity_mult = 1.0
-                        # the light type is set to point
-                        light_type = "point"
-                    else:  
-                        # on the else section if the fourth parameter is greater than 0.1
-                        # it is treated as intensity multiplier
-                        # and we set the attenuation to a conservative value
-                        # and the light type to normal
-                        att = 0.02 
-                        intensity_mult = fourth_param
-                        # and it define as noraml light type
-                        light_type = "normal"
-                else:
-                    # If no 4th parameter, use conservative defaults
-                    # Attenuation is set to a conservative value
-                    # i decide to use a small value for attenuation
-                    # and the intensity multiplier is set to 1.0
-                    att = 0.02
-                    intensity_mult = 1.0
-                    # and the light type is set to point
-                    light_type = "point"
-                
-               # the point of using this if is for conservative positioning
-                # If position is (0, 0, 0), use conservative positioning
-                # to ensure the light is placed in a predictable location
-                if px == 0.0 and py == 0.0 and pz == 0.0:
-                    light_positions = [
-                        Vector3D(1.0, 1.0, 0.3),    # Right elevated, moderate distance
-                        Vector3D(-1.0, 1.0, 0.3),   # Left elevated, moderate distance
-                        Vector3D(0.0, 0.5, 0.2)     # Center, slightly forward
-                    ]
-                    # initilaize the position based on the number of point lights already defined
-                    # conservative positioning to avoid overlap
-                    pos_idx = len(scene_data['point_lights'])
-                    position = light_positions[pos_idx % len(light_positions)]
-                else:
-                    # else uuse the original position from the file
-                    # and the position is set to the original position
-                    position = Vector3D(px, py, pz)
-                # Create point light with conservative settings 
-                # and the intensity is set to the original intensity from the file
-                # and the attenuation is set to the original attenuation from the file
-                # and the light type is set to the original light type from the file
-                point_light = PointLight(position, Vector3D(1, 1, 1), att)
-                # the point of using this if is to set the intensity multiplier
-                # if the intensity multiplier is not set, it is set to 1.0
-                point_light.intensity_multiplier = intensity_mult
-                point_light.light_type = light_type
-                # Store the point light in the scene data
-                scene_data['point_lights'].append(point_light)
-            elif code == 'i': # light intensity
-                # the intensity is the first 3 values in the list
-                # and the 4th value is the intensity multiplier
-                # the intensity is used to define the intensity of the light
-                # and it is used to define the intensity of the light
-                scene_data['intensities'].append(vals)
-
-            elif code == 'l': 
-                # type of light definition
-                # this is used to define the type of light
-                scene_data['type_of_lights'].append(vals)
 
-            else:
-                # otherwise, add to other list
-                # this is used to define the other data in the scene
-                scene_data['other'].append((code, vals))
+def parse_line(scene_data, line):
+    # parse one line of a scene file into scene_data
+    # strip whitespace and ignore empty lines or comments
+    L = line.strip()
+    # if there is a comment or empty line, skip it
+    if not L or L.startswith('#') or L.startswith('//'):
+        return
+    # split the line into parts
+    # the first part is the code, the rest are values
+    parts = L.split()
+    if len(parts) == 0:
+        return
+    # the first part is the code what type of data it is
+    # and the rest are the values
+    # if the first part is not a recognized code, it will be added to the other list
+    code = parts[0]
+    # the calue part is the rest of the line
+    vals = [float(x) for x in parts[1:]]
+    if len(vals) < MIN_VALUES.get(code, 0):
+        raise SceneError(f"{code} line needs {MIN_VALUES[code]} or more numbers: {L}")
+    if code == 'e':   # camera position
+        scene_data['camera_pos'] = Vector3D(*vals[:3])
+        scene_data['camera_params'] = vals
+    elif code == 'v': # view direction
+        # the point of normalizing is to ensure the view direction is a unit vector
+        # the direction is driven by the first 3 values
+        scene_data['view_dir'] = Vector3D(*vals[:3]).normalize()
+    elif code == 'u':
+        # u is not recognized in the txt file, but it is used to set the up vector
+        # and it is normalized to ensure it is a unit vector
+        # the up vector is used to define the camera orientation
+        scene_data['up_vec'] = Vector3D(*vals[:3]).normalize()
+
+    elif code == 'f': 
+        # the filed view is use to set the field of view
+        # it is the first value in the list
+        scene_data['fov'] = vals[0]
+    elif code == 't': # aspect ratio
+        # the aspect ratio is the first value in the list
+        # it is used to define the aspect ratio of the scene
+        # i think my ratio of the filed is not best 
+        scene_data['aspect'] = vals[0]
+
+    elif code == 'r': # resolution
+        # resulution is not the recognized in the txt file, but it is used to set the resolution
+        # but is used to define the resolution of the scene
+        scene_data['resolution'] = (int(vals[0]), int(vals[1]))
+
+    elif code == 'b': # background color also not recognized in the txt file
+        # the background color is the first 3 values in the list
+        # for now the background color is not used in the scene
+        # but it is used to define the background color of the scene
+        scene_data['background'] = Vector3D(*vals[:3])
+    elif code == 'a': # ambient light 
+        # the ambient light is the first 3 values in the list
+        # and the 4th value is the ambient coefficient (ka)
+        # the ambient light is used to define the ambient light of the scene
+        # i desdecided to use a scalar multiplication of the ambient light color
+        # with the ambient coefficient to get the final ambient light color
+        r, g, b = vals[:3]
+        ka = vals[3] if len(vals) > 3 else 1.0
+        scene_data['ambient_light'] = AmbientLight(
+            Vector3D(r, g, b).scalar_multiply(ka)
+        )
+    elif code == 'o':
+        # object definition
+        # as we can understand from the code, it can be a sphere or a plane
+        # if the radius is negative, it is a plane
+        # if the radius is positive, it is a sphere
+        scene_data['objects'].append(vals)
+        obj_type = "plane" if len(vals) > 3 and vals[3] < 0 else "sphere"
+
+    elif code == 'c': # color + shininess
+        # the color is the first 3 values in the list
+        # and the 4th value is the shininess coefficient
+        # the color is used to define the color of the object
+        scene_data['colors'].append(vals)
+        logger.debug("Added color: %s", vals)
+
+    elif code == 'm': # reflection and refraction of an object
+        # m reflectivity [transparency [ior]], the i-th m line belongs to the i-th object
+        # like the c lines, objects without one (or with 0 0) are matte
+        if not 1 <= len(vals) <= 3:
+            raise SceneError(f"m line needs 1 to 3 numbers: {L}")
+        scene_data['materials'].append(vals)
+
+    elif code == 'd': # directional light
+        dx, dy, dz = vals[:3]
+        # Create light with placeholder intensity (will be set later)
+        light = DirectionalLight(Vector3D(dx, dy, dz), Vector3D(1, 1, 1))
+        # Use 4th value as intensity multiplier if available
+        scene_data['lights'].append(light)
+        # Store directional parameters for later use
+        scene_data['directional_params'].append(vals)
+
+    elif code == 'p': # point light - CONSERVATIVE PARSING
+        # Point light parameters: position (px, py, pz) and optional attenuation/intensity multiplier
+        # Ensure we have at least 3 values for position
+        px, py, pz = vals[:3]
+        # Conservative interpretation of 4th parameter
+        if len(vals) > 3:
+            fourth_param = vals[3]
+            # if the fourth parameter is less than 0.1, it is treated as attenuation
+            if fourth_param < 0.1:
+                att = fourth_param
+                intensity_mult = 1.0
+                # the light type is set to point
+                light_type = "point"
+            else:  
+                # on the else section if the fourth parameter is greater than 0.1
+                # it is treated as intensity multiplier
+                # and we set the attenuation to a conservative value
+                # and the light type to normal
+                att = 0.02 
+                intensity_mult = fourth_param
+                # and it define as noraml light type
+                light_type = "normal"
+        else:
+            # If no 4th parameter, use conservative defaults
+            # Attenuation is set to a conservative value
+            # i decide to use a small value for attenuation
+            # and the intensity multiplier is set to 1.0
+            att = 0.02
+            intensity_mult = 1.0
+            # and the light type is set to point
+            light_type = "point"
+        
+       # the point of using this if is for conservative positioning
+        # If position is (0, 0, 0), use conservative positioning
+        # to ensure the light is placed in a predictable location
+        if px == 0.0 and py == 0.0 and pz == 0.0:
+            light_positions = [
+                Vector3D(1.0, 1.0, 0.3),    # Right elevated, moderate distance
+                Vector3D(-1.0, 1.0, 0.3),   # Left elevated, moderate distance
+                Vector3D(0.0, 0.5, 0.2)     # Center, slightly forward
+            ]
+            # initilaize the position based on the number of point lights already defined
+            # conservative positioning to avoid overlap
+            pos_idx = len(scene_data['point_lights'])
+            position = light_positions[pos_idx % len(light_positions)]
+        else:
+            # else uuse the original position from the file
+            # and the position is set to the original position
+            position = Vector3D(px, py, pz)
+        # Create point light with conservative settings 
+        # and the intensity is set to the original intensity from the file
+        # and the attenuation is set to the original attenuation from the file
+        # and the light type is set to the original light type from the file
+        point_light = PointLight(position, Vector3D(1, 1, 1), att)
+        # the point of using this if is to set the intensity multiplier
+        # if the intensity multiplier is not set, it is set to 1.0
+        point_light.intensity_multiplier = intensity_mult
+        point_light.light_type = light_type
+        # Store the point light in the scene data
+        scene_data['point_lights'].append(point_light)
+    elif code == 'x': # size of a point light, which makes it an area light with soft shadows
+        # x radius [samples]                    a sphere emitter
+        # x ux uy uz vx vy vz [samples]         a quad emitter with edges u and v, centred on the light
+        # the i-th x line belongs to the i-th point light, x 0 keeps it a point light
+        if len(vals) not in (1, 2, 6, 7):
+            raise SceneError(f"x line needs a radius or two edges, and optionally the samples: {L}")
+        if len(vals) in (2, 7):
+            # the shadow rays go to an n x n grid of cells on the emitter, see AreaLight
+            samples = vals[-1]
+            if samples < 1 or samples != int(samples) or math.isqrt(int(samples)) ** 2 != samples:
+                raise SceneError(f"x line samples must be a square number (4, 9, 16, ...): {L}")
+        scene_data['areas'].append(vals)
+    elif code == 'i': # light intensity
+        # the intensity is the first 3 values in the list
+        # and the 4th value is the intensity multiplier
+        # the intensity is used to define the intensity of the light
+        # and it is used to define the intensity of the light
+        scene_data['intensities'].append(vals)
+
+    elif code == 'l': 
+        # type of light definition
+        # this is used to define the type of light
+        scene_data['type_of_lights'].append(vals)
+
+    else:
+        # otherwise, add to other list
+        # this is used to define the other data in the scene
+        scene_data['other'].append((code, vals))
+
+def resolve_scene(scene_data):
+    # everything that needs the whole file: the default light, the light intensities
+    # and the camera placement, scene_data is changed in place and returned
     # total defined lights
     # the point of using the total defined lights is to check if there are any lights defined in the scene
     # and if there are no lights defined, we will add a default light
     total_defined_lights = len(scene_data['lights']) + len(scene_data['point_lights'])
+    if total_defined_lights and not scene_data['intensities']:
+        # the intensities of the lights are reused cyclically, but there has to be one
+        raise SceneError("the scene has lights but no i line for their intensity")
     
     if total_defined_lights == 0:
         # iif the total light is 0, we will add a default light
@@ -227,25 +423,34 @@ def parse_file(path):
     # Analyze scene geometry and set camera position intelligently
     # this function will analyze the scene geometry and set the camera position intelligently
     analyze_scene_and_set_camera(scene_data)
-    # Print comprehensive scene data
-    print("\nParsed Scene Data:")
+    # the whole scene data and the final lights, only when DEBUG logging is on,
+    # formatting every vector of a big scene is not free
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(scene_summary(scene_data))
+    return scene_data
+
+def scene_summary(scene_data):
+    # the parsed scene data and the final light intensities as text
+    lines = ["Parsed Scene Data:"]
     for key, value in scene_data.items():
         if key == "other" and value:
-            print(f"  {key}:")
+            lines.append(f"  {key}:")
             for code, vals in value:
-                print(f"    {code} -> {vals}")
+                lines.append(f"    {code} -> {vals}")
+        elif hasattr(value, 'shape'):
+            # the objects and colors arrays of the streaming parser
+            lines.append(f"  {key}: array of {value.shape[0]} rows")
         elif isinstance(value, list):
-            print(f"  {key} ({len(value)} items):")
+            lines.append(f"  {key} ({len(value)} items):")
             for item in value:
-                print(f"    - {item}")
+                lines.append(f"    - {item}")
         else:
-            print(f"  {key}: {value}")
-    print("END Parsed Scene Data")
-    # Final light debug output
-    print("\n=== LIGHT DEBUG ===")
+            lines.append(f"  {key}: {value}")
+    lines.append("END Parsed Scene Data")
+    lines.append("=== LIGHT DEBUG ===")
     for i, light in enumerate(scene_data['lights']):
-        print(f"Directional Light {i}: intensity={light.intensity}")
+        lines.append(f"Directional Light {i}: intensity={light.intensity}")
     for i, light in enumerate(scene_data['point_lights']):
-        print(f"Point Light {i}: pos={light.position}, intensity={light.intensity}")
-    print("===================\n")
-    return scene_data
\ No newline at end of file
+        lines.append(f"Point Light {i}: pos={light.position}, intensity={light.intensity}")
+    lines.append("===================")
+    return "\n".join(lines)
@@ -1,3 +1,5 @@
+import logging
+import numpy as np
 from Models.Vector3D import Vector3D
 from Models.Scene import Scene
 from Models.Camera import Camera
@@ -6,6 +8,8 @@ from Models.Screen import Screen
 from Handler.ScreenHandler import ScreenHandler
 from Models.Lights.DirectionalLight import DirectionalLight
 
+logger = logging.getLogger(__name__)
+
 BASE_PLANE_DISTANCE =               0.05  # Base distance for camera placement
 EXTRA_PLANE_DISTANCE_PER_OBJECT =   0.01  # Extra distance per object for camera placement
 CLOSE_CAMERA_THRESHOLD =            2.5   # Threshold for close camera adjustment 
@@ -79,6 +83,15 @@ def calculate_adaptive_threshold(original_z, object_count):
     # not too low or too high
     return max(1.0, min(3.0, threshold))
 
+def object_columns(objects):
+    # the z values and the 4th values (sphere radius, or plane distance when negative)
+    # of the objects as arrays, objects is the list of [x,y,z,r] rows of parse_file
+    # or the (N,4) array of the streaming parser, rows with less than 4 values are skipped
+    if hasattr(objects, 'shape'):
+        return objects[:, 2], objects[:, 3]
+    rows = [obj for obj in objects if len(obj) > 3]
+    return np.array([obj[2] for obj in rows]), np.array([obj[3] for obj in rows])
+
 def analyze_scene_and_set_camera(scene_data):
     # the point of using this analyze function is to intelligently set the camera position
     # based on the scene geometry, ensuring it is not too close to objects
@@ -98,28 +111,30 @@ def analyze_scene_and_set_camera(scene_data):
         total_objects = len(scene_data['objects'])
         original_z = abs(original_cam.z)
         # Debug output for original camera position and total objects
-        print(f"DEBUG: Original camera z={original_z}, total objects={total_objects}")
+        logger.debug("Original camera z=%s, total objects=%s", original_z, total_objects)
         # ANALYZE SCENE GEOMETRY FOR INTELLIGENT CAMERA PLACEMENT
-        if scene_data['objects']:
+        if len(scene_data['objects']):
             # Separate planes and spheres
-            plane_objects = [obj for obj in scene_data['objects'] if len(obj) > 3 and obj[3] < 0]
-            sphere_objects = [obj for obj in scene_data['objects'] if len(obj) > 3 and obj[3] > 0]
+            # by the 4th value of every object, see object_columns
+            z_values, fourth = object_columns(scene_data['objects'])
+            plane_objects = fourth[fourth < 0]
+            sphere_objects = fourth > 0
             # if the camera is not need to be adjusted
             # so initially set it to False
             # and z to original cam z
             camera_needs_adjustment = False
             suggested_z = original_cam.z
             # if the scene has planes or spheres
-            if plane_objects:
+            if len(plane_objects):
                 # For planes: Check if camera is too close to any plane
                 # Calculate distances from camera to each plane
                 # Plane objects are expected to have at least 4 elements: x, y, z, and distance
                 # Assuming plane objects are in the format: [x, y, z, distance]
                 # where distance is the signed distance from the plane to the camera
                 # Extract distances from plane objects
-                plane_distances =   [abs(obj[3]) for obj in plane_objects]
-                min_plane_dist =    min(plane_distances)
-                max_plane_dist =    max(plane_distances)                
+                plane_distances =   np.abs(plane_objects)
+                min_plane_dist =    float(plane_distances.min())
+                max_plane_dist =    float(plane_distances.max())                
                 # Calculate adaptive threshold and distance based on scene characteristics
                 adaptive_threshold = calculate_adaptive_threshold(original_z, total_objects)
                 adaptive_distance = calculate_adaptive_distance(original_z, total_objects, max_plane_dist)
@@ -131,15 +146,15 @@ def analyze_scene_and_set_camera(scene_data):
                     # using adaptive distance calculation instead of fixed value
                     suggested_z = max_plane_dist + adaptive_distance
                     camera_needs_adjustment = True
-            elif sphere_objects:
+            elif sphere_objects.any():
                 # For spheres: Use bounding box approach
-                sphere_z_positions = [obj[2] for obj in sphere_objects]
+                sphere_z_positions = z_values[sphere_objects]
                 # Sphere objects are expected to have at least 4 elements: x, y, z, and radius
                 # Assuming sphere objects are in the format: [x, y, z, radius]
                 # Extract radii from sphere objects
-                sphere_radii = [abs(obj[3]) for obj in sphere_objects]
+                sphere_radii = np.abs(fourth[sphere_objects])
                 # Find furthest sphere boundary
-                furthest_sphere_boundary = max(z + r for z, r in zip(sphere_z_positions, sphere_radii))
+                furthest_sphere_boundary = float((sphere_z_positions + sphere_radii).max())
                 # Calculate adaptive distance for spheres
                 adaptive_distance = calculate_adaptive_distance(original_z, total_objects, furthest_sphere_boundary)
                 # adjust camera if too close to furthest sphere
@@ -283,7 +298,8 @@ def assign_intensities_properly(scene_data):
         # Debug output for light directions
         if i < len(scene_data['directional_params']):
             dir_params = scene_data['directional_params'][i]
-            print(f"DEBUG: Directional Light {i}: direction=({dir_params[0]}, {dir_params[1]}, {dir_params[2]}), intensity={light.intensity}")
+            logger.debug("Directional Light %d: direction=(%s, %s, %s), intensity=%s",
+                         i, dir_params[0], dir_params[1], dir_params[2], light.intensity)
     # Assign to point lights with conservative settings
     # so actually what is happening here is that
     # we are assigning intensities to point lights
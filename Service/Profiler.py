@@ -0,0 +1,104 @@
+import time
+from collections import defaultdict
+import numpy as np
+
+class Profiler:
+    # Profiler collects counters and phase times while a frame is rendered
+    # so how is it switched on ?
+    # RayCaster, Scene and ScreenHandler have a `profiler` attribute that is None by default,
+    # attach() sets it, and every instrumented spot starts with `if profiler is not None`,
+    # so a render without --profile pays for one comparison per call and nothing else
+    # what is measured:
+    #   times  - seconds per phase: parse, setup, render, intersection, shadows, save
+    #            (shading is the part of render that is neither intersection nor shadows)
+    #   counts - intersection tests per object type, shadow rays that were blocked,
+    #            area light points in the penumbra
+    #   tiles  - the render time of every tile, for the cost heatmap
+    def __init__(self):
+        self.times = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.tiles = []     # (x0, y0, x1, y1, seconds)
+
+    def attach(self, caster, handler=None):
+        # switch the instrumentation on for the ray caster, its scene and the screen handler
+        caster.profiler = self
+        caster.scene.profiler = self
+        if handler is not None:
+            handler.profiler = self
+
+    def add_time(self, phase, seconds):
+        self.times[phase] += seconds
+
+    def count(self, name, n=1):
+        self.counts[name] += n
+
+    def count_tests(self, obj, n=1):
+        # n intersection tests against an object of obj's type
+        self.counts[f"{type(obj).__name__} tests"] += n
+
+    def add_tile(self, tile, seconds):
+        self.tiles.append((*tile, seconds))
+
+    def heatmap(self, width, height):
+        # the (height, width) render cost in seconds per pixel, every pixel gets the
+        # time of its tile divided by the number of pixels in the tile
+        cost = np.zeros((height, width))
+        for x0, y0, x1, y1, seconds in self.tiles:
+            cost[y0:y1, x0:x1] = seconds / ((x1 - x0) * (y1 - y0))
+        return cost
+
+    def heatmap_colors(self, width, height):
+        # the heatmap as an (height, width, 3) image in [0, 1]:
+        # black for the cheapest tile, through red and yellow to white for the most expensive one
+        cost = self.heatmap(width, height)
+        low, high = cost.min(), cost.max()
+        level = (cost - low) / (high - low) if high > low else np.zeros_like(cost)
+        return np.clip(np.stack([3 * level, 3 * level - 1, 3 * level - 2], axis=2), 0.0, 1.0)
+
+    def summary(self, caster):
+        # the report printed by main.py --profile
+        times = self.times
+        render = times['render']
+        shading = max(0.0, render - times['intersection'] - times['shadows'])
+        lines = ["=== PROFILE ===", "Phase times:"]
+        for name in ('parse', 'setup', 'render'):
+            lines.append(f"  {name:<14} {times[name]:8.3f}s")
+        for name, seconds in (('intersection', times['intersection']), ('shadows', times['shadows']), ('shading', shading)):
+            share = seconds / render * 100 if render else 0.0
+            lines.append(f"    {name:<12} {seconds:8.3f}s ({share:5.1f}% of render)")
+        lines.append(f"  {'save':<14} {times['save']:8.3f}s")
+        primary, shadow = caster.primary_rays, caster.shadow_rays
+        blocked = self.counts['shadow rays blocked']
+        secondary = f", {caster.secondary_rays} reflected or refracted" if caster.secondary_rays else ""
+        lines.append(f"Rays: {primary} primary, {shadow} shadow{secondary} "
+                     f"({blocked / shadow * 100 if shadow else 0.0:.1f}% of shadow rays blocked)")
+        if self.counts['area light points']:
+            area, penumbra = self.counts['area light points'], self.counts['penumbra points']
+            lines.append(f"Area lights: {penumbra} of {area} points in the penumbra "
+                         f"({penumbra / area * 100:.1f}%, the others took the probe rays only)")
+        tests = sorted((name, n) for name, n in self.counts.items() if name.endswith(' tests'))
+        if tests:
+            lines.append("Intersection tests: " + ", ".join(
+                f"{name[:-len(' tests')]} {n} ({n / primary if primary else 0.0:.2f}/ray)" for name, n in tests))
+        if self.tiles:
+            seconds = np.array([tile[4] for tile in self.tiles])
+            x0, y0, x1, y1, slowest = max(self.tiles, key=lambda tile: tile[4])
+            lines.append(f"Tiles: {len(self.tiles)}, mean {seconds.mean() * 1e3:.2f}ms, slowest ({x0},{y0})-({x1},{y1}) "
+                         f"{slowest * 1e3:.2f}ms ({slowest / seconds.mean():.1f}x the mean)")
+        return "\n".join(lines)
+
+class PhaseTimer:
+    # `with PhaseTimer(profiler, 'parse'):` adds the time of the block to the phase,
+    # and does nothing when profiler is None
+    def __init__(self, profiler, phase):
+        self.profiler = profiler
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.profiler is not None:
+            self.profiler.add_time(self.phase, time.perf_counter() - self.start)
+        return False
@@ -0,0 +1,83 @@
+import time
+import numpy as np
+from Service.RayCaster import BATCH_SIZE
+from Service.Sampler import neighbour_difference
+
+COARSE_STEP = 4                 # the first pass traces one pixel of every 4x4 block, 1/16 of the screen
+DEFAULT_THRESHOLD = 0.02        # color difference between neighbouring samples that makes a block split
+DEFAULT_PREVIEW_INTERVAL = 1.0  # seconds between two intermediate images
+
+def expand(grid, step, width, height):
+    # the full (height, width, 3) frame from samples taken every `step` pixels,
+    # every sample fills its step x step block
+    return np.repeat(np.repeat(grid, step, axis=0), step, axis=1)[:height, :width]
+
+class ProgressiveRenderer:
+    # ProgressiveRenderer gives a usable image fast and then makes it better
+    # so how does it work ?
+    # the first pass traces only one pixel of every COARSE_STEP x COARSE_STEP block,
+    # and every traced pixel (a sample) fills its whole block
+    # then every pass halves the block size: a block is split into four only if its
+    # sample differs from a neighbouring sample by more than threshold, so the rays
+    # go to the edges and the shadows, and the flat areas keep their coarse sample
+    # after the last pass (step 1) every pixel has its own value
+    # a flat area can hide a detail smaller than the coarse step, so threshold 0 splits
+    # every block and the last pass is the full render (like the Sampler's threshold 0)
+    def __init__(self, caster, threshold=DEFAULT_THRESHOLD, coarse_step=COARSE_STEP):
+        if coarse_step < 1 or coarse_step & (coarse_step - 1):
+            raise ValueError("Coarse step must be a power of two.")
+        self.caster = caster
+        self.threshold = threshold
+        self.coarse_step = coarse_step
+        self.width = caster.screen.width
+        self.height = caster.screen.height
+        self.traced = 0     # number of pixels traced so far
+
+    def trace(self, gx, gy, step):
+        # trace the samples at the grid positions (gx, gy) of a grid with the given step
+        self.traced += len(gx)
+        return self.caster.shade_pixels(gx * step, gy * step)
+
+    def split_blocks(self, grid):
+        # the blocks whose sample differs from one of its 4 neighbours by more than threshold,
+        # all of them for threshold 0
+        if self.threshold <= 0:
+            return np.ones(grid.shape[:2], dtype=bool)
+        return neighbour_difference(grid) > self.threshold
+
+    def passes(self):
+        # yield (step, grid) every time the image got better:
+        # after the coarse pass and after every chunk of BATCH_SIZE new samples
+        # grid holds one sample every step pixels, see expand
+        step = self.coarse_step
+        gy, gx = np.mgrid[0:len(range(0, self.height, step)), 0:len(range(0, self.width, step))]
+        grid = self.trace(gx.ravel(), gy.ravel(), step).reshape(gx.shape + (3,))
+        yield step, grid
+        while step > 1:
+            split = self.split_blocks(grid)
+            step //= 2
+            rows, cols = len(range(0, self.height, step)), len(range(0, self.width, step))
+            # every sample first fills the four cells of its block in the finer grid
+            grid = np.repeat(np.repeat(grid, 2, axis=0), 2, axis=1)[:rows, :cols]
+            todo = np.repeat(np.repeat(split, 2, axis=0), 2, axis=1)[:rows, :cols]
+            # the top left cell of a block is the old sample, it is already traced
+            todo[0::2, 0::2] = False
+            ty, tx = np.nonzero(todo)
+            for start in range(0, len(ty), BATCH_SIZE):
+                y, x = ty[start:start + BATCH_SIZE], tx[start:start + BATCH_SIZE]
+                grid[y, x] = self.trace(x, y, step)
+                yield step, grid
+            if len(ty) == 0:
+                yield step, grid
+
+    def render(self, preview=None, interval=DEFAULT_PREVIEW_INTERVAL):
+        # run all the passes and return the final (height, width, 3) frame
+        # preview(frame, step) is called with the first image and then at most
+        # once every `interval` seconds while the passes go on
+        last = None
+        for step, grid in self.passes():
+            now = time.perf_counter()
+            if preview is not None and (last is None or now - last >= interval):
+                preview(expand(grid, step, self.width, self.height), step)
+                last = now
+        return expand(grid, step, self.width, self.height)
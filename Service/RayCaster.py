@@ -1,16 +1,24 @@
+import numpy as np
 from Models.Vector3D import Vector3D
 from Models.Objects.Ray import Ray
+from Models.ShadingTable import ShadingTable
+from Models.ScreenBins import ScreenBins
+from Models.Objects.Object import take_rows, put_rows
 import math
+import time
 
-MAX_DEPTH =         1                   # Maximum recursion depth for ray tracing
+MAX_DEPTH =         4                   # Maximum bounces of reflected and refracted rays
 BIAS =              1e-3                # Increased bias for better shadow accuracy at distance
-SPECULAR_SCALE =    0.3                 # Keep disabled for matte look
+SPECULAR_SCALE =    0.3                 # Strength of the highlights, off by default for the matte look
 SHADOW_DIFFUSE =    0.10                # Darker shadows but not too dark
 REFLECTION_SCALE =  0.8                 # Reflection scale for glossy surfaces, keep disabled
 BLACK_VECTOR =      Vector3D(0, 0, 0)   # Black vector for no color contribution
 AMBIENT_MULTIPLIER = 0.15               # Ambient light multiplier for more subtle ambient effects
 DEFAULT_VACTOR =    Vector3D(0, 0, 0)   # Default vector for no intersection
 BIAS_MULTIPLIER =   5.00                # Bias multiplier for shadow calculations
+BATCH_SIZE =        65536               # Rays traced together by the batch render path
+MIN_CONTRIBUTION =  0.01                # Secondary rays with a smaller weight in their pixel are not traced
+PACKET_WIDTH =      8                   # Camera rays are traced in 8x8 pixel blocks, see packet_pixels
 class RayCaster:
     # RayCaster class for rendering scenes using ray tracing
     # the perpose of this class is to generate rays from the camera,
@@ -21,6 +29,39 @@ class RayCaster:
         self.scene = scene
         self.aspect = screen.aspect_ratio
         self.scale = math.tan(math.radians(screen.fov * 0.5))
+        # the last object that blocked a shadow ray, per light index
+        # shadow rays of neighbouring pixels are usually blocked by the same object,
+        # so it is tested first, the cache is cleared at the start of every tile
+        self.shadow_cache = {}
+        # the camera orientation, see Camera.view_basis, None for the fixed view down -z
+        # the animation renderer sets it, every frame can look in another direction
+        self.basis = None
+        # the anti-aliasing Sampler of the batch path, None for one ray through the pixel centre
+        self.sampler = None
+        # how many camera rays, shadow rays and reflected or refracted rays were traced,
+        # see reset_ray_counts
+        self.primary_rays = 0
+        self.shadow_rays = 0
+        self.secondary_rays = 0
+        # the bounces of the wavefront for reflective and transparent materials
+        self.max_depth = MAX_DEPTH
+        # the Profiler of main.py --profile, None when the render is not profiled
+        self.profiler = None
+        # the shading constants of the scene, see get_shading
+        self.shading = None
+        # the Phong specular highlights, off for the matte look, see calcSpecular
+        self.specular = False
+        # the objects each camera ray of the per-pixel path can hit, see get_bins
+        self.bins = None
+
+    def reset_ray_counts(self):
+        self.primary_rays = 0
+        self.shadow_rays = 0
+        self.secondary_rays = 0
+
+    def reset_shadow_cache(self):
+        # forget the last occluders, called at the start of a tile
+        self.shadow_cache = {}
 
     def generate_ray(self, i, j):
         # Generate a ray from the camera through pixel (i, j) on the screen
@@ -29,9 +70,85 @@ class RayCaster:
         # it can be wrong
         px = (2 * (i + 0.5) / self.screen.width - 1) * self.aspect * self.scale
         py = (1 - 2 * (j + 0.5) / self.screen.height) * self.scale
-        direction = Vector3D(px, py, -1).normalize()
+        if self.basis is None:
+            direction = Vector3D(px, py, -1).normalize()
+        else:
+            # px * right + py * up - back
+            r, u, b = self.basis
+            direction = Vector3D(px * r[0] + py * u[0] - b[0],
+                                 px * r[1] + py * u[1] - b[1],
+                                 px * r[2] + py * u[2] - b[2]).normalize()
         return Ray(self.camera.position, direction)
 
+    def bins_key(self):
+        # the values the ScreenBins are made from: the version of the objects, the camera
+        # position, the view direction (basis) and the screen, by value and not by identity
+        # so a camera moved in place (Vector3D.iadd) or a resized screen is seen as well
+        position = self.camera.position
+        return (self.scene.version, position.x, position.y, position.z,
+                None if self.basis is None else self.basis.tobytes(),
+                self.screen.width, self.screen.height, self.aspect, self.scale)
+
+    def get_bins(self):
+        # the ScreenBins of the camera rays, rebuilt when anything in bins_key changed
+        # since they were made
+        # it is called once per tile (or per row of main.py's render_pixels), and every pixel
+        # gives shade the objects of its bin, bins.objects(i, j)
+        # a scene with a BVH gets bins that are turned off, the tree already skips the spheres
+        # a ray can not hit, and it does that for the shadow rays as well
+        key = self.bins_key()
+        bins = self.bins
+        if bins is None or bins.key != key:
+            bins = ScreenBins(self.scene.objects, self.camera.position, self.basis, self.screen.width,
+                              self.screen.height, self.aspect, self.scale, key,
+                              enabled=self.scene.get_bvh() is None)
+            self.bins = bins
+        return bins
+
+    def generate_rays(self, x0, y0, x1, y1):
+        # the batch version of generate_ray for every pixel in the rectangle
+        # [x0, x1) x [y0, y1), in row-major order (the same order as the main loop)
+        # it returns (origins, directions) as (N,3) arrays
+        ys, xs = np.mgrid[y0:y1, x0:x1]
+        return self.generate_pixel_rays(xs.ravel(), ys.ravel())
+
+    def packet_pixels(self, x0, y0, x1, y1):
+        # the pixels of the rectangle [x0, x1) x [y0, y1) as (xs, ys) arrays, ordered by
+        # PACKET_WIDTH x PACKET_WIDTH blocks (row-major inside a block and between blocks)
+        # so why not row-major like generate_rays ?
+        # the packed scene culls the spheres per packet of 64 consecutive rays (see
+        # PackedScene.packet_cull), 64 pixels of one row make a long thin packet that
+        # crosses many objects, an 8x8 block is a narrow cone that misses most of them
+        # the shadow rays are made in the same order, so their packets are compact too
+        # the rectangle is padded to whole blocks, cut into them with a reshape
+        # and the padding is dropped again
+        width, height = x1 - x0, y1 - y0
+        columns, rows = -(-width // PACKET_WIDTH), -(-height // PACKET_WIDTH)
+        ys, xs = np.mgrid[0:rows * PACKET_WIDTH, 0:columns * PACKET_WIDTH]
+        xs = xs.reshape(rows, PACKET_WIDTH, columns, PACKET_WIDTH).transpose(0, 2, 1, 3).ravel()
+        ys = ys.reshape(rows, PACKET_WIDTH, columns, PACKET_WIDTH).transpose(0, 2, 1, 3).ravel()
+        inside = (xs < width) & (ys < height)
+        return xs[inside] + x0, ys[inside] + y0
+
+    def generate_pixel_rays(self, xs, ys, dx=0.5, dy=0.5):
+        # generate_ray for any list of pixels, xs and ys are arrays of pixel coordinates
+        # dx and dy are the positions inside the pixels (scalars or arrays), 0.5 is the centre
+        # it returns (origins, directions) as (N,3) arrays, one row per pixel
+        i = np.asarray(xs, dtype=np.float64)
+        j = np.asarray(ys, dtype=np.float64)
+        # column-major like every (N,3) array of the batch path, see take_rows
+        directions = np.empty((len(i), 3), order='F')
+        directions[:, 0] = (2 * (i + dx) / self.screen.width - 1) * self.aspect * self.scale
+        directions[:, 1] = (1 - 2 * (j + dy) / self.screen.height) * self.scale
+        directions[:, 2] = -1.0
+        if self.basis is not None:
+            # from camera space to the world, the rows of basis are right, up and back
+            directions = np.matmul(directions, self.basis, out=np.empty_like(directions))
+        directions /= np.sqrt(directions[:, 0] ** 2 + directions[:, 1] ** 2 + directions[:, 2] ** 2)[:, None]
+        position = self.camera.position
+        origins = np.broadcast_to(np.array([position.x, position.y, position.z]), directions.shape)
+        return origins, directions
+
     def calcAmbient(self, material):
         # Calculate ambient light contribution
         # If no ambient light is set, return black
@@ -41,7 +158,7 @@ class RayCaster:
         ambient_intensity = self.scene.ambient_light.intensity.scalar_multiply(AMBIENT_MULTIPLIER)
         # the hadamard product is used to multiply the ambient light intensity with the material's diffuse color
         # for a more realistic ambient effect
-        return ambient_intensity.hadamard(material.diffuse_color).scalar_multiply(material.ambient_coef)
+        return ambient_intensity.hadamard_scaled(material.diffuse_color, material.ambient_coef)
 
     def calcDiffuse(self, P, N, material, light):
         # so the calcDiffuse method calculates the diffuse lighting contribution at point P
@@ -49,95 +166,563 @@ class RayCaster:
         # It uses the Lambertian reflectance model, which states that the intensity of light reflected
         L = light.get_direction(P)
         lambert = max(0.0, N.dot_product(L))
-        return light.get_intensity(P).hadamard(material.diffuse_color).scalar_multiply(material.diffuse_coef * lambert)
+        return light.get_intensity(P).hadamard_scaled(material.diffuse_color, material.diffuse_coef * lambert)
 
     def calcSpecular(self, P, N, V, material, light):
-        return DEFAULT_VACTOR
+        # the Phong specular term: intensity * ks * max(0, V . R) ** shininess, R = (-L).reflect(N)
+        # V is the unit direction from P towards the viewer
+        # so how is it fast ?
+        # V . R is worked out without R: 2 (N . L) (V . N) - V . L, and the power comes from
+        # the SpecularTable of the packed scene, below its cutoff the highlight is too weak
+        # to see and nothing is computed
+        # a light behind the surface (N . L <= 0) gives no highlight
+        if not self.specular or material.specular_coef <= 0:
+            return DEFAULT_VACTOR
+        L = light.get_direction(P)
+        ln = N.dot_product(L)
+        if ln <= 0:
+            return DEFAULT_VACTOR
+        x = 2.0 * ln * V.dot_product(N) - V.dot_product(L)
+        table = self.scene.get_packed().specular
+        row = table.row(material.shininess)
+        if x <= table.row_cutoff(row, material.shininess):
+            return DEFAULT_VACTOR
+        power = table.power(row, material.shininess, x)
+        return light.get_intensity(P).scalar_multiply(material.specular_coef * SPECULAR_SCALE * power)
 
-    def shade(self, ray, depth=0):
+    def shade(self, ray, depth=0, objects=None):
         # the shade method is responsible for determining the color at a point of intersection
         # so if the ray intersects an object in the scene, it calculates the color based on the material properties and light sources.
         # the formula of shade calculates : color = ambient + diffuse + specular whic is sigma of the light sources 
-        obj, t, P, N = self.scene.find_nearest_intersection(ray)
+        # (the specular term only with self.specular)
+        self.primary_rays += 1
+        profiler = self.profiler
+        if profiler is not None:
+            start = time.perf_counter()
+        # objects is the screen bin of a camera ray (see get_bins), None tests every object
+        obj, t, P, N = self.scene.find_nearest_intersection(ray, objects)
+        if profiler is not None:
+            profiler.add_time('intersection', time.perf_counter() - start)
         # the if statement checks if there is no intersection
         if not obj:
             return self.scene.background_color
         # if the depth is greater than the maximum depth, return the background color
-        mat = obj.material
+        # the constants of the material and of the lights come from the shading table,
+        # they are the same for every pixel, see ShadingTable
+        shading = self.get_shading()
+        ar, ag, ab, cr, cg, cb, kd, ks, row, shininess, cutoff = shading.material(obj.material)
         # Ambient term
-        color = self.calcAmbient(mat)
+        # the color is accumulated in the three floats r, g, b
+        r, g, b = ar, ag, ab
+        # Shadow calculation with improved bias
+        # the shadow origin is the same for every light, so it is computed once
+        shadow_origin = P.add_scaled(N, BIAS * BIAS_MULTIPLIER)
+        px, py, pz = P.x, P.y, P.z
+        nx, ny, nz = N.x, N.y, N.z
+        if ks:
+            # V is the direction back to the viewer, -ray.direction
+            d = ray.direction
+            vx, vy, vz = -d.x, -d.y, -d.z
+            vn = vx * nx + vy * ny + vz * nz
         # Process each light source
         # Loop through all lights in the scene, including point lights
         # and calculate the contribution of each light to the color at point P.
-        # the for loop iterates through all lights in the scene, including point lights
-        # by recursively calling the in_shadow method to check if the point is in shadow
         # PSUDOCODE:
-        # for each light in scene.lights + scene.point_lights:
-        #     L = light.get_direction(P)
-        #    light_dist = light.get_distance(P) if hasattr(light, 'get_distance') else float('inf')
-        #    shadow_origin = P.add(N.scalar_multiply(BIAS * BIAS_MULTIPLIER))
+        # for each light in the light table:
+        #    L = direction from P to the light (fixed for a directional light)
+        #    light_dist = distance from P to a point light, infinite for a directional light
         #    in_shadow = self.in_shadow(shadow_origin, L, light_dist)
+        #    (for an area light the blocked fraction of its shadow rays, see area_shadow)
+        #    diffuse = intensity (attenuated for a point light) * color * kd * max(0, N . L)
         #    if in_shadow:
-        #        diff = self.calcDiffuse(P, N, mat, light).scalar_multiply(SHADOW_DIFFUSE)
-        #        color = color.add(diff)
-        #    else:
-        #        diffuse = self.calcDiffuse(P, N, mat, light)
-        #        color = color.add(diffuse)
-        for i, light in enumerate(self.scene.lights + self.scene.point_lights):
-            L = light.get_direction(P)
-            # Calculate distance to light for point lights
-            # if the light has a get_distance method, it is a point light
-            # and we calculate the distance from the point P to the light source.
-            if hasattr(light, 'get_distance'):
-                light_dist = light.get_distance(P)
+        #        diffuse = diffuse * SHADOW_DIFFUSE
+        #    color = color + diffuse
+        #    if specular and not in_shadow and V . R > cutoff:
+        #        color = color + intensity * ks * SPECULAR_SCALE * table power of V . R
+        for i, is_point, lx, ly, lz, L, ir, ig, ib, linear_att, quadratic_att, area in shading.lights:
+            if is_point:
+                # the direction and the distance to a point light depend on P,
+                # the same numbers as light.get_direction(P) and light.get_distance(P)
+                dx, dy, dz = lx - px, ly - py, lz - pz
+                light_dist = math.sqrt(dx * dx + dy * dy + dz * dz)
+                if light_dist == 0:
+                    L = Vector3D(0.0, 0.0, 0.0)
+                else:
+                    L = Vector3D(dx / light_dist, dy / light_dist, dz / light_dist)
+                # Quadratic attenuation: I = I0 / (1 + a*d + b*d²), clamped like PointLight.get_intensity
+                factor = max(1.0 / (1.0 + linear_att * light_dist + quadratic_att * light_dist * light_dist), 0.01)
+                ir, ig, ib = ir * factor, ig * factor, ib * factor
             else:
-                light_dist = float('inf') 
-            # Shadow calculation with improved bias
-            shadow_origin = P.add(N.scalar_multiply(BIAS * BIAS_MULTIPLIER))
+                light_dist = float('inf')
             # so if shadow_origin is the point P offset by the normal N scaled by a bias factor
             # to avoid self-shadowing artifacts, we check if the point is in shadow
             # by calling the in_shadow method with the shadow origin, light direction, and distance to the light.
-            in_shadow = self.in_shadow(shadow_origin, L, light_dist)
+            if profiler is not None:
+                start = time.perf_counter()
+            if area is None:
+                in_shadow = self.in_shadow(shadow_origin, L, light_dist, light_index=i)
+                shadow = 1.0 if in_shadow else 0.0
+            else:
+                shadow = self.area_shadow(area, P, shadow_origin, light_index=i)
+                in_shadow = shadow >= 1.0
+            if profiler is not None:
+                profiler.add_time('shadows', time.perf_counter() - start)
+                if area is None:
+                    profiler.count('shadow rays blocked', in_shadow)
+            # the Lambertian diffuse term, the same products as calcDiffuse
+            ln = nx * L.x + ny * L.y + nz * L.z
+            scale = kd * max(0.0, ln)
+            dr, dg, db = ir * cr * scale, ig * cg * scale, ib * cb * scale
             if in_shadow:
                 # Darker shadows
-                # calculate the diffuse term for shadows
-                # if the point is in shadow, we calculate the diffuse term 
+                # if the point is in shadow, the diffuse term is kept
                 # but with a reduced intensity to simulate shadowing effects.
-                # the scalar_multiply method is used to scale the diffuse term by a shadow factor
-                # to make the shadows darker but not too dark.
                 # This is a more subtle shadow effect
-                diff = self.calcDiffuse(P, N, mat, light).scalar_multiply(SHADOW_DIFFUSE)
-                # Add the shadowed diffuse term to the color
-                # the add method is used to add the shadowed diffuse term to the color
-                color = color.add(diff)
+                dr, dg, db = dr * SHADOW_DIFFUSE, dg * SHADOW_DIFFUSE, db * SHADOW_DIFFUSE
+            elif shadow:
+                # the penumbra of an area light, between SHADOW_DIFFUSE and 1
+                soft = SHADOW_DIFFUSE + (1.0 - SHADOW_DIFFUSE) * (1.0 - shadow)
+                dr, dg, db = dr * soft, dg * soft, db * soft
+            r += dr
+            g += dg
+            b += db
+            # the specular highlight, the same numbers as calcSpecular
+            if ks and ln > 0 and not in_shadow:
+                x = 2.0 * ln * vn - (vx * L.x + vy * L.y + vz * L.z)
+                if x > cutoff:
+                    s = ks * shading.specular.power(row, shininess, x)
+                    if shadow:
+                        s *= 1.0 - shadow
+                    r += ir * s
+                    g += ig * s
+                    b += ib * s
+        # Clamp and return
+        return Vector3D(max(min(r, 1.0), 0.0), max(min(g, 1.0), 0.0), max(min(b, 1.0), 0.0))
+
+    def get_shading(self):
+        # the ShadingTable of the scene, rebuilt when objects or lights were added
+        # or the scene was invalidated since it was made
+        version = (self.scene.version, self.scene.light_version, self.specular)
+        if self.shading is None or self.shading.version != version:
+            specular = self.scene.get_packed().specular if self.specular else None
+            self.shading = ShadingTable(self.scene, AMBIENT_MULTIPLIER, version, specular, SPECULAR_SCALE)
+        return self.shading
+
+    def light_batch(self, light, P):
+        # the batch version of light.get_direction and light.get_distance and of the
+        # attenuation of light.get_intensity, for an (N,3) array of points
+        # returns (L, distance, factor), factor is the (N,) attenuation of a point light
+        # or None for a directional light, see light_intensity
+        if hasattr(light, 'position'):
+            # point light, the direction and attenuation depend on the point
+            to_light = np.array([light.position.x, light.position.y, light.position.z]) - P
+            distance = np.sqrt(to_light[:, 0] ** 2 + to_light[:, 1] ** 2 + to_light[:, 2] ** 2)
+            L = to_light / np.where(distance == 0, 1.0, distance)[:, None]
+            # Quadratic attenuation: I = I0 / (1 + a*d + b*d²), same as PointLight.get_intensity
+            linear_att = light.attenuation
+            quadratic_att = light.attenuation * 0.1
+            factor = np.maximum(1.0 / (1.0 + linear_att * distance + quadratic_att * distance * distance), 0.01)
+            return L, distance, factor
+        # directional light, the same for every point
+        L = light.get_direction(None)
+        L = np.broadcast_to(np.array(L.point()), P.shape)
+        distance = np.full(len(P), float('inf'))
+        return L, distance, None
+
+    def light_intensity(self, light, factor):
+        # the intensity of a light at the points, from the factor of light_batch:
+        # an (N,3) array for a point light, the (3,) intensity for a directional light
+        if factor is None:
+            return np.array(light.intensity.point())
+        # column-major like the colors it is multiplied with, see take_rows
+        return np.multiply(np.array(light.intensity.point()), factor[:, None], out=np.empty((len(factor), 3), order='F'))
+
+    def shade_batch(self, origins, directions):
+        # the batch version of shade, for (N,3) arrays of rays
+        # it returns an (N,3) array of colors with the same formula:
+        # color = ambient + sigma over lights of (diffuse, darkened when in shadow)
+        # it is done in two halves: gbuffer_batch traces the rays and the shadow rays,
+        # shade_gbuffer turns that into colors with the materials and the light intensities,
+        # so a GBuffer can keep the first half and redo only the second one
+        # a scene with reflective or transparent materials goes through shade_wavefront
+        if self.scene.get_packed().secondary:
+            return self.shade_wavefront(origins, directions)
+        return self.shade_gbuffer(*self.gbuffer_batch(origins, directions))
+
+    def shade_wavefront(self, origins, directions):
+        # shade_batch with reflection and refraction
+        # so how does the wavefront work ?
+        # instead of shade calling itself for every reflected ray (python recursion, one ray
+        # at a time), all the rays of one bounce are a wavefront: arrays of origins, directions,
+        # the pixel (owner) each ray belongs to and its weight in that pixel
+        # a whole wavefront is traced and shaded in bulk with gbuffer_batch and shade_gbuffer,
+        # every ray adds weight * (1 - kr - kt) * its color to its pixel, and the reflective
+        # and transparent hits make the rays of the next wavefront:
+        #   reflection - weight * kr, direction d - 2 (d . N) N
+        #   refraction - weight * kt, direction from Snell's law with the material's ior,
+        #                total internal reflection turns it into a reflection
+        # rays with a weight below MIN_CONTRIBUTION are not traced, and at the last bounce
+        # (max_depth) a surface is shaded as if it were matte
+        # the next wavefront is sorted by direction octant, so neighbouring rays in the
+        # arrays go the same way through the BVH
+        # a matte pixel gets exactly the color of shade_gbuffer (1.0 * color)
+        count = len(directions)
+        colors = np.zeros((count, 3))
+        packed = self.scene.get_packed()
+        owner = np.arange(count)
+        weight = np.ones(count)
+        depth = 0
+        while len(directions):
+            parts = []
+            for start in range(0, len(directions), BATCH_SIZE):
+                ids, t, P, N, lights = self.gbuffer_batch(origins[start:start + BATCH_SIZE],
+                                                          directions[start:start + BATCH_SIZE], secondary=depth > 0)
+                parts.append((ids, P, N, self.shade_gbuffer(ids, t, P, N, lights)))
+            ids, P, N, local = (np.concatenate(part) for part in zip(*parts))
+            hit = np.flatnonzero(ids >= 0)
+            kr, kt = np.zeros(len(ids)), np.zeros(len(ids))
+            if depth < self.max_depth:
+                kr[hit] = packed.reflectivity[ids[hit]]
+                kt[hit] = packed.transparency[ids[hit]]
+            own = weight * np.maximum(0.0, 1.0 - kr - kt)
+            for channel in range(3):
+                colors[:, channel] += np.bincount(owner, weights=own * local[:, channel], minlength=count)
+            rays = [self.reflection_rays(np.flatnonzero(weight * kr >= MIN_CONTRIBUTION), P, N, directions, kr),
+                    self.refraction_rays(np.flatnonzero(weight * kt >= MIN_CONTRIBUTION), ids, P, N, directions, kt)]
+            rays = [(o, d, owner[rows], weight[rows] * w) for rows, o, d, w in rays if len(rows)]
+            if not rays:
+                break
+            origins, directions, owner, weight = (np.concatenate(part) for part in zip(*rays))
+            order = np.argsort((directions[:, 0] < 0) * 4 + (directions[:, 1] < 0) * 2 + (directions[:, 2] < 0),
+                               kind='stable')
+            origins, directions, owner, weight = origins[order], directions[order], owner[order], weight[order]
+            depth += 1
+        return np.clip(colors, 0.0, 1.0)
+
+    def reflection_rays(self, rows, P, N, directions, kr):
+        # the reflected rays of the hits rows, returns (rows, origins, directions, weights)
+        # the origin moves off the surface on the side the ray came from
+        d, n = directions[rows], N[rows]
+        dn = d[:, 0] * n[:, 0] + d[:, 1] * n[:, 1] + d[:, 2] * n[:, 2]
+        reflected = d - 2.0 * dn[:, None] * n
+        side = np.where(dn < 0, BIAS * BIAS_MULTIPLIER, -BIAS * BIAS_MULTIPLIER)
+        return rows, P[rows] + n * side[:, None], reflected, kr[rows]
+
+    def refraction_rays(self, rows, ids, P, N, directions, kt):
+        # the refracted rays of the hits rows, returns (rows, origins, directions, weights)
+        # the same rule as Vector3D.refract: a ray against the normal enters the object
+        # (eta = 1 / ior), a ray along the normal leaves it (eta = ior)
+        d = directions[rows]
+        cosi = np.clip(d[:, 0] * N[rows, 0] + d[:, 1] * N[rows, 1] + d[:, 2] * N[rows, 2], -1.0, 1.0)
+        ior = self.scene.get_packed().ior[ids[rows]]
+        entering = cosi < 0
+        # n is the normal on the side of the incoming ray
+        n = np.where(entering[:, None], N[rows], -N[rows])
+        cosi = np.abs(cosi)
+        eta = np.where(entering, 1.0 / ior, ior)
+        k = 1.0 - eta * eta * (1.0 - cosi * cosi)
+        refracted = eta[:, None] * d + (eta * cosi - np.sqrt(np.maximum(k, 0.0)))[:, None] * n
+        # total internal reflection: the ray is reflected back on the incoming side
+        total = k < 0
+        refracted[total] = d[total] + 2.0 * cosi[total][:, None] * n[total]
+        refracted /= np.sqrt(refracted[:, 0] ** 2 + refracted[:, 1] ** 2 + refracted[:, 2] ** 2)[:, None]
+        side = np.where(total, BIAS * BIAS_MULTIPLIER, -BIAS * BIAS_MULTIPLIER)
+        return rows, P[rows] + n * side[:, None], refracted, kt[rows]
+
+    def gbuffer_batch(self, origins, directions, secondary=False):
+        # everything of shade_batch that depends on the geometry only
+        # returns (ids, t, P, N, lights):
+        #   ids, t, P, N - the nearest hit of every ray, like find_nearest_intersection_batch
+        #   lights       - for every light (scene.lights + scene.point_lights) a tuple
+        #                  (lambert, factor, shadowed, highlight) over the rays that hit something:
+        #                  max(0, N . L), the attenuation of light_batch (None for a
+        #                  directional light), whether the shadow ray was blocked (for an
+        #                  area light the fraction of its shadow rays that were blocked) and
+        #                  V . R for the specular term (None without self.specular,
+        #                  0 where there is no highlight: N . L <= 0 or in shadow, see calcSpecular)
+        # secondary is True for the reflected and refracted rays of shade_wavefront
+        if secondary:
+            self.secondary_rays += len(directions)
+        else:
+            self.primary_rays += len(directions)
+        profiler = self.profiler
+        if profiler is not None:
+            start = time.perf_counter()
+        ids, t, P, N = self.scene.find_nearest_intersection_batch(origins, directions)
+        if profiler is not None:
+            profiler.add_time('intersection', time.perf_counter() - start)
+        hit = ids >= 0
+        lights = []
+        if not hit.any():
+            return ids, t, P, N, lights
+        # take_rows with the indices, a boolean gather of (N,3) rows is several times slower
+        hit_rows = np.flatnonzero(hit)
+        P_hit, N_hit = take_rows(P, hit_rows), take_rows(N, hit_rows)
+        shadow_origin = P_hit + N_hit * (BIAS * BIAS_MULTIPLIER)
+        if self.specular:
+            # the directions and twice d . N of the hits, for the highlights below
+            D = take_rows(directions, hit_rows)
+            dn2 = 2.0 * (D[:, 0] * N_hit[:, 0] + D[:, 1] * N_hit[:, 1] + D[:, 2] * N_hit[:, 2])
+        for i, light in enumerate(self.scene.lights + self.scene.point_lights):
+            L, light_dist, factor = self.light_batch(light, P_hit)
+            lambert = np.maximum(0.0, N_hit[:, 0] * L[:, 0] + N_hit[:, 1] * L[:, 1] + N_hit[:, 2] * L[:, 2])
+            # a shadow only scales the diffuse term, so points facing away from
+            # the light (lambert == 0) do not need a shadow ray at all
+            lit = np.flatnonzero(lambert > 0)
+            if profiler is not None:
+                start = time.perf_counter()
+            if hasattr(light, 'sample_points'):
+                # an area light, the blocked fraction of its shadow rays, see area_shadow_batch
+                shadowed = np.zeros(len(lambert))
+                shadowed[lit] = self.area_shadow_batch(light, take_rows(P_hit, lit), take_rows(shadow_origin, lit),
+                                                       light_index=i)
+                blocked = lit[shadowed[lit] >= 1.0]
             else:
-                # if the point is not in shadow, we calculate the diffuse term normally
-                # the calcDiffuse method is called to calculate the diffuse term
-                # and the result is added to the color.
-                # the diffuse term is calculated using the calcDiffuse method
-                diffuse = self.calcDiffuse(P, N, mat, light)
-                color = color.add(diffuse)
+                blocked = lit[self.in_shadow_batch(take_rows(shadow_origin, lit), take_rows(L, lit), light_dist[lit],
+                                                   light_index=i)]
+                shadowed = np.zeros(len(lambert), dtype=bool)
+                shadowed[blocked] = True
+                if profiler is not None:
+                    profiler.count('shadow rays blocked', len(blocked))
+            if profiler is not None:
+                profiler.add_time('shadows', time.perf_counter() - start)
+            highlight = None
+            if self.specular:
+                # V . R = 2 (N . L) (V . N) - V . L with V = -d, the direction back to the viewer
+                # the sums are done in place, every new array of the batch size costs page faults
+                # (the L of a directional light is one broadcast row, its columns are scalars)
+                highlight = D[:, 0] * L[:, 0]
+                highlight += D[:, 1] * L[:, 1]
+                highlight += D[:, 2] * L[:, 2]
+                highlight -= lambert * dn2
+                # zero where lambert is 0, a multiply by the mask is cheaper than a masked store
+                highlight *= lambert > 0
+                highlight[blocked] = 0.0
+            lights.append((lambert, factor, shadowed, highlight))
+        return ids, t, P, N, lights
+
+    def shade_gbuffer(self, ids, t, P, N, lights):
+        # the colors of the rays from the output of gbuffer_batch, as an (N,3) array,
+        # with the current materials (the packed tables) and light intensities
+        # no ray is traced here, it is only array math
+        colors = np.empty((len(ids), 3), order='F')
+        colors[:] = self.scene.background_color.point()
+        hit = np.flatnonzero(ids >= 0)
+        if not len(hit):
+            return colors
+        ids = ids[hit]
+        # material tables indexed by object id, gathered per ray
+        packed = self.scene.get_packed()
+        diffuse_color = take_rows(packed.diffuse_color, ids)
+        ambient_coef = packed.ambient_coef[ids]
+        diffuse_coef = packed.diffuse_coef[ids]
+        cutoff = packed.specular_cutoff[ids]
+        # Ambient term
+        if self.scene.ambient_light:
+            ambient_intensity = np.array(self.scene.ambient_light.intensity.point()) * AMBIENT_MULTIPLIER
+            color = ambient_intensity * diffuse_color * ambient_coef[:, None]
+        else:
+            color = np.zeros((len(ids), 3), order='F')
+        all_lights = self.scene.lights + self.scene.point_lights
+        for light, (lambert, factor, shadowed, highlight) in zip(all_lights, lights):
+            intensity = self.light_intensity(light, factor)
+            diffuse = intensity * diffuse_color * (diffuse_coef * lambert)[:, None]
+            # Darker shadows, same SHADOW_DIFFUSE factor as the scalar path
+            # (times 1.0 leaves the lit points exactly as they are)
+            # an area light goes from SHADOW_DIFFUSE to 1 with the fraction of it that is visible
+            soft = shadowed.dtype != bool
+            if soft:
+                diffuse *= (SHADOW_DIFFUSE + (1.0 - SHADOW_DIFFUSE) * (1.0 - shadowed))[:, None]
+            else:
+                diffuse *= np.where(shadowed, SHADOW_DIFFUSE, 1.0)[:, None]
+            color += diffuse
+            if highlight is not None:
+                # the specular highlights, only the points above the cutoff of their material
+                # go through the table, see calcSpecular
+                rows = np.flatnonzero(highlight > cutoff)
+                if len(rows):
+                    object_ids = ids[rows]
+                    power = packed.specular_power(object_ids, highlight[rows])
+                    s = packed.specular_coef[object_ids] * SPECULAR_SCALE * power
+                    if soft:
+                        s *= 1.0 - shadowed[rows]
+                    # one channel (a contiguous column) at a time, color[rows] += (K,3)
+                    # gathers and scatters whole rows and costs about three times as much
+                    for channel in range(3):
+                        weight = intensity[channel] if factor is None else intensity[rows, channel]
+                        color[:, channel][rows] += weight * s
         # Clamp and return
-        return color.clamp()
+        put_rows(colors, hit, np.clip(color, 0.0, 1.0))
+        return colors
+
+    def area_shadow_batch(self, light, points, origins, light_index=None):
+        # the fraction of the shadow rays from the (K,3) points to an AreaLight that are
+        # blocked, as a (K,) array, origins are the points moved off the surface
+        # so what is adaptive here ?
+        # the light.probes probe rays (the corners of the emitter) of all the points are one
+        # batch of in_shadow_batch, the points whose probes all agree are fully lit (0) or fully
+        # shadowed (1), and only the others, the penumbra, get the rest of the samples,
+        # again all together as one batch
+        K = len(points)
+        fraction = np.zeros(K)
+        if not K:
+            return fraction
+        probes = light.probes
+        blocked = self.area_rays_blocked(light, points, origins, np.arange(probes), light_index)
+        count = blocked.sum(axis=1)
+        fraction[:] = count / probes
+        penumbra = np.flatnonzero((count > 0) & (count < probes))
+        if len(penumbra) and light.samples > probes:
+            rest = self.area_rays_blocked(light, points[penumbra], origins[penumbra],
+                                          np.arange(probes, light.samples), light_index)
+            fraction[penumbra] = (count[penumbra] + rest.sum(axis=1)) / light.samples
+        if self.profiler is not None:
+            self.profiler.count('area light points', K)
+            self.profiler.count('penumbra points', len(penumbra))
+        return fraction
+
+    def area_rays_blocked(self, light, points, origins, cells, light_index):
+        # the (K,C) blocked flags of the shadow rays from the points to the cells of the light
+        targets = light.sample_points(points, cells)
+        to_light = targets - points[:, None, :]
+        distance = np.sqrt(to_light[..., 0] ** 2 + to_light[..., 1] ** 2 + to_light[..., 2] ** 2)
+        dirs = to_light / np.where(distance == 0, 1.0, distance)[..., None]
+        starts = np.repeat(origins, len(cells), axis=0)
+        blocked = self.in_shadow_batch(starts, dirs.reshape(-1, 3), distance.ravel(), light_index=light_index)
+        if self.profiler is not None:
+            self.profiler.count('shadow rays blocked', int(np.count_nonzero(blocked)))
+        return blocked.reshape(len(points), len(cells))
+
+    def in_shadow_batch(self, origins, light_dirs, max_dist, light_index=None):
+        # the batch version of in_shadow, returns a boolean array
+        # light_dirs must already be unit vectors (light_batch returns them normalized)
+        # the object that blocked the most rays of this light last time is tested
+        # first, and only the rays it does not block are tested against the rest:
+        # the objects outside the BVH all at once through the packed arrays, then the tree
+        self.shadow_rays += len(origins)
+        packed = self.scene.get_packed()
+        t_max = max_dist - BIAS * 2
+        bvh = self.scene.get_bvh()
+        linear = np.asarray(self.scene.bvh_outside if bvh is not None else range(packed.count), dtype=np.int64)
+        hint = self.shadow_cache.get(light_index, -1)
+        if hint >= 0:
+            blocker = packed.first_occluder(np.array([hint]), origins, light_dirs, BIAS, t_max)
+            todo = np.flatnonzero(blocker < 0)
+            linear = linear[linear != hint]
+            if len(linear) and len(todo):
+                blocker[todo] = packed.first_occluder(linear, take_rows(origins, todo), take_rows(light_dirs, todo),
+                                                      BIAS, t_max[todo])
+                todo = todo[blocker[todo] < 0]
+        else:
+            blocker = packed.first_occluder(linear, origins, light_dirs, BIAS, t_max)
+            todo = np.flatnonzero(blocker < 0)
+        if bvh is not None and len(todo):
+            blocker[todo] = bvh.find_occluders_batch(take_rows(origins, todo), take_rows(light_dirs, todo),
+                                                     np.full(len(todo), BIAS),
+                                                     t_max[todo], packed.intersect_index_batch)
+        shadowed = blocker >= 0
+        if light_index is not None and shadowed.any():
+            self.shadow_cache[light_index] = int(np.bincount(blocker[shadowed]).argmax())
+        return shadowed
+
+    def render_tile(self, x0, y0, x1, y1):
+        # render the pixels [x0, x1) x [y0, y1) with the batch path
+        # it returns an (y1 - y0, x1 - x0, 3) array of colors
+        # the pixels are traced in blocks, see packet_pixels
+        xs, ys = self.packet_pixels(x0, y0, x1, y1)
+        if self.sampler is None or self.sampler.threshold <= 0:
+            # no anti-aliasing, or every pixel gets all the samples (the default threshold 0),
+            # then there is no need to trace the pixel centres first
+            colors = np.empty((y1 - y0, x1 - x0, 3))
+            colors[ys - y0, xs - x0] = self.shade_pixels(xs, ys)
+            return colors
+        # anti-aliasing: the pixel centres of the tile and of a one pixel border around it first,
+        # the border gives the pixels on the tile edge their neighbours, so which pixels
+        # are supersampled does not depend on the tile size
+        bx0, by0 = max(x0 - 1, 0), max(y0 - 1, 0)
+        bx1, by1 = min(x1 + 1, self.screen.width), min(y1 + 1, self.screen.height)
+        xs, ys = self.packet_pixels(bx0, by0, bx1, by1)
+        centres = np.empty((by1 - by0, bx1 - bx0, 3))
+        centres[ys - by0, xs - bx0] = self.shade_pixels(xs, ys, supersample=False)
+        inside = (slice(y0 - by0, y1 - by0), slice(x0 - bx0, x1 - bx0))
+        colors = centres[inside].copy()
+        ty, tx = np.nonzero(self.sampler.needs_samples(centres)[inside])
+        if len(ty):
+            colors[ty, tx] = self.shade_pixels(tx + x0, ty + y0)
+        return colors
+
+    def shade_pixels(self, xs, ys, supersample=True):
+        # the colors of any list of pixels with the batch path, as an (N,3) array
+        # used by render_tile and by the progressive renderer, which only traces some of the pixels
+        # with a sampler (and supersample) every pixel gets sampler.samples rays, they are traced
+        # in the same batch as the other pixels' rays and then averaged with the sampler's filter
+        # the rays are traced in chunks of BATCH_SIZE to keep the memory bounded
+        self.reset_shadow_cache()
+        xs, ys = np.asarray(xs), np.asarray(ys)
+        sampler = self.sampler if supersample else None
+        colors = np.empty((len(xs), 3))
+        step = BATCH_SIZE if sampler is None else max(1, BATCH_SIZE // sampler.samples)
+        for start in range(0, len(xs), step):
+            x, y = xs[start:start + step], ys[start:start + step]
+            if sampler is None:
+                origins, directions = self.generate_pixel_rays(x, y)
+                colors[start:start + step] = self.shade_batch(origins, directions)
+                continue
+            offsets = sampler.offsets(x, y)
+            origins, directions = self.generate_pixel_rays(np.repeat(x, sampler.samples), np.repeat(y, sampler.samples),
+                                                           offsets[:, :, 0].ravel(), offsets[:, :, 1].ravel())
+            # a C-ordered copy of the column-major colors, the einsum of resolve sums in another
+            # order over a strided view of them
+            samples = np.ascontiguousarray(self.shade_batch(origins, directions)).reshape(len(x), sampler.samples, 3)
+            colors[start:start + step] = sampler.resolve(samples, offsets)
+        return colors
+
+    def render_batch(self):
+        # render the whole screen with the batch path
+        return self.render_tile(0, 0, self.screen.width, self.screen.height)
+
+    def area_shadow(self, light, P, origin, light_index=None):
+        # the scalar version of area_shadow_batch for one point: the probe rays first,
+        # the rest of the samples only when they disagree
+        probes = light.probes
+        count = self.area_rays_blocked_scalar(light, P, origin, range(probes), light_index)
+        if self.profiler is not None:
+            self.profiler.count('area light points')
+        if count == 0 or count == probes or light.samples == probes:
+            return count / probes
+        if self.profiler is not None:
+            self.profiler.count('penumbra points')
+        count += self.area_rays_blocked_scalar(light, P, origin, range(probes, light.samples), light_index)
+        return count / light.samples
+
+    def area_rays_blocked_scalar(self, light, P, origin, cells, light_index):
+        # how many of the shadow rays from the point P to the cells of the light are blocked,
+        # in plain floats (light.sample_points_scalar), no numpy arrays for a single point
+        count = 0
+        px, py, pz = P.x, P.y, P.z
+        for tx, ty, tz in light.sample_points_scalar(px, py, pz, cells):
+            dx, dy, dz = tx - px, ty - py, tz - pz
+            distance = math.sqrt(dx * dx + dy * dy + dz * dz)
+            if distance == 0:
+                direction = Vector3D(0.0, 0.0, 0.0)
+            else:
+                direction = Vector3D(dx / distance, dy / distance, dz / distance)
+            count += self.in_shadow(origin, direction, distance, light_index)
+        if self.profiler is not None:
+            self.profiler.count('shadow rays blocked', count)
+        return count
 
-    def in_shadow(self, origin, light_dir, max_dist):
+    def in_shadow(self, origin, light_dir, max_dist, light_index=None):
         # the is shadow method checks if a point is in shadow with respect to a light source.
         # It casts a shadow ray from the point towards the light source
         # and checks for intersections with objects in the scene.
+        self.shadow_rays += 1
         shadow_ray = Ray(origin, light_dir)
-        # Set the maximum distance for shadow ray
-        for obj in self.scene.objects:
-            # the hit statement checks if the shadow ray intersects with any object in the scene
-            # This method checks if and where the ray hits this object.
-            # PSUDOCODE:
-            # for each object in scene.objects:
-            #     hit, t, _, _ = obj.intersect(shadow_ray)
-            # If the ray hits an object, we check the distance t
-            # to determine if the intersection is within the shadow bounds.
-            # If the ray hits an object, we check the distance t
-            # to determine if the intersection is within the shadow bounds.
-            hit, t, _, _ = obj.intersect(shadow_ray)
-            # More precise shadow bounds checking
-            if hit and BIAS < t < (max_dist - BIAS * 2):
-                return True
-        return False
\ No newline at end of file
+        # the shadow ray only needs a yes/no answer, so scene.find_occluder
+        # uses obj.occludes (no hit point, no normal) and stops at the first blocker
+        # More precise shadow bounds checking: BIAS < t < max_dist - 2 * BIAS
+        hint = self.shadow_cache.get(light_index, -1)
+        blocker = self.scene.find_occluder(shadow_ray, BIAS, max_dist - BIAS * 2, hint)
+        if blocker >= 0 and light_index is not None:
+            self.shadow_cache[light_index] = blocker
+        return blocker >= 0
@@ -0,0 +1,175 @@
+import time
+import signal
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict, deque
+from Models.Vector3D import Vector3D
+from Models.Screen import Screen
+from Models.Camera import Camera
+from Models.Scene import Scene
+from Service.Parser import parse_text
+from Service.SceneBuilder import add_lights, add_objects
+from Service.RayCaster import RayCaster
+from Service.Sampler import Sampler, SAMPLE_PATTERNS, FILTERS
+from Handler.ScreenHandler import png_bytes
+
+WORKER_SCENES = 32      # prepared scenes kept by every worker, the least recently used one goes first
+RECENT_JOBS = 100       # finished jobs kept for the status report
+MAX_SIZE = 4096         # largest image edge a job can ask for
+MAX_SAMPLES = 64
+
+# the prepared scenes of a worker process, scene hash -> (scene data, Scene)
+_worker_scenes = OrderedDict()
+
+def job_settings(query):
+    # the render settings of a job from a dict of strings (the query of the HTTP request),
+    # every setting is checked here, in the server, so a bad job never reaches a worker
+    # width and height default to the scene's resolution, with only one of them given
+    # the other one keeps the proportions of the scene
+    settings = {}
+    for name in ('width', 'height', 'samples'):
+        if name in query:
+            try:
+                settings[name] = int(query[name])
+            except ValueError:
+                raise ValueError(f"{name} must be a whole number, not {query[name]!r}")
+    for name in ('width', 'height'):
+        if name in settings and not 1 <= settings[name] <= MAX_SIZE:
+            raise ValueError(f"{name} must be between 1 and {MAX_SIZE}")
+    settings.setdefault('samples', 1)
+    if not 1 <= settings['samples'] <= MAX_SAMPLES:
+        raise ValueError(f"samples must be between 1 and {MAX_SAMPLES}")
+    settings['sample_pattern'] = query.get('sample_pattern', 'stratified')
+    if settings['sample_pattern'] not in SAMPLE_PATTERNS:
+        raise ValueError(f"sample_pattern must be one of {', '.join(SAMPLE_PATTERNS)}")
+    settings['filter'] = query.get('filter', 'box')
+    if settings['filter'] not in FILTERS:
+        raise ValueError(f"filter must be one of {', '.join(FILTERS)}")
+    specular = query.get('specular', '0')
+    if specular not in ('0', '1'):
+        raise ValueError(f"specular must be 0 or 1, not {specular!r}")
+    settings['specular'] = specular == '1'
+    return settings
+
+def image_size(resolution, settings):
+    scene_width, scene_height = resolution
+    width, height = settings.get('width'), settings.get('height')
+    if width is None and height is None:
+        return scene_width, scene_height
+    if height is None:
+        return width, max(1, round(width * scene_height / scene_width))
+    if width is None:
+        return max(1, round(height * scene_width / scene_height)), height
+    return width, height
+
+def prepared_scene(text):
+    # the parsed scene data and the Scene with its BVH and packed arrays for a scene text,
+    # from the worker's cache when the same text was rendered before
+    # returns (data, scene, cached)
+    key = hashlib.sha256(text.encode()).hexdigest()
+    if key in _worker_scenes:
+        _worker_scenes.move_to_end(key)
+        return (*_worker_scenes[key], True)
+    data = parse_text(text)
+    scene = Scene()
+    scene.background_color = data.get('background') or Vector3D(0.1, 0.1, 0.2)
+    add_lights(scene, data)
+    add_objects(scene, data)
+    scene.prepare()
+    _worker_scenes[key] = (data, scene)
+    if len(_worker_scenes) > WORKER_SCENES:
+        _worker_scenes.popitem(last=False)
+    return data, scene, False
+
+def _init_worker():
+    # Ctrl-C in the terminal reaches the whole process group, the server stops its workers
+    # itself (close), so a worker does not die halfway through a job with a traceback
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def render_job(text, settings):
+    # runs in a worker: render one job and return its PNG bytes and timings
+    # a new RayCaster for every job is cheap, the scene is the part worth keeping warm
+    start = time.time()
+    data, scene, cached = prepared_scene(text)
+    setup = time.time()
+    width, height = image_size(data['resolution'], settings)
+    screen = Screen(data['camera_pos'], data['view_dir'], data['up_vec'], data['fov'], data['aspect'], width, height)
+    camera = Camera(data['camera_pos'], data['view_dir'], data['up_vec'], data['fov'], data['aspect'])
+    caster = RayCaster(camera, screen, scene)
+    caster.specular = settings['specular']
+    if settings['samples'] > 1:
+        caster.sampler = Sampler(settings['samples'], settings['sample_pattern'], settings['filter'])
+    colors = caster.render_batch()
+    rendered = time.time()
+    png = png_bytes(colors)
+    return {'png': png, 'width': width, 'height': height, 'scene_cached': cached, 'started': start,
+            'setup_time': setup - start, 'render_time': rendered - setup, 'encode_time': time.time() - rendered}
+
+class RenderService:
+    # RenderService keeps a pool of warm worker processes for many small renders
+    # so what is warm about them ?
+    # the workers are started once: python, numpy, Pillow and the renderer are imported once,
+    # and every worker keeps its last WORKER_SCENES scenes parsed and prepared (BVH, packed arrays),
+    # so a job on a scene text the worker has seen before only traces rays
+    # the jobs wait in the pool's task queue, render() blocks its caller (an HTTP thread)
+    # until the job is done, many callers can wait at the same time
+    # the service counts the jobs and keeps the timings of the last RECENT_JOBS for status()
+    def __init__(self, workers=1):
+        if workers < 1:
+            raise ValueError("Number of workers must be at least 1.")
+        self.workers = workers
+        self.pool = multiprocessing.Pool(workers, initializer=_init_worker)
+        self.lock = threading.Lock()
+        self.next_id = 1
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.recent = deque(maxlen=RECENT_JOBS)
+        self.started = time.time()
+
+    def render(self, text, settings):
+        # render a scene text with job_settings() settings, returns the job dict with 'png'
+        # an error of the job (a broken scene file) is raised here, in the caller
+        with self.lock:
+            job_id = self.next_id
+            self.next_id += 1
+            self.pending += 1
+        submitted = time.time()
+        try:
+            result = self.pool.apply_async(render_job, (text, settings)).get()
+        except Exception:
+            with self.lock:
+                self.pending -= 1
+                self.failed += 1
+            raise
+        finished = time.time()
+        job = {'id': job_id, 'width': result['width'], 'height': result['height'],
+               'scene_cached': result['scene_cached'], 'queue_time': max(0.0, result['started'] - submitted),
+               'setup_time': result['setup_time'], 'render_time': result['render_time'],
+               'encode_time': result['encode_time'], 'total_time': finished - submitted}
+        with self.lock:
+            self.pending -= 1
+            self.completed += 1
+            self.recent.append(job)
+        return {**job, 'png': result['png']}
+
+    def status(self):
+        # the queue and the timings as a dict, for GET /status
+        # the pool does not tell which jobs a worker has picked up, so the jobs beyond
+        # one per worker are the ones that wait in the queue
+        with self.lock:
+            recent = list(self.recent)
+            status = {'workers': self.workers, 'pending': self.pending,
+                      'queue_depth': max(0, self.pending - self.workers),
+                      'completed': self.completed, 'failed': self.failed,
+                      'uptime': time.time() - self.started}
+        if recent:
+            for name in ('queue_time', 'render_time', 'total_time'):
+                status[f"mean_{name}"] = sum(job[name] for job in recent) / len(recent)
+        status['recent_jobs'] = recent
+        return status
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
@@ -0,0 +1,126 @@
+import math
+import numpy as np
+
+SAMPLE_PATTERNS = ('stratified', 'blue-noise')
+FILTERS = ('box', 'tent', 'gaussian')
+GAUSSIAN_SIGMA = 0.5        # in pixels, for the gaussian filter
+BLUE_NOISE_CANDIDATES = 16  # candidates per point in the best-candidate construction
+DEFAULT_AA_THRESHOLD = 0.0  # centre color difference to a neighbour that makes a pixel get all its samples,
+                            # 0 gives every pixel all of them, adaptive sampling is opt-in
+MASK32 = 0xffffffff
+
+def hash_uniform(x, y, k, seed):
+    # a uniform number in [0, 1) for every (pixel x, pixel y, number k)
+    # so why a hash and not a random generator ?
+    # the jitter of a pixel must not depend on the order the pixels are traced in,
+    # so the image is the same for any tile size and any number of workers
+    # this is the murmur3 finalizer over a mix of the integer coordinates
+    h = (np.asarray(x, dtype=np.uint64) * 0x8da6b343
+         ^ np.asarray(y, dtype=np.uint64) * 0xd8163841
+         ^ np.asarray(k, dtype=np.uint64) * 0xcb1ab31f
+         ^ np.uint64((seed * 0x165667b1 + 0x27d4eb2f) & MASK32)) & MASK32
+    h ^= h >> 16
+    h = (h * 0x85ebca6b) & MASK32
+    h ^= h >> 13
+    h = (h * 0xc2b2ae35) & MASK32
+    h ^= h >> 16
+    return h / float(1 << 32)
+
+def neighbour_difference(colors):
+    # for an (H,W,3) image, the (H,W) largest difference of the r, g and b
+    # components between every pixel and its 4 neighbours
+    difference = np.zeros(colors.shape[:2])
+    across = np.abs(colors[:, 1:] - colors[:, :-1]).max(axis=2)
+    np.maximum(difference[:, 1:], across, out=difference[:, 1:])
+    np.maximum(difference[:, :-1], across, out=difference[:, :-1])
+    down = np.abs(colors[1:] - colors[:-1]).max(axis=2)
+    np.maximum(difference[1:], down, out=difference[1:])
+    np.maximum(difference[:-1], down, out=difference[:-1])
+    return difference
+
+def blue_noise_points(count, seed=0):
+    # count points in the unit square that keep away from each other (Mitchell's best candidate)
+    # every new point is the candidate farthest from the points so far,
+    # the distance wraps around the square so the set tiles without seams
+    rng = np.random.default_rng(seed)
+    points = rng.random((1, 2))
+    for i in range(1, count):
+        candidates = rng.random((BLUE_NOISE_CANDIDATES * i, 2))
+        delta = np.abs(candidates[:, None, :] - points[None, :, :])
+        delta = np.minimum(delta, 1.0 - delta)
+        nearest = (delta ** 2).sum(axis=2).min(axis=1)
+        points = np.vstack([points, candidates[np.argmax(nearest)]])
+    return points
+
+class Sampler:
+    # Sampler decides where inside a pixel the anti-aliasing samples go
+    # and how they are averaged back into one color
+    # the offsets are in pixel units, (0.5, 0.5) is the pixel centre that generate_ray uses
+    # patterns:
+    #   stratified - the pixel is cut into a grid of cells and every sample is jittered
+    #                inside its own cell, so the samples cannot clump together
+    #   blue-noise - one best-candidate point set shared by all pixels and shifted
+    #                (wrapping around) by a different random amount in every pixel
+    # filters (the weight of a sample by its distance from the pixel centre):
+    #   box      - all the samples count the same
+    #   tent     - (1 - |dx|) * (1 - |dy|)
+    #   gaussian - exp(-(dx^2 + dy^2) / (2 * sigma^2)) with sigma = GAUSSIAN_SIGMA
+    # the samples stay inside their pixel, so every pixel is still traced on its own
+    # adaptive sampling: RayCaster.render_tile first traces the pixel centres and only
+    # the pixels whose centre differs from a neighbour's by threshold or more get all
+    # the samples, the jagged edges are exactly those pixels, the flat areas keep one ray
+    # threshold 0 gives every pixel all its samples
+    def __init__(self, samples, pattern='stratified', filter='box', seed=0, threshold=DEFAULT_AA_THRESHOLD):
+        if samples < 1:
+            raise ValueError("Number of samples must be at least 1.")
+        if pattern not in SAMPLE_PATTERNS:
+            raise ValueError(f"Unknown sample pattern: {pattern}")
+        if filter not in FILTERS:
+            raise ValueError(f"Unknown filter: {filter}")
+        self.samples = samples
+        self.pattern = pattern
+        self.filter = filter
+        self.seed = seed
+        self.threshold = threshold
+        # the grid of cells for the stratified pattern, as square as possible
+        self.columns = math.ceil(math.sqrt(samples))
+        self.rows = math.ceil(samples / self.columns)
+        self.points = blue_noise_points(samples, seed) if pattern == 'blue-noise' else None
+
+    def needs_samples(self, centres):
+        # the (H,W) pixels of an (H,W,3) image of centre colors that get all the samples
+        if self.threshold <= 0:
+            return np.ones(centres.shape[:2], dtype=bool)
+        return neighbour_difference(centres) >= self.threshold
+
+    def offsets(self, xs, ys):
+        # the (N, samples, 2) sample offsets inside the pixels (xs, ys)
+        x = np.asarray(xs)[:, None]
+        y = np.asarray(ys)[:, None]
+        k = np.arange(self.samples)[None, :]
+        if self.samples == 1:
+            # one sample goes through the pixel centre, like the render without a sampler
+            return np.full((len(x), 1, 2), 0.5)
+        if self.pattern == 'stratified':
+            u = (k % self.columns + hash_uniform(x, y, 2 * k, self.seed)) / self.columns
+            v = (k // self.columns + hash_uniform(x, y, 2 * k + 1, self.seed)) / self.rows
+        else:
+            u = (self.points[:, 0] + hash_uniform(x, y, 0, self.seed)) % 1.0
+            v = (self.points[:, 1] + hash_uniform(x, y, 1, self.seed)) % 1.0
+        return np.stack([u, v], axis=2)
+
+    def weights(self, offsets):
+        # the (N, samples) filter weights of the offsets, they sum to 1 in every pixel
+        dx = offsets[:, :, 0] - 0.5
+        dy = offsets[:, :, 1] - 0.5
+        if self.filter == 'tent':
+            weights = (1.0 - np.abs(dx)) * (1.0 - np.abs(dy))
+        elif self.filter == 'gaussian':
+            weights = np.exp(-(dx * dx + dy * dy) / (2 * GAUSSIAN_SIGMA ** 2))
+        else:
+            weights = np.ones_like(dx)
+        return weights / weights.sum(axis=1, keepdims=True)
+
+    def resolve(self, colors, offsets):
+        # the (N,3) pixel colors from the (N, samples, 3) sample colors
+        return np.einsum('ns,nsc->nc', self.weights(offsets), colors)
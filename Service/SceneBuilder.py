@@ -0,0 +1,95 @@
+from Models.Vector3D          import Vector3D
+from Models.Objects.Sphere    import Sphere
+from Models.Objects.Plane     import Plane
+from Models.Material          import Material
+from Models.Lights.AreaLight  import AreaLight
+from Service.Parser           import SceneError
+
+ROW_CHUNK = 65536   # rows of the streaming parser's arrays converted to python floats at once
+
+def add_lights(scene, data):
+# the add light function can be use to add light sources to the scene
+# or to set ambient light
+# or to set point lights
+# the point light formula is:
+# I = I0 / (1 + a*d + b*d²)
+# and the ambient light formula is:
+# I = I0 * ambient_coef
+    if data['ambient_light']:
+        scene.set_ambient_light(data['ambient_light'])
+    for dl in data['lights']:
+        scene.add_light(dl)
+    # the i-th x line gives the i-th point light a size, see AreaLight
+    areas = iter(data.get('areas', []))
+    for number, pl in enumerate(data['point_lights'], 1):
+        extent = next(areas, None)
+        if extent is not None and any(extent[:6 if len(extent) >= 6 else 1]):
+            try:
+                pl = AreaLight.from_point(pl, extent)
+            except ValueError as error:
+                raise SceneError(f"x line {number}: {error}") from error
+        scene.add_point_light(pl)
+
+def rows(values):
+    # the rows of data['objects'] or data['colors'] as lists of python floats
+    # the streaming parser gives (N,4) arrays, they are converted a slice at a time
+    # so a huge scene never has a second full copy as python lists
+    if not hasattr(values, 'tolist'):
+        yield from values
+        return
+    for start in range(0, len(values), ROW_CHUNK):
+        yield from values[start:start + ROW_CHUNK].tolist()
+
+def add_objects(scene, data):
+    # the add objects function can be used to add objects to the scene
+    # it can handle both spheres and planes
+    # so in that case if the radius is negative it will be a plane
+    # after alot of testing it was decided that the radius of the plane
+    # will be the distance from the origin to the plane
+    # and the normal will be the direction of the plane
+    # if the radius is positive it will be a sphere
+    # and the position will be the center of the sphere
+    # the i-th color belongs to the i-th object
+    colors = rows(data['colors'])
+    materials = iter(data['materials'])
+    for number, (x,y,z,radius) in enumerate(rows(data['objects']), 1):
+        # Get color and shininess for this object
+        # If there are not enough colors, use default
+        color = next(colors, None)
+        if color is not None:
+            # Unpack color and shininess
+            # assuming colors are in the format (r, g, b, shininess)
+            cr,cg,cb,shin =     color
+        else:
+            # Default color and shininess
+            # This is a fallback in case there are fewer colors than objects
+            cr,cg,cb,shin =     1.0,1.0,1.0,10.0
+        # Create color and material for the object
+        # Using Vector3D for color and Material for shininess
+        col =   Vector3D(cr,cg,cb)
+        # Create material with color and shininess
+        mat =   Material(col, shininess=shin)
+        # the optional m line: reflectivity, transparency and index of refraction
+        reflection = next(materials, None)
+        if reflection is not None:
+            mat.reflectivity = reflection[0]
+            if len(reflection) > 1:
+                mat.transparency = reflection[1]
+            if len(reflection) > 2:
+                mat.ior = reflection[2]
+        # Check if radius is negative or positive
+        # If negative, create a plane; if positive, create a sphere
+        # This is a simple way to differentiate between the two types of objects
+        if radius < 0:
+            # Background plane (negative radius)
+            if x == y == z == 0:
+                raise SceneError(f"o line {number}: a plane needs a normal that is not zero")
+            norm =          Vector3D(x,y,z).normalize()
+            pl   =          Plane(norm, radius, col)
+            pl.material =   mat
+            scene.add_object(pl)
+        else:
+            # Regular sphere (positive radius)
+            sph =           Sphere(Vector3D(x,y,z), radius, col)
+            sph.material =  mat
+            scene.add_object(sph)
@@ -0,0 +1,84 @@
+import os
+import pickle
+import hashlib
+import logging
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_FOLDER = '.scene_cache'
+CACHE_FORMAT = 1    # bump when the layout of the parsed scene data changes
+HASH_BLOCK = 1 << 20
+
+def _source_digest():
+    # the hash of the parser code itself, so that a change to the parsing rules
+    # or to the light and camera heuristics never returns an old cached scene
+    import Service.Parser, Service.ParserServices
+    digest = hashlib.sha256()
+    for module in (Service.Parser, Service.ParserServices):
+        with open(module.__file__, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+class SceneCache:
+    # SceneCache keeps the fully resolved scene data of parse_file on disk
+    # so what is in it ?
+    # the scene data dict after parsing, after assign_intensities_properly and after
+    # analyze_scene_and_set_camera: lights with their final intensities, the camera decisions,
+    # so a cache hit skips the text parsing and all the heuristics
+    # the file name is the sha256 of the scene text, the parser source and CACHE_FORMAT,
+    # so an edited scene file (or an edited parser) simply misses, nothing is ever stale
+    # the entries are pickles, written to a temporary file first and renamed into place,
+    # so a render that is killed halfway or two renders at the same time never leave a broken entry
+    # a broken or unreadable entry counts as a miss
+    _source = None
+
+    def __init__(self, folder=DEFAULT_CACHE_FOLDER):
+        self.folder = folder
+        self.hits = 0
+        self.misses = 0
+
+    def file_key(self, path, variant=''):
+        # the cache key of a scene file, from its bytes read in blocks so that
+        # a huge scene file is never held in memory just to hash it
+        # variant keeps the entries of the two parsers apart
+        if SceneCache._source is None:
+            SceneCache._source = _source_digest()
+        digest = hashlib.sha256()
+        digest.update(f"{CACHE_FORMAT}:{SceneCache._source}:{variant}:".encode())
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.folder, key + '.pickle')
+
+    def load(self, key):
+        # the cached scene data for key, or None on a miss
+        try:
+            with open(self.path(key), 'rb') as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as error:
+            logger.warning("Ignoring unreadable scene cache entry %s: %s", self.path(key), error)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def store(self, key, data):
+        # write the scene data for key, a cache that cannot be written is only a warning
+        temporary = None
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            fd, temporary = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self.path(key))
+        except OSError as error:
+            logger.warning("Could not write the scene cache in %s: %s", self.folder, error)
+            if temporary is not None and os.path.exists(temporary):
+                os.remove(temporary)
@@ -0,0 +1,92 @@
+import pickle
+import signal
+import multiprocessing
+import numpy as np
+
+DEFAULT_TILE_SIZE = 64  # Tile edge in pixels, big enough to keep the numpy batches efficient
+
+# the ray caster of a worker process, set once by _init_worker
+_worker_caster = None
+_worker_batch = True
+
+def split_tiles(width, height, tile_size=DEFAULT_TILE_SIZE):
+    # split the screen into tiles of tile_size x tile_size pixels
+    # the tiles on the right and bottom edges can be smaller
+    # each tile is (x0, y0, x1, y1) and covers [x0, x1) x [y0, y1)
+    if tile_size < 1:
+        raise ValueError("Tile size must be at least 1 pixel.")
+    return [(x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height))
+            for y0 in range(0, height, tile_size)
+            for x0 in range(0, width, tile_size)]
+
+def trace_tile_pixels(caster, x0, y0, x1, y1):
+    # render a tile one pixel at a time with generate_ray and shade,
+    # exactly like the per-pixel loop in main.py
+    caster.reset_shadow_cache()
+    # the screen bins are looked up once per tile, every pixel only tests the objects of its bin
+    bins = caster.get_bins()
+    colors = np.empty((y1 - y0, x1 - x0, 3))
+    for j in range(y0, y1):
+        for i in range(x0, x1):
+            col = caster.shade(caster.generate_ray(i, j), depth=0, objects=bins.objects(i, j))
+            colors[j - y0, i - x0] = (col.x, col.y, col.z)
+    return colors
+
+def trace_tile(caster, tile, batch=True):
+    # render one tile with the batch path or the per-pixel path
+    if batch:
+        return caster.render_tile(*tile)
+    return trace_tile_pixels(caster, *tile)
+
+def _init_worker(payload, batch):
+    # runs once in every worker process
+    # the ray caster (with its scene and camera) is unpickled only once per worker,
+    # not once per tile
+    global _worker_caster, _worker_batch
+    # the pool stops its workers with SIGTERM, a handler the parent set for itself
+    # (main.py's checkpointed render) must not run in them
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    _worker_caster = pickle.loads(payload)
+    _worker_batch = batch
+
+def _render_worker_tile(tile):
+    return tile, trace_tile(_worker_caster, tile, _worker_batch)
+
+class TileRenderer:
+    # TileRenderer splits the screen into tiles and renders them on a process pool
+    # every tile is independent, so the workers never talk to each other
+    # the parent only sends tile coordinates and copies the finished tiles into the frame
+    # because the same code renders each pixel in the serial and the parallel case,
+    # the output does not depend on the number of workers or the tile size
+    def __init__(self, caster, workers=1, tile_size=DEFAULT_TILE_SIZE, batch=True):
+        if workers < 1:
+            raise ValueError("Number of workers must be at least 1.")
+        self.caster = caster
+        self.workers = workers
+        self.tile_size = tile_size
+        self.batch = batch
+        self.width = caster.screen.width
+        self.height = caster.screen.height
+
+    def tiles(self):
+        return split_tiles(self.width, self.height, self.tile_size)
+
+    def render(self):
+        # render every tile and return the (height, width, 3) frame
+        frame = np.empty((self.height, self.width, 3))
+        for (x0, y0, x1, y1), colors in self.render_tiles(self.tiles()):
+            frame[y0:y1, x0:x1] = colors
+        return frame
+
+    def render_tiles(self, tiles):
+        # yield (tile, colors) as the tiles finish, in any order
+        if self.workers == 1:
+            for tile in tiles:
+                yield tile, trace_tile(self.caster, tile, self.batch)
+            return
+        # pickle the ray caster once here, every worker unpickles its own copy
+        payload = pickle.dumps(self.caster, protocol=pickle.HIGHEST_PROTOCOL)
+        with multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=(payload, self.batch)) as pool:
+            # chunksize 1 so a worker that finishes early picks up the next tile
+            for tile, colors in pool.imap_unordered(_render_worker_tile, tiles, chunksize=1):
+                yield tile, colors
@@ -1,77 +1,270 @@
+import os
 import sys
+import time
+import signal
+import logging
+import argparse
+import numpy as np
 from Models.Vector3D       import Vector3D
 from Models.Screen         import Screen
 from Models.Camera         import Camera
 from Models.Scene          import Scene
-from Models.Objects.Sphere import Sphere
-from Models.Objects.Plane  import Plane
-from Models.Material       import Material
-from Service.Parser        import parse_file
-from Service.RayCaster     import RayCaster
-from Handler.ScreenHandler import ScreenHandler
-def add_lights(scene, data):
-# the add light function can be use to add light sources to the scene
-# or to set ambient light
-# or to set point lights
-# the point light formula is:
-# I = I0 / (1 + a*d + b*d²)
-# and the ambient light formula is:
-# I = I0 * ambient_coef
-    if data['ambient_light']:
-        scene.set_ambient_light(data['ambient_light'])
-    for dl in data['lights']:
-        scene.add_light(dl)
-    for pl in data['point_lights']:
-        scene.add_point_light(pl)
-
-def add_objects(scene, data):
-    # the add objects function can be used to add objects to the scene
-    # it can handle both spheres and planes
-    # so in that case if the radius is negative it will be a plane
-    # after alot of testing it was decided that the radius of the plane
-    # will be the distance from the origin to the plane
-    # and the normal will be the direction of the plane
-    # if the radius is positive it will be a sphere
-    # and the position will be the center of the sphere
-    for i, (x,y,z,radius) in enumerate(data['objects']):
-        # Get color and shininess for this object
-        # If there are not enough colors, use default
-        if i < len(data['colors']):
-            # Unpack color and shininess
-            # assuming colors are in the format (r, g, b, shininess)
-            cr,cg,cb,shin =     data['colors'][i]
-        else:
-            # Default color and shininess
-            # This is a fallback in case there are fewer colors than objects
-            cr,cg,cb,shin =     1.0,1.0,1.0,10.0
-        # Create color and material for the object
-        # Using Vector3D for color and Material for shininess
-        col =   Vector3D(cr,cg,cb)
-        # Create material with color and shininess
-        mat =   Material(col, shininess=shin)
-        # Check if radius is negative or positive
-        # If negative, create a plane; if positive, create a sphere
-        # This is a simple way to differentiate between the two types of objects
-        if radius < 0:
-            # Background plane (negative radius)
-            norm =          Vector3D(x,y,z).normalize()
-            pl   =          Plane(norm, radius, col)
-            pl.material =   mat
-            scene.add_object(pl)
-        else:
-            # Regular sphere (positive radius)
-            sph =           Sphere(Vector3D(x,y,z), radius, col)
-            sph.material =  mat
-            scene.add_object(sph)
+from Service.Parser        import parse_file, SceneError
+from Service.SceneBuilder  import add_lights, add_objects
+from Service.SceneCache    import SceneCache, DEFAULT_CACHE_FOLDER
+from Service.RayCaster     import RayCaster, BATCH_SIZE, MAX_DEPTH
+from Service.TileRenderer  import TileRenderer, DEFAULT_TILE_SIZE, split_tiles
+from Service.Sampler       import Sampler, SAMPLE_PATTERNS, FILTERS, DEFAULT_AA_THRESHOLD
+from Service.ProgressiveRenderer import ProgressiveRenderer, DEFAULT_THRESHOLD, DEFAULT_PREVIEW_INTERVAL
+from Service.Profiler      import Profiler, PhaseTimer
+from Service.GBuffer       import GBuffer, geometry_key
+from Service.Checkpoint    import Checkpoint, checkpoint_key, DEFAULT_CHECKPOINT_INTERVAL
+from Service.AnimationRenderer import AnimationRenderer, parse_keyframes
+from Service.RenderService import RenderService
+from Handler.HttpHandler   import serve
+from Handler.ScreenHandler import ScreenHandler, save_colors, open_float_buffer, FLOAT_FORMATS
+
+DEFAULT_FRAMES = 24
+DEFAULT_HOST = '127.0.0.1'
+
+def parse_args(argv):
+    # the command line is: python main.py [scene.txt] [options]
+    # if no file is provided, default to 'scene1.txt'
+    parser = argparse.ArgumentParser(description="Phong ray tracer")
+    parser.add_argument('scene', nargs='?', default='scene1.txt', help="scene description file")
+    parser.add_argument('--batch', action='store_true',
+                        help="trace all the rays of the frame as numpy arrays instead of one pixel at a time")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of processes that render tiles in parallel (default: 1)")
+    parser.add_argument('--tile-size', type=int, default=DEFAULT_TILE_SIZE,
+                        help=f"tile edge in pixels for the parallel renderer (default: {DEFAULT_TILE_SIZE})")
+    parser.add_argument('--bvh', choices=['sah', 'median', 'off'], default='sah',
+                        help="BVH construction for scenes with many spheres, or off for the linear loop (default: sah)")
+    parser.add_argument('--samples', type=int, default=1,
+                        help="anti-aliasing rays per pixel, traced with the batch path (default: 1, the pixel centre)")
+    parser.add_argument('--sample-pattern', choices=SAMPLE_PATTERNS, default='stratified',
+                        help="where the anti-aliasing rays go inside the pixel (default: stratified)")
+    parser.add_argument('--filter', choices=FILTERS, default='box',
+                        help="how the anti-aliasing samples are weighted (default: box)")
+    parser.add_argument('--aa-threshold', type=float, default=DEFAULT_AA_THRESHOLD,
+                        help="adaptive anti-aliasing: only pixels that differ from a neighbour by this much "
+                             "get all the samples, for example 0.02 (default: 0, every pixel gets --samples rays)")
+    parser.add_argument('--max-depth', type=int, default=MAX_DEPTH,
+                        help=f"bounces of the reflected and refracted rays of m-line materials (default: {MAX_DEPTH})")
+    parser.add_argument('--specular', action='store_true',
+                        help="add Phong specular highlights, the default is the matte look")
+    parser.add_argument('--progressive', action='store_true',
+                        help="preview mode: coarse 1/16 resolution pass first, then refine only where the image changes")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f"color difference that makes the progressive mode refine a block (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument('--preview-interval', type=float, default=DEFAULT_PREVIEW_INTERVAL,
+                        help=f"seconds between intermediate images in progressive mode (default: {DEFAULT_PREVIEW_INTERVAL})")
+    parser.add_argument('--profile', action='store_true',
+                        help="print where the render time goes and save a per-tile cost heatmap (renders tiles on one process)")
+    parser.add_argument('--keyframes',
+                        help="camera path file (k t px py pz vx vy vz [fov] lines), renders an animation instead of one image")
+    parser.add_argument('--frames', type=int, default=DEFAULT_FRAMES,
+                        help=f"number of animation frames, spread evenly over the keyframes (default: {DEFAULT_FRAMES})")
+    parser.add_argument('--frames-dir',
+                        help="folder of the numbered animation frames (default: render_<scene>_frames)")
+    parser.add_argument('--gbuffer', action='store_true',
+                        help="keep the frame's G-buffer in the scene cache folder and re-shade from it when only "
+                             "colors, light intensities, the ambient light or the background changed")
+    parser.add_argument('--float-output',
+                        help="also save the unclamped float framebuffer as a .pfm or .npy file, for compositing")
+    parser.add_argument('--float-in-place', action='store_true',
+                        help="render straight into a memory map of --float-output, so every finished tile is on disk "
+                             "and a crashed render keeps its tiles")
+    parser.add_argument('--checkpoint', action='store_true',
+                        help="keep the finished tiles in a sidecar file in the scene cache folder while rendering")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue a killed --checkpoint render of the same scene and settings, skipping its finished tiles")
+    parser.add_argument('--checkpoint-interval', type=float, default=DEFAULT_CHECKPOINT_INTERVAL,
+                        help=f"seconds between two saves of the finished tiles (default: {DEFAULT_CHECKPOINT_INTERVAL:g})")
+    parser.add_argument('--serve', type=int, metavar='PORT',
+                        help="run as a render server on PORT instead of rendering the scene file: POST /render with "
+                             "a scene text returns the PNG, GET /status reports the queue (--workers warm workers)")
+    parser.add_argument('--host', default=DEFAULT_HOST,
+                        help=f"address the render server listens on (default: {DEFAULT_HOST})")
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='WARNING',
+                        help="parser and cache messages, DEBUG prints the whole parsed scene (default: WARNING)")
+    parser.add_argument('--stream-parse', action='store_true',
+                        help="parse the scene file in chunks straight into numpy arrays, for scenes with millions of objects")
+    parser.add_argument('--scene-cache', default=DEFAULT_CACHE_FOLDER,
+                        help=f"folder of the parsed scene cache (default: {DEFAULT_CACHE_FOLDER})")
+    parser.add_argument('--no-scene-cache', action='store_true',
+                        help="always parse the scene file, do not read or write the scene cache")
+    return parser.parse_args(argv)
+
+def render_pixels(caster, screen, W, H):
+    # so how this for loop works:
+    # it iterates over each pixel in the screen
+    # and generates a ray for each pixel
+    # it then calculates the color for that pixel by calling the shade method
+    # and sets the pixel color in the screen
+    # PUSDOCODE:
+    # for each pixel (i, j) in the screen:
+    #     generate ray for pixel (i, j)
+    #     calculate color for pixel (i, j) using ray
+    #     set pixel color in screen 
+    hits = 0
+    for j in range(H):
+        if j % 100 == 0:
+            print(f"Rendering row {j}/{H}")
+        # every row is a tile for the shadow occluder cache and the screen bins
+        caster.reset_shadow_cache()
+        bins = caster.get_bins()
+        for i in range(W):
+            # Generate ray for this pixel
+            ray = caster.generate_ray(i, j)     
+            # Calculate color for this pixel, testing only the objects of its screen bin
+            col = caster.shade(ray, depth=0, objects=bins.objects(i, j)) 
+            # Set pixel color
+            screen.set_pixel_color(i, j, col)
+            # Count meaningful hits (not just background)
+            if col.magnitude() > 0.1: 
+                hits += 1
+    return hits
+
+def count_hits(colors):
+    # Count meaningful hits (not just background) in an (..., 3) array of colors,
+    # same test as col.magnitude() > 0.1
+    return int(np.count_nonzero(np.sqrt((colors ** 2).sum(axis=-1)) > 0.1))
+
+def render_batch(caster, screen, W, H):
+    # the batch render traces the frame as numpy arrays, a band of rows at a time
+    # so the memory stays bounded for large resolutions, and writes each band
+    # straight into the screen's framebuffer
+    rows = max(1, BATCH_SIZE // W)
+    hits = 0
+    for y0 in range(0, H, rows):
+        y1 = min(y0 + rows, H)
+        colors = caster.render_tile(0, y0, W, y1)
+        screen.set_tile(0, y0, colors)
+        hits += count_hits(colors)
+    return hits
+
+def render_tiles(caster, screen, args):
+    # the tiled render splits the screen into tiles and renders them on args.workers processes
+    # each tile uses the batch path or the per-pixel path, like the serial render
+    renderer = TileRenderer(caster, workers=args.workers, tile_size=args.tile_size, batch=args.batch)
+    tiles = renderer.tiles()
+    print(f"Rendering {len(tiles)} tiles of {args.tile_size}x{args.tile_size} on {args.workers} workers")
+    hits = 0
+    for (x0, y0, x1, y1), colors in renderer.render_tiles(tiles):
+        screen.set_tile(x0, y0, colors)
+        hits += count_hits(colors)
+    return hits
+
+def render_profiled(caster, screen, args, profiler):
+    # the profiled render goes tile by tile on this process, so the time between two
+    # finished tiles is the cost of the tile, the costs become the heatmap
+    renderer = TileRenderer(caster, workers=1, tile_size=args.tile_size, batch=args.batch)
+    hits = 0
+    start = time.perf_counter()
+    for tile, colors in renderer.render_tiles(renderer.tiles()):
+        profiler.add_tile(tile, time.perf_counter() - start)
+        screen.set_tile(tile[0], tile[1], colors)
+        hits += count_hits(colors)
+        start = time.perf_counter()
+    return hits
+
+def stop_render(signum, frame):
+    # SIGTERM (how a preempted machine stops its jobs) ends the render like Ctrl-C,
+    # so the finally of render_checkpointed still saves the finished tiles
+    sys.exit(f"Render stopped by signal {signum}, the finished tiles are kept in the checkpoint")
+
+def render_checkpointed(caster, screen, args, checkpoint):
+    # the checkpointed render goes through the tiles like render_tiles, but only through
+    # the ones the checkpoint does not have yet
+    # the screen renders into the memory mapped sidecar, so a finished tile is already in
+    # the file, and every args.checkpoint_interval seconds the finished tiles are marked done
+    renderer = TileRenderer(caster, workers=args.workers, tile_size=args.tile_size, batch=args.batch)
+    tiles = checkpoint.remaining()
+    print(f"Rendering {len(tiles)} of {len(checkpoint.tiles)} tiles of {args.tile_size}x{args.tile_size} "
+          f"on {args.workers} workers ({checkpoint.finished()} from the checkpoint)")
+    previous = signal.signal(signal.SIGTERM, stop_render)
+    try:
+        for tile, colors in renderer.render_tiles(tiles):
+            screen.set_tile(tile[0], tile[1], colors)
+            checkpoint.finish_tile(tile)
+    finally:
+        checkpoint.save()
+        signal.signal(signal.SIGTERM, previous)
+    return count_hits(screen.buffer)
+
+def render_progressive(caster, screen, handler, args, preview_filename):
+    # the progressive render writes a first image after the coarse pass and then
+    # a better one every args.preview_interval seconds to preview_filename
+    renderer = ProgressiveRenderer(caster, threshold=args.threshold)
+    start = time.perf_counter()
+
+    def preview(frame, step):
+        screen.set_tile(0, 0, frame)
+        handler.save_image(preview_filename)
+        print(f"Preview at {time.perf_counter() - start:.2f}s ({step}x{step} blocks, "
+              f"{renderer.traced} pixels traced): {preview_filename}")
+
+    frame = renderer.render(preview, args.preview_interval)
+    screen.set_tile(0, 0, frame)
+    print(f"Traced {renderer.traced} of {screen.width * screen.height} pixels")
+    return count_hits(frame)
+
+def render_gbuffer(caster, screen, args):
+    # the look-dev render: the G-buffer of the frame is kept in the scene cache folder,
+    # named by the hash of the geometry, so after a change of only the colors, the light
+    # intensities, the ambient light or the background the frame is re-shaded from it
+    # without tracing a single ray
+    key = geometry_key(caster)
+    path = os.path.join(args.scene_cache, f"{key}.gbuffer.npz")
+    start = time.perf_counter()
+    if os.path.exists(path):
+        gbuffer = GBuffer.load(path)
+        print(f"G-buffer loaded from: {path}")
+    else:
+        gbuffer = GBuffer.capture(caster)
+        gbuffer.save(path)
+        print(f"G-buffer traced in {time.perf_counter() - start:.2f}s and saved as: {path}")
+        start = time.perf_counter()
+    frame = gbuffer.shade(caster)
+    print(f"Shaded from the G-buffer in {(time.perf_counter() - start) * 1e3:.1f}ms")
+    screen.set_tile(0, 0, frame)
+    return count_hits(frame)
+
+def render_animation(scene, data, args, W, H, sampler, folder):
+    # the animation renders every frame of the camera path on the same scene,
+    # the frames go to args.workers processes, each frame is rendered whole by one of them
+    keyframes = parse_keyframes(args.keyframes, data['fov'])
+    animation = AnimationRenderer(scene, keyframes, args.frames, W, H, data['aspect'], data['up_vec'],
+                                  batch=args.batch, sampler=sampler, folder=folder, max_depth=args.max_depth,
+                                  specular=args.specular)
+    print(f"Rendering {args.frames} frames of {W}x{H} from {len(keyframes)} keyframes on {args.workers} workers")
+    start = time.perf_counter()
+    for done, (index, filename, seconds) in enumerate(animation.render(args.workers), 1):
+        print(f"Frame {index} saved as: {filename} ({seconds:.2f}s, {done}/{args.frames})")
+    print(f"Animation rendered in {time.perf_counter() - start:.2f}s")
 
 def main():
     # parsing command through command line arguments
-    # if no file is provided, default to 'scene1.txt'
-    fn = sys.argv[1] if len(sys.argv) > 1 else 'scene1.txt'
+    args = parse_args(sys.argv[1:])
+    logging.basicConfig(level=args.log_level, format="%(levelname)s %(name)s: %(message)s")
+    if args.serve is not None:
+        # the server renders the scene texts of its requests, the scene argument is not used
+        serve(RenderService(args.workers), args.host, args.serve)
+        return
+    fn = args.scene
+    profiler = Profiler() if args.profile else None
     print(f"Loading scene file: {fn}")
     # data is parsed from the file
     # and will passed the to the parser function    
-    data = parse_file(fn)
+    # an unchanged scene file comes out of the scene cache with its lights and camera
+    # already resolved, so the parsing and the heuristics run only once per file
+    cache = None if args.no_scene_cache else SceneCache(args.scene_cache)
+    with PhaseTimer(profiler, 'parse'):
+        try:
+            data = parse_file(fn, cache, stream=args.stream_parse)
+        except SceneError as error:
+            sys.exit(f"Bad scene file {error}")
     # Extract camera and screen parameters
     cam_pos = data['camera_pos']
     look = data['view_dir']
@@ -97,44 +290,112 @@ def main():
     # Create and setup scene
     scene = Scene()
     scene.background_color = bg
-    add_lights(scene, data)
-    add_objects(scene, data)
+    try:
+        add_lights(scene, data)
+        add_objects(scene, data)
+    except SceneError as error:
+        sys.exit(f"Bad scene file {fn}: {error}")
+    # build the BVH and the packed arrays once before rendering,
+    # the tile workers get them with the scene
+    scene.bvh_method = None if args.bvh == 'off' else args.bvh
+    with PhaseTimer(profiler, 'setup'):
+        if args.gbuffer:
+            # a re-shade from the G-buffer only needs the material tables,
+            # the BVH is built on the first ray if the frame has to be traced
+            scene.get_packed()
+        else:
+            scene.prepare()
+    bvh = scene.bvh
+    if bvh is not None:
+        stats = bvh.stats()
+        print(f"BVH ({stats['method']}): {stats['primitives']} objects, {stats['nodes']} nodes, "
+              f"depth {stats['depth']}, built in {stats['build_time']:.3f}s")
     # Create ray caster
     caster = RayCaster(camera, screen, scene)
+    if args.float_in_place and not args.float_output:
+        sys.exit("--float-in-place needs --float-output")
+    if args.float_output and os.path.splitext(args.float_output)[1].lower() not in FLOAT_FORMATS:
+        sys.exit(f"--float-output must end in one of {', '.join(FLOAT_FORMATS)}")
+    if (args.checkpoint or args.resume) and (args.progressive or args.gbuffer or args.profile or args.keyframes
+                                             or args.float_in_place):
+        sys.exit("--checkpoint and --resume work with the tiled render, not with --progressive, --gbuffer, "
+                 "--profile, --keyframes or --float-in-place")
+    if args.gbuffer and args.samples > 1:
+        sys.exit("--gbuffer traces one ray per pixel, it cannot be combined with --samples")
+    if args.gbuffer and scene.get_packed().secondary:
+        sys.exit("--gbuffer keeps the primary hits only, it cannot re-shade reflective or transparent materials")
+    caster.max_depth = args.max_depth
+    caster.specular = args.specular
+    if scene.get_packed().secondary and not args.batch:
+        # the reflected and refracted rays are traced as wavefronts of the batch path
+        args.batch = True
+        print(f"Reflective or transparent materials: batch path with up to {args.max_depth} bounces")
+    if args.samples > 1:
+        # the samples of a pixel are traced as one batch, so anti-aliasing always uses the batch path
+        caster.sampler = Sampler(args.samples, args.sample_pattern, args.filter, threshold=args.aa_threshold)
+        args.batch = True
+        print(f"Anti-aliasing: {args.samples} {args.sample_pattern} samples per pixel, {args.filter} filter")
+    if args.keyframes:
+        render_animation(scene, data, args, W, H, caster.sampler,
+                         args.frames_dir or f"render_{fn.replace('.txt', '')}_frames")
+        return
     # ENHANCED RENDERING with progress tracking
-    hits = 0
     total_pixels = W * H
     print(f"Starting render of {total_pixels} pixels...")
-    # so how this for loop works:
-    # it iterates over each pixel in the screen
-    # and generates a ray for each pixel
-    # it then calculates the color for that pixel by calling the shade method
-    # and sets the pixel color in the screen
-    # PUSDOCODE:
-    # for each pixel (i, j) in the screen:
-    #     generate ray for pixel (i, j)
-    #     calculate color for pixel (i, j) using ray
-    #     set pixel color in screen 
-    for j in range(H):
-        if j % 100 == 0:
-            print(f"Rendering row {j}/{H}")
-        for i in range(W):
-            # Generate ray for this pixel
-            ray = caster.generate_ray(i, j)     
-            # Calculate color for this pixel
-            col = caster.shade(ray, depth=0) 
-            # Set pixel color
-            screen.set_pixel_color(i, j, col)
-            # Count meaningful hits (not just background)
-            if col.magnitude() > 0.1: 
-                hits += 1
+    output_filename = f"render_{fn.replace('.txt', '')}.png"
+    if args.float_in_place:
+        # the framebuffer becomes the memory map of the float file, set_tile writes to the file
+        screen.use_buffer(open_float_buffer(args.float_output, W, H))
+        print(f"Rendering in place into: {args.float_output}")
+    checkpoint = None
+    if args.checkpoint or args.resume:
+        # the sidecar is named by the scene file and every setting that changes a pixel or the tiles
+        settings = {'width': W, 'height': H, 'batch': args.batch, 'tile_size': args.tile_size,
+                    'samples': args.samples, 'sample_pattern': args.sample_pattern, 'filter': args.filter,
+                    'aa_threshold': args.aa_threshold, 'max_depth': args.max_depth,
+                    'specular': args.specular}
+        key = checkpoint_key(SceneCache(args.scene_cache).file_key(fn), settings)
+        checkpoint = Checkpoint(args.scene_cache, key, W, H, split_tiles(W, H, args.tile_size),
+                                args.checkpoint_interval)
+        screen.use_buffer(checkpoint.open(resume=args.resume))
+        print(f"Checkpoint: {checkpoint.pixels_path}")
+    if args.gbuffer:
+        hits = render_gbuffer(caster, screen, args)
+    elif profiler is not None:
+        profiler.attach(caster, handler)
+        with PhaseTimer(profiler, 'render'):
+            hits = render_profiled(caster, screen, args, profiler)
+    elif args.progressive:
+        hits = render_progressive(caster, screen, handler, args, output_filename.replace('.png', '_preview.png'))
+    elif checkpoint is not None:
+        hits = render_checkpointed(caster, screen, args, checkpoint)
+    elif args.workers > 1:
+        hits = render_tiles(caster, screen, args)
+    elif args.batch:
+        hits = render_batch(caster, screen, W, H)
+    else:
+        hits = render_pixels(caster, screen, W, H)
     # Print rendering statistics
     hit_percentage = (hits / total_pixels) * 100
     print(f"[Unified] {hits}/{total_pixels} meaningful pixels ({hit_percentage:.2f}%)")
+    if bvh is not None and args.workers == 1:
+        stats = bvh.stats()
+        print(f"BVH traversal: {stats['rays']} rays, {stats['nodes_per_ray']:.2f} nodes/ray, "
+              f"{stats['tests_per_ray']:.2f} intersection tests/ray")
     # Save the rendered image
-    output_filename = f"render_{fn.replace('.txt', '')}.png"
     handler.save_image(output_filename)
     print(f"Image saved as: {output_filename}")
+    if args.float_output:
+        handler.save_float(args.float_output)
+        print(f"Float image saved as: {args.float_output}")
+    if checkpoint is not None:
+        # the image is saved, the render does not need its checkpoint any more
+        checkpoint.remove()
+    if profiler is not None:
+        print(profiler.summary(caster))
+        heatmap_filename = output_filename.replace('.png', '_profile.png')
+        save_colors(profiler.heatmap_colors(W, H), heatmap_filename)
+        print(f"Cost heatmap saved as: {heatmap_filename}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
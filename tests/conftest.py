@@ -0,0 +1,39 @@
+import os
+import pytest
+from Models.Vector3D import Vector3D
+from Models.Camera import Camera
+from Models.Screen import Screen
+from Models.Scene import Scene
+from Service.Parser import parse_file
+from Service.SceneBuilder import add_lights, add_objects
+from Service.RayCaster import RayCaster
+
+# the bundled scene files and a ray caster for them, set up the same way as main.py,
+# at a small resolution so a test can render them with both paths
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+SCENES = [f"scene{k}.txt" for k in range(1, 9)]
+
+def scene_path(name):
+    return os.path.join(ROOT, name)
+
+def build_caster(name, width, height=None):
+    return caster_for(parse_file(scene_path(name)), width, height)
+
+def caster_for(data, width, height=None):
+    # the RayCaster of parsed scene data,
+    # height defaults to the proportions of the scene's own resolution
+    if height is None:
+        scene_width, scene_height = data['resolution']
+        height = max(1, round(width * scene_height / scene_width))
+    screen = Screen(data['camera_pos'], data['view_dir'], data['up_vec'], data['fov'], data['aspect'], width, height)
+    camera = Camera(data['camera_pos'], data['view_dir'], data['up_vec'], data['fov'], data['aspect'])
+    scene = Scene()
+    scene.background_color = data.get('background') or Vector3D(0.1, 0.1, 0.2)
+    add_lights(scene, data)
+    add_objects(scene, data)
+    return RayCaster(camera, screen, scene)
+
+@pytest.fixture
+def make_caster():
+    return build_caster
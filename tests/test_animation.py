@@ -0,0 +1,61 @@
+import math
+import pytest
+from Models.Vector3D import Vector3D
+from Service.AnimationRenderer import parse_keyframes, interpolate, frame_times
+
+# the camera path goes through every keyframe: the first and the last frame are the
+# first and the last keyframe, and a frame at a keyframe's time is that keyframe
+
+KEYFRAMES = """# t  position        view direction  fov
+k 2.0  4.0 1.0 -2.0   0.0 0.0 -1.0    40
+k 0.0  0.0 0.0 0.0    0.0 0.0 -1.0    # the default fov
+k 1.0  1.0 0.5 -1.0   1.0 0.0 -1.0    50
+
+"""
+
+def point(v):
+    return (v.x, v.y, v.z)
+
+@pytest.fixture
+def keyframes(tmp_path):
+    path = tmp_path / 'path.txt'
+    path.write_text(KEYFRAMES)
+    return parse_keyframes(str(path), 60.0)
+
+def test_keyframes_are_sorted_with_the_default_fov(keyframes):
+    assert [key.t for key in keyframes] == [0.0, 1.0, 2.0]
+    assert [key.fov for key in keyframes] == [60.0, 50.0, 40.0]
+    assert math.isclose(keyframes[1].direction.magnitude(), 1.0)
+
+def test_interpolation_hits_every_keyframe(keyframes):
+    times = frame_times(keyframes, 5)
+    assert times[0] == 0.0 and times[-1] == 2.0
+    for key in keyframes:
+        position, direction, fov = interpolate(keyframes, key.t)
+        assert point(position) == point(key.position)
+        assert point(direction) == point(key.direction)
+        assert fov == key.fov
+    # and stays on the first and the last keyframe outside the path
+    assert point(interpolate(keyframes, -1.0)[0]) == point(keyframes[0].position)
+    assert point(interpolate(keyframes, 3.0)[0]) == point(keyframes[-1].position)
+
+def test_interpolation_between_keyframes(keyframes):
+    position, direction, fov = interpolate(keyframes, 0.5)
+    assert point(position) == pytest.approx((0.5, 0.25, -0.5))
+    assert fov == pytest.approx(55.0)
+    # the direction turns at a constant rate, halfway it is halfway between both directions
+    assert direction.magnitude() == pytest.approx(1.0)
+    first, second = keyframes[0].direction, keyframes[1].direction
+    assert direction.dot_product(first) == pytest.approx(direction.dot_product(second))
+
+def test_one_frame_is_the_first_keyframe(keyframes):
+    assert frame_times(keyframes, 1) == [0.0]
+
+def test_bad_keyframe_files(tmp_path):
+    path = tmp_path / 'bad.txt'
+    path.write_text("k 0 1 2 3\n")
+    with pytest.raises(ValueError, match=':1:'):
+        parse_keyframes(str(path), 60.0)
+    path.write_text("# nothing\n")
+    with pytest.raises(ValueError, match='no keyframes'):
+        parse_keyframes(str(path), 60.0)
@@ -0,0 +1,109 @@
+import numpy as np
+from Models.Vector3D import Vector3D
+from Models.Camera import Camera
+from Models.Screen import Screen
+from Models.Scene import Scene
+from Models.Objects.Sphere import Sphere
+from Models.Objects.Plane import Plane
+from Models.Material import Material
+from Models.Lights.AmbientLight import AmbientLight
+from Models.Lights.AreaLight import AreaLight
+from Service.RayCaster import RayCaster, BIAS
+
+# an AreaLight aims the shadow rays of a point at one jittered position in every cell of its
+# grid, the jitter is seeded and comes from the point, so every render gets the same samples
+# the probe rays (the corner cells) decide whether a point needs the rest of the samples,
+# for a blocker bigger than the light that gives the same fraction as all the samples
+# for nearly every point
+
+WHITE = Vector3D(1.0, 1.0, 1.0)
+EDGES = (Vector3D(0.8, 0.0, 0.0), Vector3D(0.0, 0.0, 0.5))
+
+def quad_light(samples=16):
+    return AreaLight(Vector3D(0.0, 4.0, -3.0), WHITE, edges=EDGES, samples=samples)
+
+def sphere_light(samples=16):
+    return AreaLight(Vector3D(0.0, 4.0, -3.0), WHITE, radius=0.6, samples=samples)
+
+def floor_points(count, seed):
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(-3.0, 3.0, (count, 3))
+    points[:, 1] = -1.0
+    points[:, 2] -= 3.0
+    return points
+
+def test_sample_points_are_seeded_and_inside_their_cells():
+    light = quad_light()
+    points = floor_points(300, seed=3)
+    cells = np.arange(light.samples)
+    samples = light.sample_points(points, cells)
+    np.testing.assert_array_equal(samples, quad_light().sample_points(points, cells))
+    # the (u, v) position of every sample on the quad, the edges are at right angles
+    offset = samples - light.position.point()
+    u = offset @ EDGES[0].point() / EDGES[0].dot_product(EDGES[0]) + 0.5
+    v = offset @ EDGES[1].point() / EDGES[1].dot_product(EDGES[1]) + 0.5
+    grid = light.grid
+    column, row = light.cells[:, 0], light.cells[:, 1]
+    slack = 1e-12
+    assert ((u >= column / grid - slack) & (u <= (column + 1) / grid + slack)).all()
+    assert ((v >= row / grid - slack) & (v <= (row + 1) / grid + slack)).all()
+    # every point of a cell of JITTER_CELL gets the same offset, different points mostly not
+    jitter = light.jitter(points)
+    assert ((jitter >= 0.0) & (jitter < 1.0)).all()
+    assert len(np.unique(jitter, axis=0)) > len(points) // 2
+
+def test_sphere_samples_lie_on_the_disk_facing_the_point():
+    light = sphere_light()
+    points = floor_points(300, seed=5)
+    samples = light.sample_points(points, np.arange(light.samples))
+    centre = np.array(light.position.point())
+    offset = samples - centre
+    assert (np.linalg.norm(offset, axis=2) <= light.radius * (1 + 1e-12)).all()
+    facing = (points - centre) / np.linalg.norm(points - centre, axis=1)[:, None]
+    np.testing.assert_allclose(np.einsum('kcj,kj->kc', offset, facing), 0.0, atol=1e-12)
+
+def test_scalar_samples_match_the_batch_samples():
+    points = floor_points(200, seed=7)
+    for light in (quad_light(), sphere_light(9)):
+        expected = light.sample_points(points, np.arange(light.samples))
+        for k, (x, y, z) in enumerate(points.tolist()):
+            np.testing.assert_array_equal(light.sample_points_scalar(x, y, z, range(light.samples)), expected[k])
+
+def make_caster(light):
+    scene = Scene()
+    blocker = Sphere(Vector3D(0.3, 1.0, -3.2), 1.0, WHITE)
+    blocker.material = Material(WHITE)
+    scene.add_object(blocker)
+    floor = Plane(Vector3D(0.0, 1.0, 0.0), 1.0, WHITE)
+    floor.material = Material(WHITE)
+    scene.add_object(floor)
+    scene.set_ambient_light(AmbientLight(Vector3D(0.1, 0.1, 0.1)))
+    scene.add_point_light(light)
+    position, look_at, up = Vector3D(0.0, 0.0, 0.0), Vector3D(0.0, 0.0, -1.0), Vector3D(0.0, 1.0, 0.0)
+    camera = Camera(position, look_at, up, 60.0, 1.0)
+    screen = Screen(position, look_at, up, 60.0, 1.0, 8, 8)
+    return RayCaster(camera, screen, scene)
+
+def test_adaptive_probing_matches_the_full_sample_fraction():
+    # (light, share of the points the probes may misjudge), the corner cells of a disk
+    # are further from its rim than the corners of a quad, so they miss a bit more
+    for light, misjudged in ((quad_light(), 0.002), (sphere_light(), 0.05)):
+        caster = make_caster(light)
+        points = floor_points(3000, seed=11)
+        origins = points + (0.0, BIAS, 0.0)
+        adaptive = caster.area_shadow_batch(light, points, origins)
+        blocked = caster.area_rays_blocked(light, points, origins, np.arange(light.samples), None)
+        full = blocked.sum(axis=1) / light.samples
+        # a point in the penumbra gets all the samples, so the same fraction
+        penumbra = (adaptive > 0) & (adaptive < 1)
+        np.testing.assert_array_equal(adaptive[penumbra], full[penumbra])
+        # the probes decide the rest, they only miss the edge of the blocker slipping
+        # between two corners without covering either, that is rare and only a sample or two
+        assert np.mean(adaptive != full) < misjudged
+        assert np.abs(adaptive - full).max() <= 2 / light.samples
+        # the points are lit, shadowed and in the penumbra
+        assert (full == 0).any() and (full == 1).any() and ((full > 0) & (full < 1)).any()
+        # and the scalar path gives the same fractions
+        for k in range(0, len(points), 50):
+            P, origin = Vector3D(*points[k]), Vector3D(*origins[k])
+            assert caster.area_shadow(light, P, origin) == adaptive[k]
@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+from conftest import SCENES, build_caster
+from Service.TileRenderer import trace_tile_pixels
+
+# the batch path computes the formula of shade with arrays, in the same order of operations
+# where it can, so its frame is the per-pixel frame up to the rounding of a few operations
+
+TOLERANCE = 3e-13
+
+@pytest.mark.parametrize('specular', [False, True])
+@pytest.mark.parametrize('name', SCENES)
+def test_batch_matches_shade(name, specular):
+    caster = build_caster(name, 41, 31)
+    caster.specular = specular
+    batch = caster.render_batch()
+    pixels = trace_tile_pixels(caster, 0, 0, 41, 31)
+    assert batch.shape == pixels.shape == (31, 41, 3)
+    assert np.abs(batch - pixels).max() <= TOLERANCE
+    # the frame is not just the background
+    assert np.ptp(batch) > 0.1
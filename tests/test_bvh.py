@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+from Models.Vector3D import Vector3D
+from Models.Objects.Ray import Ray
+from Models.Objects.Sphere import Sphere
+from Models.PackedScene import PackedScene
+from Models.BVH import BVH
+
+# the BVH only skips spheres a ray can not hit, so its answers must be the ones of the
+# linear loop over every object: the same nearest sphere and t (the lower index on a tie),
+# and a blocker exactly when some sphere blocks the shadow ray
+
+WHITE = Vector3D(1.0, 1.0, 1.0)
+
+def sphere_field(count, seed):
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(-6.0, 6.0, (count, 3))
+    radii = rng.uniform(0.1, 0.8, count)
+    spheres = [Sphere(Vector3D(*c), float(r), WHITE) for c, r in zip(centers, radii)]
+    # exact copies of some spheres, their hits tie and the lower index must win
+    for k in range(0, count, 10):
+        spheres.append(Sphere(Vector3D(*centers[k]), float(radii[k]), WHITE))
+    return spheres
+
+def random_rays(count, seed):
+    rng = np.random.default_rng(seed)
+    origins = rng.uniform(-8.0, 8.0, (count, 3))
+    directions = rng.normal(size=(count, 3))
+    # Vector3D.normalize like a Ray, so the scalar and the batch rays are the same numbers
+    units = [Vector3D(*d).normalize() for d in directions]
+    return origins, np.array([(u.x, u.y, u.z) for u in units])
+
+def rays_of(origins, directions):
+    return [Ray(Vector3D(*o), Vector3D(*d)) for o, d in zip(origins, directions)]
+
+def linear_nearest(objects, ray):
+    best_index, best_t = -1, float('inf')
+    for index, obj in enumerate(objects):
+        hit, t, _, _ = obj.intersect(ray)
+        if hit and t < best_t:
+            best_index, best_t = index, t
+    return best_index, best_t
+
+@pytest.mark.parametrize('method', ['sah', 'median'])
+def test_nearest_hit_matches_the_linear_loop(method):
+    objects = sphere_field(150, seed=1)
+    bvh = BVH(objects, range(len(objects)), method)
+    origins, directions = random_rays(600, seed=2)
+    ties = 0
+    for ray in rays_of(origins, directions):
+        index, t, _, _ = bvh.intersect(ray)
+        expected_index, expected_t = linear_nearest(objects, ray)
+        assert (index, t) == (expected_index, expected_t)
+        # a hit on a sphere that has a copy further down the list
+        ties += index >= 0 and index % 10 == 0 and index < 150
+    assert ties
+    # the batch traversal with the packed intersect against the packed linear minimum
+    packed = PackedScene(objects)
+    best_id = np.full(len(directions), -1, dtype=np.int64)
+    best_t = np.full(len(directions), np.inf)
+    bvh.intersect_batch(origins, directions, best_id, best_t, packed.intersect_index_batch)
+    t = packed.intersect_ids(np.arange(len(objects)), origins, directions)
+    expected_id = np.where(np.isfinite(t.min(axis=0)), t.argmin(axis=0), -1)
+    np.testing.assert_array_equal(best_id, expected_id)
+    np.testing.assert_array_equal(best_t, t.min(axis=0))
+
+@pytest.mark.parametrize('method', ['sah', 'median'])
+def test_find_occluder_matches_brute_force(method):
+    objects = sphere_field(150, seed=3)
+    bvh = BVH(objects, range(len(objects)), method)
+    origins, directions = random_rays(600, seed=4)
+    t_max = np.random.default_rng(5).uniform(0.5, 12.0, len(directions))
+    t_min = np.full(len(directions), 1e-4)
+    blocked = []
+    for ray, far in zip(rays_of(origins, directions), t_max):
+        blocker = bvh.find_occluder(ray, 1e-4, far)
+        expected = any(obj.occludes(ray, 1e-4, far) for obj in objects)
+        assert (blocker >= 0) == expected
+        if blocker >= 0:
+            assert objects[blocker].occludes(ray, 1e-4, far)
+        blocked.append(expected)
+    assert any(blocked) and not all(blocked)
+    packed = PackedScene(objects)
+    blocker = bvh.find_occluders_batch(origins, directions, t_min, t_max, packed.intersect_index_batch)
+    t = packed.intersect_ids(np.arange(len(objects)), origins, directions)
+    inside = (t > t_min) & (t < t_max)
+    np.testing.assert_array_equal(blocker >= 0, inside.any(axis=0))
+    rows = np.flatnonzero(blocker >= 0)
+    assert inside[blocker[rows], rows].all()
+
+def test_stats_are_consistent():
+    objects = sphere_field(200, seed=6)
+    bvh = BVH(objects, range(len(objects)), 'sah')
+    stats = bvh.stats()
+    leaves = bvh.left < 0
+    # a binary tree, every object in exactly one leaf
+    assert stats['nodes'] == 2 * stats['leaves'] - 1
+    assert stats['primitives'] == len(objects) == bvh.count[leaves].sum()
+    assert sorted(bvh.prims.tolist()) == list(range(len(objects)))
+    assert 1 <= stats['max_leaf_size'] <= bvh.leaf_size
+    assert 1 <= stats['depth'] <= stats['nodes']
+    assert stats['rays'] == stats['nodes_visited'] == stats['primitive_tests'] == 0
+    origins, directions = random_rays(300, seed=7)
+    packed = PackedScene(objects)
+    tested = []
+    def intersect(index, ray_origins, ray_directions):
+        tested.append(len(ray_origins))
+        return packed.intersect_index_batch(index, ray_origins, ray_directions)
+    bvh.intersect_batch(origins, directions, np.full(300, -1), np.full(300, np.inf), intersect)
+    stats = bvh.stats()
+    # every ray given to a sphere's intersect is one primitive test
+    assert stats['rays'] == 300 and stats['primitive_tests'] == sum(tested)
+    assert 0 < stats['primitive_tests'] < 300 * len(objects)
+    batch_tests = stats['primitive_tests']
+    for ray in rays_of(origins, directions):
+        bvh.intersect(ray)
+    stats = bvh.stats()
+    assert stats['rays'] == 600
+    assert batch_tests < stats['primitive_tests'] < batch_tests + 300 * len(objects)
+    assert stats['nodes_per_ray'] == stats['nodes_visited'] / 600
+    assert stats['tests_per_ray'] == stats['primitive_tests'] / 600
+    bvh.reset_stats()
+    assert bvh.stats()['rays'] == 0
@@ -0,0 +1,72 @@
+import os
+import signal
+import argparse
+import numpy as np
+import pytest
+import main
+from Service.Checkpoint import Checkpoint, checkpoint_key
+from Service.TileRenderer import TileRenderer, split_tiles
+
+# a render stopped half way keeps its finished tiles in the checkpoint, the resumed render
+# traces only the other tiles and the frame is the one of a render that never stopped
+
+WIDTH, HEIGHT, TILE_SIZE = 29, 21, 8
+
+class StoppingRenderer(TileRenderer):
+    # renders stop tiles and then gets SIGTERM, every tile it renders is recorded in traced
+    stop = None
+    traced = []
+
+    def render_tiles(self, tiles):
+        for count, (tile, colors) in enumerate(super().render_tiles(tiles)):
+            if count == StoppingRenderer.stop:
+                os.kill(os.getpid(), signal.SIGTERM)
+            StoppingRenderer.traced.append(tile)
+            yield tile, colors
+
+def checkpointed(caster, folder, resume, stop):
+    # main.render_checkpointed into the sidecar of the scene, the screen of the caster
+    # gets the memory mapped framebuffer
+    args = argparse.Namespace(workers=1, tile_size=TILE_SIZE, batch=True)
+    key = checkpoint_key('scene3', {'width': WIDTH, 'height': HEIGHT, 'tile_size': TILE_SIZE})
+    checkpoint = Checkpoint(folder, key, WIDTH, HEIGHT, split_tiles(WIDTH, HEIGHT, TILE_SIZE), interval=0.0)
+    caster.screen.use_buffer(checkpoint.open(resume=resume))
+    StoppingRenderer.stop, StoppingRenderer.traced = stop, []
+    main.render_checkpointed(caster, caster.screen, args, checkpoint)
+    return checkpoint
+
+def test_resume_renders_only_the_missing_tiles(make_caster, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'TileRenderer', StoppingRenderer)
+    tiles = split_tiles(WIDTH, HEIGHT, TILE_SIZE)
+    expected = TileRenderer(make_caster('scene3.txt', WIDTH, HEIGHT), tile_size=TILE_SIZE).render()
+    with pytest.raises(SystemExit):
+        checkpointed(make_caster('scene3.txt', WIDTH, HEIGHT), str(tmp_path), resume=False, stop=5)
+    first = StoppingRenderer.traced
+    assert len(first) == 5
+    # a new process: a new caster and screen, only the sidecar is left
+    caster = make_caster('scene3.txt', WIDTH, HEIGHT)
+    checkpoint = checkpointed(caster, str(tmp_path), resume=True, stop=None)
+    assert sorted(StoppingRenderer.traced) == sorted(tile for tile in tiles if tile not in first)
+    assert checkpoint.finished() == len(tiles) and checkpoint.remaining() == []
+    np.testing.assert_array_equal(caster.screen.buffer, expected.astype(np.float32))
+    # without resume the sidecar starts over
+    checkpoint = checkpointed(make_caster('scene3.txt', WIDTH, HEIGHT), str(tmp_path), resume=False, stop=None)
+    assert len(StoppingRenderer.traced) == len(tiles)
+    checkpoint.remove()
+    assert not os.path.exists(checkpoint.pixels_path) and not os.path.exists(checkpoint.done_path)
+
+def test_unsaved_tiles_are_rendered_again(make_caster, tmp_path):
+    # a tile finished after the last save has no flag on disk, the resume renders it again
+    tiles = split_tiles(WIDTH, HEIGHT, TILE_SIZE)
+    checkpoint = Checkpoint(str(tmp_path), 'key', WIDTH, HEIGHT, tiles, interval=3600.0)
+    checkpoint.open()
+    checkpoint.finish_tile(tiles[0])
+    checkpoint.save()
+    checkpoint.finish_tile(tiles[1])
+    resumed = Checkpoint(str(tmp_path), 'key', WIDTH, HEIGHT, tiles)
+    resumed.open(resume=True)
+    assert resumed.remaining() == tiles[1:]
+    # a sidecar of another size is not used
+    other = Checkpoint(str(tmp_path), 'key', WIDTH + 1, HEIGHT, split_tiles(WIDTH + 1, HEIGHT, TILE_SIZE))
+    other.open(resume=True)
+    assert other.finished() == 0
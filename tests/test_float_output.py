@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from conftest import build_caster
+from Models.Screen import Screen
+from Models.Vector3D import Vector3D
+from Handler.ScreenHandler import ScreenHandler, open_float_buffer, save_float_colors
+
+# a float image keeps the framebuffer as it is: every float32 value, nothing clamped to
+# [0, 1], in image order, whether it is written at the end or the screen renders into it
+
+def read_float(path):
+    # an independent reader of both formats, not the memory maps of ScreenHandler
+    if path.endswith('.npy'):
+        return np.load(path)
+    with open(path, 'rb') as f:
+        assert f.readline() == b'PF\n'
+        width, height = (int(v) for v in f.readline().split())
+        scale = float(f.readline())
+        data = np.fromfile(f, dtype='<f4' if scale < 0 else '>f4')
+    # PFM rows go from the bottom up
+    return data.reshape(height, width, 3)[::-1]
+
+def hdr_frame():
+    # a rendered frame spread past [0, 1] on both sides
+    frame = build_caster('scene3.txt', 29, 17).render_batch()
+    return (frame * 4.0 - 0.5).astype(np.float32)
+
+def new_screen(width, height):
+    origin = Vector3D(0.0, 0.0, 0.0)
+    return Screen(origin, Vector3D(0.0, 0.0, -1.0), Vector3D(0.0, 1.0, 0.0), 60.0, width / height, width, height)
+
+@pytest.mark.parametrize('ext', ['.pfm', '.npy'])
+def test_saved_float_image_is_the_framebuffer(tmp_path, ext):
+    frame = hdr_frame()
+    assert frame.max() > 1.0 and frame.min() < 0.0
+    height, width = frame.shape[:2]
+    screen = new_screen(width, height)
+    screen.set_tile(0, 0, frame)
+    path = str(tmp_path / f"frame{ext}")
+    ScreenHandler(screen, width, height).save_float(path)
+    saved = read_float(path)
+    assert saved.shape == (height, width, 3)
+    np.testing.assert_array_equal(saved, screen.buffer)
+    np.testing.assert_array_equal(saved, frame)
+
+@pytest.mark.parametrize('ext', ['.pfm', '.npy'])
+def test_rendering_in_place_writes_the_file(tmp_path, ext):
+    frame = hdr_frame()
+    height, width = frame.shape[:2]
+    screen = new_screen(width, height)
+    path = str(tmp_path / f"frame{ext}")
+    screen.use_buffer(open_float_buffer(path, width, height))
+    # tile by tile, the way the tiled render fills the screen
+    for y0 in range(0, height, 8):
+        screen.set_tile(0, y0, frame[y0:y0 + 8])
+    ScreenHandler(screen, width, height).save_float(path)
+    np.testing.assert_array_equal(read_float(path), frame)
+    # and the file of save_float_colors is the same
+    other = str(tmp_path / f"other{ext}")
+    save_float_colors(frame, other)
+    with open(path, 'rb') as a, open(other, 'rb') as b:
+        assert a.read() == b.read()
+
+def test_float_output_needs_a_float_format(tmp_path):
+    with pytest.raises(ValueError):
+        open_float_buffer(str(tmp_path / 'frame.png'), 4, 3)
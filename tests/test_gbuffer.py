@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from conftest import SCENES, scene_path, caster_for
+from Service.Parser import parse_text
+from Service.GBuffer import GBuffer, geometry_key
+
+# a G-buffer keeps where the rays of a frame went, so after a change of only the colors,
+# the light intensities, the ambient light or the background, shading it again must give
+# the frame a fresh render of the changed scene gives
+
+def look_dev(text):
+    # the same scene with other colors and coefficients, other light intensities,
+    # another ambient light and a background
+    lines = []
+    for number, line in enumerate(text.splitlines()):
+        values = line.split()
+        if values and values[0] in ('c', 'i', 'a'):
+            # shift the rgb values around, the other values stay
+            rgb = [float(v) for v in values[1:4]]
+            values[1:4] = [f"{(v * 0.7 + 0.13 * (number % 3 + 1)) % 1.0:.3f}" for v in rgb[1:] + rgb[:1]]
+        lines.append(' '.join(values))
+    lines.append('b 0.3 0.2 0.1')
+    return '\n'.join(lines) + '\n'
+
+def caster_of(text, specular):
+    caster = caster_for(parse_text(text), 31, 23)
+    caster.specular = specular
+    return caster
+
+@pytest.mark.parametrize('specular', [False, True])
+@pytest.mark.parametrize('name', SCENES)
+def test_reshade_matches_a_fresh_render(tmp_path, name, specular):
+    with open(scene_path(name)) as f:
+        text = f.read()
+    caster = caster_of(text, specular)
+    changed = caster_of(look_dev(text), specular)
+    assert geometry_key(changed) == geometry_key(caster)
+    path = str(tmp_path / 'frame.gbuffer.npz')
+    GBuffer.capture(caster).save(path)
+    gbuffer = GBuffer.load(path)
+    np.testing.assert_array_equal(gbuffer.shade(caster), caster.render_batch())
+    expected = changed.render_batch()
+    assert not np.array_equal(expected, caster.render_batch())
+    np.testing.assert_array_equal(gbuffer.shade(changed), expected)
+
+def test_a_geometry_change_changes_the_key():
+    with open(scene_path('scene3.txt')) as f:
+        text = f.read()
+    caster = caster_of(text, False)
+    first_object = text.index('\no ') + 1
+    moved = text[:first_object] + 'o 0.5 0.0 -0.1 -3.0\n' + text[first_object:].split('\n', 1)[1]
+    assert geometry_key(caster_of(moved, False)) != geometry_key(caster)
+    assert geometry_key(caster_of(text, True)) != geometry_key(caster)
@@ -0,0 +1,126 @@
+import numpy as np
+from Models.Vector3D import Vector3D
+from Models.Objects.Ray import Ray
+from Models.Objects.Object import Object
+from Models.Objects.Sphere import Sphere
+from Models.Objects.Plane import Plane
+from Models.PackedScene import PackedScene
+
+# the batch path tests rays against the packed arrays of PackedScene (with the same kernels
+# as Sphere.intersect_batch and Plane.intersect_batch) and the pixel path calls intersect
+# on every object, so both must give the same hits, distances and normals
+# the rays are seeded random ones: from outside, from inside a sphere, missing everything,
+# and parallel to a plane
+
+WHITE = Vector3D(1.0, 1.0, 1.0)
+
+def scene_objects():
+    return [
+        Sphere(Vector3D(0.0, 0.0, -3.0), 1.0, WHITE),
+        Sphere(Vector3D(1.5, 0.5, -4.0), 0.5, WHITE),
+        Sphere(Vector3D(0.2, -0.1, 0.1), 0.8, WHITE),     # holds the origin of some rays
+        Sphere(Vector3D(0.0, 0.0, 0.0), -50.0, WHITE),    # inverted, a background sphere
+        Plane(Vector3D(0.0, 1.0, 0.0), 1.0, WHITE),
+        Plane(Vector3D(1.0, 0.0, 1.0), -8.0, WHITE),
+    ]
+
+def random_rays(count, seed):
+    # unit directions made by Vector3D.normalize, so the Ray of the pixel path has the same numbers
+    rng = np.random.default_rng(seed)
+    origins = rng.uniform(-1.0, 1.0, (count, 3))
+    origins[: count // 4] = rng.uniform(-0.2, 0.2, (count // 4, 3))
+    directions = rng.normal(size=(count, 3))
+    # a quarter of the rays lie in the planes y = const, parallel to the first plane
+    directions[count // 4: count // 2, 1] = 0.0
+    # and some point away from everything in front
+    directions[count // 2: count // 2 + count // 8, 2] = np.abs(directions[count // 2: count // 2 + count // 8, 2])
+    units = [Vector3D(*d).normalize() for d in directions]
+    directions = np.array([(u.x, u.y, u.z) for u in units])
+    return origins, directions
+
+def scalar_hits(obj, origins, directions):
+    t = np.full(len(origins), np.inf)
+    normals = np.zeros((len(origins), 3))
+    for k, (origin, direction) in enumerate(zip(origins, directions)):
+        hit, tk, _, normal = obj.intersect(Ray(Vector3D(*origin), Vector3D(*direction)))
+        if hit:
+            t[k] = tk
+            normals[k] = (normal.x, normal.y, normal.z)
+    return t, normals
+
+def test_packed_intersect_matches_scalar_intersect():
+    objects = scene_objects()
+    packed = PackedScene(objects)
+    origins, directions = random_rays(2000, seed=7)
+    ids = np.arange(len(objects))
+    t = packed.intersect_ids(ids, origins, directions)
+    for idx, obj in enumerate(objects):
+        expected_t, expected_normals = scalar_hits(obj, origins, directions)
+        hit = expected_t < np.inf
+        assert hit.any()
+        np.testing.assert_array_equal(t[idx] < np.inf, hit)
+        np.testing.assert_allclose(t[idx][hit], expected_t[hit], rtol=1e-12, atol=1e-12)
+        rows = np.flatnonzero(hit)
+        points = origins[rows] + directions[rows] * t[idx][rows, None]
+        normals = packed.normals(np.full(len(rows), idx), points, directions[rows])
+        np.testing.assert_allclose(normals, expected_normals[rows], rtol=1e-9, atol=1e-9)
+    # some rays miss every foreground object and only reach the background sphere
+    assert np.isinf(np.delete(t, 3, axis=0)).all(axis=0).any()
+
+def test_parallel_rays_miss_the_plane():
+    plane = Plane(Vector3D(0.0, 1.0, 0.0), 1.0, WHITE)
+    packed = PackedScene([plane])
+    origins, directions = random_rays(400, seed=11)
+    parallel = np.flatnonzero(directions[:, 1] == 0.0)
+    assert len(parallel)
+    t = packed.intersect_ids(np.array([0]), origins[parallel], directions[parallel])[0]
+    assert np.isinf(t).all()
+    assert np.isinf(scalar_hits(plane, origins[parallel], directions[parallel])[0]).all()
+
+def test_rays_from_inside_a_sphere_hit_its_far_side():
+    sphere = Sphere(Vector3D(0.2, -0.1, 0.1), 0.8, WHITE)
+    packed = PackedScene([sphere])
+    origins, directions = random_rays(400, seed=13)
+    inside = np.flatnonzero(np.linalg.norm(origins - (0.2, -0.1, 0.1), axis=1) < 0.8)
+    assert len(inside)
+    t = packed.intersect_ids(np.array([0]), origins[inside], directions[inside])[0]
+    expected_t, _ = scalar_hits(sphere, origins[inside], directions[inside])
+    assert np.isfinite(t).all()
+    np.testing.assert_allclose(t, expected_t, rtol=1e-12, atol=1e-12)
+
+def assert_batch_matches_scalar(obj, origins, directions):
+    hit, t, normals = obj.intersect_batch(origins, directions)
+    expected_t, expected_normals = scalar_hits(obj, origins, directions)
+    np.testing.assert_array_equal(hit, expected_t < np.inf)
+    np.testing.assert_array_equal(np.isinf(t), ~hit)
+    np.testing.assert_allclose(t[hit], expected_t[hit], rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(normals, expected_normals, rtol=1e-9, atol=1e-9)
+    return hit
+
+def test_sphere_intersect_batch_matches_intersect():
+    origins, directions = random_rays(1000, seed=17)
+    outside = Sphere(Vector3D(0.0, 0.0, -3.0), 1.0, WHITE)
+    inside = Sphere(Vector3D(0.2, -0.1, 0.1), 0.8, WHITE)
+    inverted = Sphere(Vector3D(0.1, 0.0, -0.2), -5.0, WHITE)
+    hit = assert_batch_matches_scalar(outside, origins, directions)
+    assert hit.any() and not hit.all()
+    assert_batch_matches_scalar(inside, origins, directions)
+    # every ray starts inside the inverted sphere and hits it, with the normal facing inwards
+    hit = assert_batch_matches_scalar(inverted, origins, directions)
+    assert hit.all()
+
+def test_plane_intersect_batch_matches_intersect():
+    origins, directions = random_rays(1000, seed=19)
+    for plane in (Plane(Vector3D(0.0, 1.0, 0.0), 1.0, WHITE), Plane(Vector3D(1.0, 0.0, 1.0), -8.0, WHITE)):
+        hit = assert_batch_matches_scalar(plane, origins, directions)
+        assert hit.any() and not hit.all()
+
+def test_object_intersect_batch_matches_the_overrides():
+    # the per-ray fallback of Object gives the same result as the array versions
+    origins, directions = random_rays(300, seed=23)
+    for obj in scene_objects():
+        hit, t, normals = Object.intersect_batch(obj, origins, directions)
+        batch_hit, batch_t, batch_normals = obj.intersect_batch(origins, directions)
+        np.testing.assert_array_equal(hit, batch_hit)
+        np.testing.assert_allclose(t[hit], batch_t[hit], rtol=1e-12, atol=1e-12)
+        np.testing.assert_allclose(normals, batch_normals, rtol=1e-9, atol=1e-9)
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from conftest import SCENES
+from Service.Profiler import Profiler
+from Service.TileRenderer import TileRenderer
+
+# the profiler only counts and times, a profiled render must give the same pixels
+
+def render(caster, batch):
+    return TileRenderer(caster, workers=1, tile_size=16, batch=batch).render()
+
+@pytest.mark.parametrize('batch', [True, False], ids=['batch', 'pixel'])
+@pytest.mark.parametrize('name', SCENES)
+def test_profiler_leaves_the_pixels_unchanged(make_caster, name, batch):
+    caster = make_caster(name, 24, 18)
+    plain = render(caster, batch)
+    profiler = Profiler()
+    profiler.attach(caster)
+    caster.reset_ray_counts()
+    np.testing.assert_array_equal(render(caster, batch), plain)
+    assert caster.primary_rays == 24 * 18
+    assert sum(n for counted, n in profiler.counts.items() if counted.endswith(' tests')) > 0
+    assert "=== PROFILE ===" in profiler.summary(caster)
+
+def test_heatmap_spreads_the_tile_times():
+    profiler = Profiler()
+    profiler.add_tile((0, 0, 2, 2), 4.0)
+    profiler.add_tile((2, 0, 3, 2), 1.0)
+    np.testing.assert_array_equal(profiler.heatmap(3, 2), [[1.0, 1.0, 0.5], [1.0, 1.0, 0.5]])
+    colors = profiler.heatmap_colors(3, 2)
+    np.testing.assert_array_equal(colors[0, 0], (1.0, 1.0, 1.0))
+    np.testing.assert_array_equal(colors[0, 2], (0.0, 0.0, 0.0))
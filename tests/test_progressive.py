@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+from conftest import SCENES
+from Service.ProgressiveRenderer import ProgressiveRenderer
+
+# the progressive mode refines only the blocks that differ from a neighbour, with threshold 0
+# it refines all of them, so its last pass must be the full batch render
+
+@pytest.mark.parametrize('name', SCENES)
+def test_threshold_zero_gives_the_full_render(make_caster, name):
+    # 37x29 is not a multiple of the coarse step, the blocks on the edges are cut
+    caster = make_caster(name, 37, 29)
+    renderer = ProgressiveRenderer(caster, threshold=0)
+    previews = []
+    frame = renderer.render(lambda image, step: previews.append(step), interval=0.0)
+    np.testing.assert_array_equal(frame, caster.render_batch())
+    assert renderer.traced == 37 * 29
+    # a preview after every pass, coarse first
+    assert previews[0] == renderer.coarse_step and previews[-1] == 1
+
+def test_threshold_skips_flat_blocks(make_caster):
+    caster = make_caster('scene6.txt', 37, 29)
+    renderer = ProgressiveRenderer(caster, threshold=0.05)
+    renderer.render()
+    assert renderer.traced < 37 * 29
@@ -0,0 +1,115 @@
+import os
+import json
+import threading
+import http.client
+import pytest
+from http.server import ThreadingHTTPServer
+from Service.Parser import SceneError, parse_text
+from Service.RenderService import RenderService, job_settings, MAX_SIZE
+from Handler.HttpHandler import RenderRequestHandler
+
+# the render server answers a broken scene text with 400 (a SceneError from the parser
+# or the scene builder), an unknown path with 404 and a good scene with the PNG
+# every other error is a bug of the renderer, a 500 with the traceback in the log
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+SCENE = os.path.join(os.path.dirname(__file__), '..', 'scene1.txt')
+
+def scene_text():
+    with open(SCENE) as f:
+        return f.read()
+
+@pytest.fixture(scope='module')
+def service():
+    service = RenderService(1)
+    yield service
+    service.close()
+
+class FailingService:
+    # a service whose render has a bug, for the 500 answer
+    def render(self, text, settings):
+        raise RuntimeError("renderer bug")
+
+def start_server(service):
+    handler = type('Handler', (RenderRequestHandler,), {'service': service})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def request(server, method, path, body=None):
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_port, timeout=60)
+    connection.request(method, path, body=body)
+    response = connection.getresponse()
+    data = response.read()
+    connection.close()
+    return response, data
+
+@pytest.fixture(scope='module')
+def server(service):
+    server = start_server(service)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_job_settings_defaults_and_checks():
+    assert job_settings({}) == {'samples': 1, 'sample_pattern': 'stratified', 'filter': 'box', 'specular': False}
+    settings = job_settings({'width': '32', 'samples': '4', 'specular': '1'})
+    assert settings['width'] == 32 and 'height' not in settings
+    assert settings['samples'] == 4 and settings['specular']
+    for query in ({'width': 'wide'}, {'height': str(MAX_SIZE + 1)}, {'samples': '0'},
+                  {'sample_pattern': 'spiral'}, {'filter': 'sharp'}, {'specular': 'yes'}):
+        with pytest.raises(ValueError):
+            job_settings(query)
+
+def test_scene_errors_come_from_the_parser_and_the_builder(service):
+    with pytest.raises(SceneError, match='line 1'):
+        parse_text('e 1\n')
+    with pytest.raises(SceneError, match='no i line'):
+        parse_text('\n'.join(line for line in scene_text().splitlines() if not line.startswith('i')))
+    # a plane with a zero normal passes the parser, the scene builder stops it
+    with pytest.raises(SceneError, match='normal'):
+        service.render(scene_text() + '\no 0 0 0 -2\nc 1 1 1 10\n', job_settings({'width': '8'}))
+
+def test_render_service_renders_and_counts_jobs(service):
+    before = service.status()
+    job = service.render(scene_text(), job_settings({'width': '16'}))
+    assert job['png'].startswith(PNG_SIGNATURE)
+    assert job['width'] == 16 and job['height'] >= 1
+    # the worker keeps the prepared scene for the same text
+    assert service.render(scene_text(), job_settings({'width': '16'}))['scene_cached']
+    with pytest.raises(SceneError):
+        service.render('e 1 2\n', job_settings({}))
+    status = service.status()
+    assert status['completed'] == before['completed'] + 2
+    assert status['failed'] == before['failed'] + 1
+    assert status['pending'] == 0 and status['queue_depth'] == 0
+
+def test_malformed_scene_is_a_bad_request(server):
+    response, data = request(server, 'POST', '/render', b'e 1\n')
+    assert response.status == 400
+    assert 'line 1' in json.loads(data)['error']
+    response, _ = request(server, 'POST', '/render?samples=0', scene_text().encode())
+    assert response.status == 400
+
+def test_unknown_path_is_not_found(server):
+    assert request(server, 'GET', '/nowhere')[0].status == 404
+    assert request(server, 'POST', '/nowhere', b'e 0 0 0\n')[0].status == 404
+
+def test_valid_scene_is_a_png(server):
+    response, data = request(server, 'POST', '/render?width=16', scene_text().encode())
+    assert response.status == 200
+    assert response.getheader('Content-Type') == 'image/png'
+    assert response.getheader('X-Image-Size').startswith('16x')
+    assert data.startswith(PNG_SIGNATURE)
+    response, data = request(server, 'GET', '/status')
+    assert response.status == 200 and json.loads(data)['completed'] >= 1
+
+def test_renderer_bug_is_a_server_error():
+    server = start_server(FailingService())
+    try:
+        response, data = request(server, 'POST', '/render', scene_text().encode())
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert response.status == 500
+    assert json.loads(data)['error'] == "renderer bug"
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from Service.Sampler import Sampler, SAMPLE_PATTERNS, FILTERS
+
+# one sample per pixel goes through the pixel centre with any pattern and filter,
+# so it is the render without anti-aliasing, and more samples stay inside their pixel
+
+@pytest.mark.parametrize('pattern', SAMPLE_PATTERNS)
+@pytest.mark.parametrize('filter', FILTERS)
+def test_one_sample_is_the_plain_render(make_caster, pattern, filter):
+    caster = make_caster('scene2.txt', 23, 17)
+    plain = caster.render_batch()
+    caster.sampler = Sampler(1, pattern, filter)
+    np.testing.assert_array_equal(caster.render_batch(), plain)
+    # and through the pixel centres first, with the adaptive threshold
+    caster.sampler = Sampler(1, pattern, filter, threshold=0.02)
+    np.testing.assert_array_equal(caster.render_batch(), plain)
+
+@pytest.mark.parametrize('pattern', SAMPLE_PATTERNS)
+def test_samples_stay_inside_their_pixel(pattern):
+    sampler = Sampler(9, pattern)
+    xs, ys = np.meshgrid(np.arange(20), np.arange(10))
+    offsets = sampler.offsets(xs.ravel(), ys.ravel())
+    assert offsets.shape == (200, 9, 2)
+    assert ((offsets >= 0.0) & (offsets < 1.0)).all()
+    # the same pixel gets the same samples, another pixel other ones
+    np.testing.assert_array_equal(offsets, sampler.offsets(xs.ravel(), ys.ravel()))
+    assert not np.array_equal(offsets[0], offsets[1])
+    for filter in FILTERS:
+        np.testing.assert_allclose(Sampler(9, pattern, filter).weights(offsets).sum(axis=1), 1.0)
+
+def test_stratified_samples_have_one_per_cell():
+    sampler = Sampler(16)
+    offsets = sampler.offsets(np.arange(50), np.zeros(50, dtype=int))
+    cells = np.floor(offsets[:, :, 0] * 4) + 4 * np.floor(offsets[:, :, 1] * 4)
+    np.testing.assert_array_equal(np.sort(cells, axis=1), np.tile(np.arange(16), (50, 1)))
@@ -0,0 +1,43 @@
+import shutil
+import numpy as np
+from conftest import scene_path, caster_for
+from Service.Parser import parse_file, parse_text
+from Service.SceneCache import SceneCache
+
+# a scene comes out of the cache as long as the file and the parser are unchanged,
+# and it must give the image of the parsed file
+
+def image(data):
+    return caster_for(data, 20, 15).render_batch()
+
+def test_cache_hits_until_the_file_changes(tmp_path):
+    path = tmp_path / 'scene.txt'
+    shutil.copy(scene_path('scene1.txt'), path)
+    cache = SceneCache(str(tmp_path / 'cache'))
+    first = parse_file(str(path), cache)
+    assert (cache.hits, cache.misses) == (0, 1)
+    cached = parse_file(str(path), cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    np.testing.assert_array_equal(image(cached), image(first))
+    # the streaming parser's layout has its own entry
+    parse_file(str(path), cache, stream=True)
+    assert (cache.hits, cache.misses) == (1, 2)
+    # a changed file is a new key, parsed again, and the change shows
+    path.write_text(path.read_text() + '\na 0.9 0.9 0.9 1.0\n')
+    changed = parse_file(str(path), cache)
+    assert (cache.hits, cache.misses) == (1, 3)
+    np.testing.assert_array_equal(image(changed), image(parse_text(path.read_text())))
+    assert not np.array_equal(image(changed), image(first))
+    parse_file(str(path), cache)
+    assert (cache.hits, cache.misses) == (2, 3)
+
+def test_unreadable_cache_entry_is_a_miss(tmp_path):
+    cache = SceneCache(str(tmp_path))
+    key = cache.file_key(scene_path('scene2.txt'))
+    with open(cache.path(key), 'wb') as f:
+        f.write(b'not a pickle')
+    data = parse_file(scene_path('scene2.txt'), cache)
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert parse_file(scene_path('scene2.txt'), cache) is not None
+    assert cache.hits == 1
+    np.testing.assert_array_equal(image(data), image(parse_file(scene_path('scene2.txt'))))
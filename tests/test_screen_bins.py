@@ -0,0 +1,81 @@
+import numpy as np
+from Models.Vector3D import Vector3D
+from Models.Camera import Camera
+from Models.Screen import Screen
+from Models.Scene import Scene
+from Models.Objects.Sphere import Sphere
+from Models.Objects.Plane import Plane
+from Models.Material import Material
+from Models.Lights.AmbientLight import AmbientLight
+from Models.Lights.DirectionalLight import DirectionalLight
+from Service.RayCaster import RayCaster
+
+# the per-pixel path only tests the objects of a camera ray's screen bin (see ScreenBins,
+# RayCaster.get_bins is called once per tile and shade gets the bin of every pixel),
+# so its image must stay the same as without bins, also after the camera moved in place
+# or the screen changed, which must rebuild the bins
+
+def small_scene():
+    scene = Scene()
+    rng = np.random.default_rng(5)
+    for _ in range(12):
+        center = rng.normal(size=3) * (1.5, 1.0, 1.0) + (0.0, 0.0, -4.0)
+        color = Vector3D(*rng.random(3))
+        sphere = Sphere(Vector3D(*center), float(rng.uniform(0.1, 0.6)), color)
+        sphere.material = Material(color)
+        scene.add_object(sphere)
+    gray = Vector3D(0.5, 0.5, 0.5)
+    plane = Plane(Vector3D(0.0, 1.0, 0.0), 1.5, gray)
+    plane.material = Material(gray)
+    scene.add_object(plane)
+    scene.set_ambient_light(AmbientLight(Vector3D(0.2, 0.2, 0.2)))
+    scene.add_light(DirectionalLight(Vector3D(-1.0, -1.0, -1.0), Vector3D(1.0, 1.0, 1.0)))
+    return scene
+
+def make_caster(width=40, height=30):
+    position = Vector3D(0.0, 0.0, 0.0)
+    look_at, up = Vector3D(0.0, 0.0, -1.0), Vector3D(0.0, 1.0, 0.0)
+    camera = Camera(position, look_at, up, 60.0, width / height)
+    screen = Screen(position, look_at, up, 60.0, width / height, width, height)
+    return RayCaster(camera, screen, small_scene())
+
+def image(caster, binned):
+    width, height = caster.screen.width, caster.screen.height
+    colors = np.zeros((height, width, 3))
+    # the bins are looked up once per image, like once per tile in trace_tile_pixels
+    bins = caster.get_bins()
+    for j in range(height):
+        for i in range(width):
+            objects = bins.objects(i, j) if binned else None
+            colors[j, i] = caster.shade(caster.generate_ray(i, j), objects=objects).point()
+    return colors
+
+def assert_same_as_unbinned(caster):
+    np.testing.assert_array_equal(image(caster, True), image(caster, False))
+
+def test_bins_follow_a_camera_moved_in_place():
+    caster = make_caster()
+    assert_same_as_unbinned(caster)
+    caster.camera.position.iadd(Vector3D(1.2, 0.3, -0.5))
+    assert_same_as_unbinned(caster)
+    caster.camera.position.iadd_scaled(Vector3D(-1.0, 0.0, 0.0), 2.0)
+    assert_same_as_unbinned(caster)
+
+def test_bins_follow_a_turned_camera():
+    caster = make_caster()
+    caster.basis = caster.camera.view_basis()
+    assert_same_as_unbinned(caster)
+    # turn the camera by changing the basis rows in place
+    angle = 0.4
+    turn = np.array([[np.cos(angle), 0.0, -np.sin(angle)], [0.0, 1.0, 0.0], [np.sin(angle), 0.0, np.cos(angle)]])
+    caster.basis[:] = caster.basis @ turn
+    assert_same_as_unbinned(caster)
+
+def test_bins_follow_a_resized_screen():
+    caster = make_caster()
+    assert_same_as_unbinned(caster)
+    caster.screen.width, caster.screen.height = 64, 20
+    assert_same_as_unbinned(caster)
+    caster.aspect = 1.0
+    caster.scale = 0.5
+    assert_same_as_unbinned(caster)
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+from Models.Vector3D import Vector3D
+from Models.Objects.Ray import Ray
+from Models.Objects.Sphere import Sphere
+from Models.Objects.Plane import Plane
+from Models.Scene import Scene
+from Models.Camera import Camera
+from Models.Screen import Screen
+from Models.Material import Material
+from Service.RayCaster import RayCaster, BIAS
+
+# a shadow ray only asks whether something blocks it before the light, occludes answers
+# that without the hit point and normal of intersect, so both must agree on every ray
+# the occluder of the last blocked ray of a light is tested first (the hint), that changes
+# only the order of the tests and never whether a ray is in shadow
+
+WHITE = Vector3D(1.0, 1.0, 1.0)
+
+def random_rays(count, seed):
+    rng = np.random.default_rng(seed)
+    origins = rng.uniform(-2.0, 2.0, (count, 3))
+    directions = rng.normal(size=(count, 3))
+    directions[: count // 8, 1] = 0.0
+    units = [Vector3D(*d).normalize() for d in directions]
+    return origins, np.array([(u.x, u.y, u.z) for u in units])
+
+@pytest.mark.parametrize('obj', [
+    Sphere(Vector3D(0.0, 0.0, -3.0), 1.0, WHITE),
+    Sphere(Vector3D(0.3, -0.2, 0.1), 1.5, WHITE),      # holds most of the ray origins
+    Sphere(Vector3D(0.0, 0.0, 0.0), -20.0, WHITE),     # inverted
+    Plane(Vector3D(0.0, 1.0, 0.0), 1.0, WHITE),
+    Plane(Vector3D(1.0, 0.0, 1.0), -3.0, WHITE),
+], ids=['outside', 'inside', 'inverted', 'plane', 'tilted plane'])
+def test_occludes_agrees_with_intersect(obj):
+    origins, directions = random_rays(1500, seed=3)
+    rng = np.random.default_rng(4)
+    answers = []
+    for origin, direction in zip(origins, directions):
+        ray = Ray(Vector3D(*origin), Vector3D(*direction))
+        hit, t, _, _ = obj.intersect(ray)
+        for t_max in rng.uniform(0.0, 25.0, 3):
+            expected = hit and BIAS < t < t_max
+            assert obj.occludes(ray, BIAS, t_max) == expected
+            answers.append(expected)
+    assert any(answers) and not all(answers)
+
+def shadow_caster(count, seed):
+    # a field of spheres over a floor, enough spheres for a BVH
+    rng = np.random.default_rng(seed)
+    scene = Scene()
+    for center, radius in zip(rng.uniform(-4.0, 4.0, (count, 3)), rng.uniform(0.2, 0.9, count)):
+        sphere = Sphere(Vector3D(*center), float(radius), WHITE)
+        sphere.material = Material(WHITE)
+        scene.add_object(sphere)
+    floor = Plane(Vector3D(0.0, 1.0, 0.0), 5.0, WHITE)
+    floor.material = Material(WHITE)
+    scene.add_object(floor)
+    position, look_at, up = Vector3D(0.0, 0.0, 8.0), Vector3D(0.0, 0.0, -1.0), Vector3D(0.0, 1.0, 0.0)
+    camera = Camera(position, look_at, up, 60.0, 1.0)
+    screen = Screen(position, look_at, up, 60.0, 1.0, 8, 8)
+    return RayCaster(camera, screen, scene)
+
+@pytest.mark.parametrize('count', [6, 40])
+def test_occluder_hint_gives_the_cold_cache_result(count):
+    caster = shadow_caster(count, seed=count)
+    scene = caster.scene
+    assert (scene.get_bvh() is not None) == (count >= 16)
+    # shadow rays from points on the floor to a light above the spheres
+    rng = np.random.default_rng(9)
+    points = np.column_stack([rng.uniform(-5.0, 5.0, 400), np.full(400, -5.0 + BIAS), rng.uniform(-5.0, 5.0, 400)])
+    to_light = np.array([1.0, 10.0, 2.0]) - points
+    distance = np.linalg.norm(to_light, axis=1)
+    units = [Vector3D(*d).normalize() for d in to_light]
+    directions = np.array([(u.x, u.y, u.z) for u in units])
+    caster.reset_shadow_cache()
+    cold = caster.in_shadow_batch(points, directions, distance, light_index=0)
+    assert cold.any() and not cold.all()
+    rays = [Ray(Vector3D(*p), u) for p, u in zip(points, units)]
+    cold_scalar = [scene.find_occluder(ray, BIAS, d - BIAS * 2) >= 0 for ray, d in zip(rays, distance)]
+    np.testing.assert_array_equal(cold, cold_scalar)
+    # every object as the hint, a blocker or not, and on both paths
+    for hint in range(len(scene.objects)):
+        caster.shadow_cache = {0: hint}
+        np.testing.assert_array_equal(caster.in_shadow_batch(points, directions, distance, light_index=0), cold)
+        hinted = [scene.find_occluder(ray, BIAS, d - BIAS * 2, hint) >= 0 for ray, d in zip(rays, distance)]
+        np.testing.assert_array_equal(hinted, cold)
+    # the scalar cache carried from ray to ray, the way a tile is shaded
+    caster.reset_shadow_cache()
+    carried = [caster.in_shadow(Vector3D(*p), u, d, light_index=0) for p, u, d in zip(points, units, distance)]
+    np.testing.assert_array_equal(carried, cold)
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from Models.SpecularTable import SpecularTable, MAX_TABLES, SPECULAR_CUTOFF
+
+# the table stands in for x ** shininess above the cutoff, the scalar and the batch lookup
+# must both stay within 2e-6 of ** for any shininess, with a row or without one
+
+SHININESS = [0.3, 0.5, 1.0, 1.5, 2.0, 5.0, 10.0, 20.0, 32.0, 50.0, 100.0, 1000.0, 5000.0]
+
+def above_cutoff(table, row, shininess, count):
+    cutoff = table.row_cutoff(row, shininess)
+    rng = np.random.default_rng(int(shininess * 10))
+    return np.concatenate(([cutoff, 1.0], np.linspace(cutoff, 1.0, count), rng.uniform(cutoff, 1.0, count)))
+
+@pytest.mark.parametrize('shininess', SHININESS)
+def test_power_is_within_2e6_of_pow(shininess):
+    table = SpecularTable(SHININESS)
+    row = table.row(shininess)
+    assert (row >= 0) == (shininess >= 1.0)
+    x = above_cutoff(table, row, shininess, 20000)
+    assert x.min() ** shininess >= SPECULAR_CUTOFF * (1 - 1e-12)
+    exact = x ** shininess
+    scalar = np.array([table.power(row, shininess, v) for v in x.tolist()])
+    assert np.abs(scalar - exact).max() <= 2e-6
+    if row >= 0:
+        batch = table.power_batch(np.full(len(x), row), x)
+        assert np.abs(batch - exact).max() <= 2e-6
+        np.testing.assert_allclose(batch, scalar, rtol=0, atol=1e-12)
+
+def test_shininess_past_the_last_row_uses_pow():
+    values = np.arange(1.0, MAX_TABLES + 11.0)
+    table = SpecularTable(values)
+    assert len(table.shininess) == MAX_TABLES
+    assert table.row(values[MAX_TABLES - 1]) == MAX_TABLES - 1
+    assert table.row(values[MAX_TABLES]) == -1
+    assert table.power(-1, 300.0, 0.99) == 0.99 ** 300.0
+    # a table of one shininess takes the shortcut of power_batch
+    single = SpecularTable([40.0])
+    x = above_cutoff(single, 0, 40.0, 5000)
+    assert np.abs(single.power_batch(np.zeros(len(x), dtype=np.int64), x) - x ** 40.0).max() <= 2e-6
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+from conftest import SCENES, scene_path, caster_for
+from Service.Parser import parse_text, parse_stream
+
+# the streaming parser converts the o and c lines chunk by chunk with numpy, the scene
+# data and the image it gives must be the ones of parse_text
+
+def image(data):
+    return caster_for(data, 20, 15).render_batch()
+
+@pytest.mark.parametrize('name', SCENES)
+def test_stream_parser_matches_the_text_parser(name):
+    with open(scene_path(name)) as f:
+        text_data = parse_text(f.read())
+    # small chunks so the lines are split across many chunk boundaries
+    stream_data = parse_stream(scene_path(name), chunk_bytes=64)
+    assert stream_data['objects'].shape == (len(text_data['objects']), 4)
+    np.testing.assert_array_equal(stream_data['objects'], np.array(text_data['objects']).reshape(-1, 4))
+    np.testing.assert_array_equal(stream_data['colors'], np.array(text_data['colors']).reshape(-1, 4))
+    assert stream_data['resolution'] == text_data['resolution']
+    np.testing.assert_array_equal(image(stream_data), image(text_data))
@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+from Service.TileRenderer import TileRenderer, split_tiles
+
+# every pixel is rendered by the same code whatever tile it falls in and whatever worker
+# renders the tile, so the frame must not depend on the workers or the tile size
+
+def test_split_tiles_covers_the_screen_once():
+    covered = np.zeros((23, 37), dtype=int)
+    for x0, y0, x1, y1 in split_tiles(37, 23, 10):
+        covered[y0:y1, x0:x1] += 1
+    assert (covered == 1).all()
+    with pytest.raises(ValueError):
+        split_tiles(37, 23, 0)
+
+@pytest.mark.parametrize('batch', [True, False])
+def test_frame_does_not_depend_on_workers_or_tiles(make_caster, batch):
+    # scene3 has spheres and planes, the pixel path bins them per tile
+    caster = make_caster('scene3.txt', 27, 19)
+    expected = TileRenderer(caster, workers=1, tile_size=64, batch=batch).render()
+    for workers, tile_size in ((1, 7), (2, 5), (2, 13)):
+        frame = TileRenderer(caster, workers=workers, tile_size=tile_size, batch=batch).render()
+        assert np.array_equal(frame, expected), (workers, tile_size)
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from conftest import SCENES, scene_path, caster_for
+from Service.Parser import parse_text
+
+# at max_depth 0 no reflected or refracted ray is traced, every surface is shaded as if it
+# were matte, so the wavefront must give exactly the render of a scene without the m lines
+
+MATERIALS = 'm 0.5\nm 0.2 0.6 1.5\nm 0.0 0.9 1.3\n'
+
+def caster_of(name, materials, max_depth, specular):
+    with open(scene_path(name)) as f:
+        text = f.read()
+    caster = caster_for(parse_text(text + '\n' + materials), 33, 25)
+    caster.max_depth = max_depth
+    caster.specular = specular
+    return caster
+
+@pytest.mark.parametrize('specular', [False, True])
+@pytest.mark.parametrize('name', SCENES)
+def test_max_depth_zero_is_the_matte_render(name, specular):
+    caster = caster_of(name, MATERIALS, 0, specular)
+    assert caster.scene.get_packed().secondary
+    matte = caster_of(name, '', 0, specular)
+    assert not matte.scene.get_packed().secondary
+    frame = caster.render_batch()
+    np.testing.assert_array_equal(frame, matte.render_batch())
+    # the wavefront itself against the one pass of shade_gbuffer on the same rays
+    origins, directions = caster.generate_rays(0, 0, 33, 25)
+    caster.reset_shadow_cache()
+    expected = caster.shade_gbuffer(*caster.gbuffer_batch(origins, directions))
+    caster.reset_shadow_cache()
+    np.testing.assert_array_equal(caster.shade_wavefront(origins, directions), expected)
+    # and a bounce does change the frame
+    assert not np.array_equal(caster_of(name, MATERIALS, 2, specular).render_batch(), frame)